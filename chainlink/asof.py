@@ -0,0 +1,154 @@
+"""As-of join: align a sparse, sorted change-point series onto a dense grid.
+
+Every series in this directory is either a change-point series (Chainlink
+rounds keyed by `updated_at` / `block_number`, pool samples) or a dense grid
+(1-min candles, every pool block). Reading "the value as of grid point g" is an
+as-of join: the last key <= g. This module is the one implementation of that,
+so the plot scripts align the same way and none of them materializes more than
+it has to.
+
+Modes
+-----
+  step    forward fill: value of the last key <= g (the on-chain semantics of a
+          Chainlink answer or any storage slot between two writes).
+  linear  linear interpolation between the bracketing keys; past the last key
+          the last value is held (same as np.interp).
+
+Options shared by both modes:
+  max_staleness  grid points whose last key is older than this (in key units:
+                 seconds or blocks) get `fill` instead of a stale value.
+  leading        what grid points before the first key get: "fill" (default)
+                 or "clamp" to the first value.
+
+Streaming
+---------
+Keys/values (thousands to ~1M change points) are held in memory; the grid is
+processed in CHUNK-sized pieces, each resolved with one searchsorted against
+only the key window it spans, and written straight into `out` (which may be a
+np.memmap). So a tens-of-millions-point grid never needs a full index array,
+mask or copy, and `asof_range` does not even materialize the grid itself.
+"""
+from __future__ import annotations
+
+from typing import Iterator
+
+import numpy as np
+
+# Grid points per chunk (8 MB of int64 index per pass).
+CHUNK = 1 << 20
+
+
+def _prep(keys, values) -> tuple[np.ndarray, np.ndarray]:
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+    if keys.ndim != 1 or keys.shape[0] != values.shape[0]:
+        raise ValueError("keys must be 1-D and match values along axis 0")
+    if keys.size and np.any(keys[1:] < keys[:-1]):
+        raise ValueError("keys must be sorted ascending")
+    return keys, values
+
+
+def _join_chunk(keys, values, g, mode, max_staleness, fill, leading, out):
+    """Resolve one sorted grid chunk `g` (same dtype as keys) into `out`."""
+    # Narrow the search to the keys this chunk can see.
+    k0 = max(int(np.searchsorted(keys, g[0], "right")) - 1, 0)
+    k1 = int(np.searchsorted(keys, g[-1], "right"))
+    idx = np.searchsorted(keys[k0:k1], g, "right") - 1
+    idx += k0
+    # idx < 0 only when g precedes the first key (k0 == 0 in that case).
+    lead = idx < 0
+    np.clip(idx, 0, None, out=idx)
+    out[...] = values[idx]
+
+    if mode == "linear" and keys.size > 1:
+        nxt = np.minimum(idx + 1, keys.size - 1)
+        inner = (nxt > idx) & ~lead
+        if inner.any():
+            i, j = idx[inner], nxt[inner]
+            x0 = keys[i].astype(np.float64)
+            w = (g[inner] - x0) / (keys[j] - x0)
+            v0 = values[i]
+            out[inner] = v0 + (values[j] - v0) * w
+
+    if max_staleness is not None:
+        # age of the last observation, in both modes
+        stale = (g - keys[idx]) > max_staleness
+        stale &= ~lead
+        out[stale] = fill
+    if leading == "fill":
+        out[lead] = fill
+    return int(lead.sum())
+
+
+def _check_opts(mode, leading):
+    if mode not in ("step", "linear"):
+        raise ValueError(f"unknown mode {mode!r}")
+    if leading not in ("fill", "clamp"):
+        raise ValueError(f"unknown leading {leading!r}")
+
+
+def asof_join(keys, values, grid, *, mode: str = "step",
+              max_staleness: float | None = None, fill: float = np.nan,
+              leading: str = "fill", out: np.ndarray | None = None,
+              chunk: int = CHUNK) -> tuple[np.ndarray, int]:
+    """Values of the (keys, values) change-point series at each grid point.
+
+    `keys` and `grid` must be sorted ascending (int64 timestamps/blocks are the
+    intended case; floats work too). Returns (out, n_leading) where n_leading
+    is the number of grid points before the first key (filled or clamped per
+    `leading`). `out` defaults to a new float64 array."""
+    _check_opts(mode, leading)
+    keys, values = _prep(keys, values)
+    grid = np.asarray(grid)
+    # one common dtype, so searchsorted never re-casts `keys` per chunk
+    common = np.result_type(keys.dtype, grid.dtype)
+    keys = keys.astype(common, copy=False)
+    if out is None:
+        out = np.empty(grid.shape[0], dtype=np.result_type(values.dtype, np.float64))
+    if not keys.size:
+        out[...] = fill
+        return out, grid.shape[0]
+    n_lead = 0
+    for s in range(0, grid.shape[0], chunk):
+        e = min(s + chunk, grid.shape[0])
+        n_lead += _join_chunk(keys, values, grid[s:e].astype(common, copy=False),
+                              mode, max_staleness, fill, leading, out[s:e])
+    return out, n_lead
+
+
+def iter_asof(keys, values, start: int, stop: int, step: int = 1, *,
+              mode: str = "step", max_staleness: float | None = None,
+              fill: float = np.nan, leading: str = "fill",
+              chunk: int = CHUNK) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Stream the as-of join over the implicit int64 grid
+    range(start, stop, step), yielding (grid_chunk, values_chunk) pairs;
+    nothing grid-sized is ever allocated. Use this to reduce or write out per
+    chunk."""
+    _check_opts(mode, leading)
+    keys, values = _prep(keys, values)
+    common = np.result_type(keys.dtype, np.int64)
+    keys = keys.astype(common, copy=False)
+    dtype = np.result_type(values.dtype, np.float64)
+    span = chunk * step
+    for s in range(start, stop, span):
+        g = np.arange(s, min(s + span, stop), step, dtype=common)
+        v = np.empty(g.size, dtype=dtype)
+        if keys.size:
+            _join_chunk(keys, values, g, mode, max_staleness, fill, leading, v)
+        else:
+            v[...] = fill
+        yield g, v
+
+
+def asof_range(keys, values, start: int, stop: int, step: int = 1, *,
+               out: np.ndarray | None = None, **kw) -> np.ndarray:
+    """`iter_asof` collected into `out` (e.g. a np.memmap for every-block
+    grids that should not live in RAM)."""
+    n = len(range(start, stop, step))
+    if out is None:
+        out = np.empty(n, dtype=np.float64)
+    i = 0
+    for _g, v in iter_asof(keys, values, start, stop, step, **kw):
+        out[i:i + v.size] = v
+        i += v.size
+    return out
@@ -0,0 +1,92 @@
+"""Fused precision-band model: raw Chainlink rounds + raw pool samples -> model.
+
+The band model (plot_pool_model.py, plot_model_vs_price.py) is, per grid
+point, with reference price r (pool price_oracle or a Binance EMA), Chainlink
+answer c as of that time and band f:
+
+    c > (1+f)*r  ->  c / (1+f)      ("above")
+    c < (1-f)*r  ->  c / (1-f)      ("below")
+    otherwise    ->  r
+
+Done step by step that is a grid-sized forward-filled Chainlink array, two
+grid-sized masks, an np.select and two more passes for the branch shares.
+`band_model` instead walks the grid in CHUNK-sized pieces: per piece one as-of
+join of the raw rounds (asof.py), the clamp, and the running statistics, all
+on chunk-sized temporaries. The model and the forward-filled Chainlink series
+are written into caller-provided (or new) arrays only when asked for, so
+statistics over an every-block grid need no grid-sized memory beyond the
+inputs, which may be memmaps (colstore.py / poolstore.py).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from asof import CHUNK, asof_join
+
+
+@dataclass
+class BandStats:
+    n: int = 0             # grid points
+    n_lead: int = 0        # grid points before the first round (clamped)
+    above: int = 0         # points on the c / (1+f) branch
+    below: int = 0         # points on the c / (1-f) branch
+    sum_dev: float = 0.0   # sum of |c/r - 1|
+    max_dev: float = 0.0   # max |c/r - 1|
+    max_model_dev: float = 0.0  # max |model/r - 1|
+
+    @property
+    def inside(self) -> int:
+        return self.n - self.above - self.below
+
+    @property
+    def mean_dev(self) -> float:
+        return self.sum_dev / self.n if self.n else float("nan")
+
+    def summary(self, fee: float) -> str:
+        pct = 100.0 / max(self.n, 1)
+        return (f"model branches (fee={fee*100:g}%): above={self.above*pct:.2f}%  "
+                f"below={self.below*pct:.2f}%  in-band={self.inside*pct:.2f}%\n"
+                f"|chainlink/ref - 1|: mean={self.mean_dev*1e4:.1f}bps  "
+                f"max={self.max_dev*1e4:.1f}bps   "
+                f"max |model/ref - 1|={self.max_model_dev*1e4:.1f}bps")
+
+
+def band_model(ts, ref, round_ts, round_px, fee: float, *,
+               series: bool = True, model_out: np.ndarray | None = None,
+               cl_out: np.ndarray | None = None, chunk: int = CHUNK):
+    """Evaluate the band model on the grid (ts, ref) from raw Chainlink rounds
+    (round_ts sorted, round_px). Grid points before the first round use the
+    first price. Returns (model, chainlink_on_grid, BandStats); the two arrays
+    are None when series=False."""
+    n = ts.shape[0]
+    if series:
+        model_out = np.empty(n) if model_out is None else model_out
+        cl_out = np.empty(n) if cl_out is None else cl_out
+    up_k, dn_k = 1.0 + fee, 1.0 - fee
+    st = BandStats(n=n)
+    cl = np.empty(min(chunk, n))
+    for s in range(0, n, chunk):
+        e = min(s + chunk, n)
+        c = cl[:e - s]
+        _, lead = asof_join(round_ts, round_px, ts[s:e], leading="clamp", out=c)
+        r = np.asarray(ref[s:e], dtype=np.float64)
+        up = c > up_k * r
+        dn = c < dn_k * r
+        m = model_out[s:e] if series else np.empty(e - s)
+        m[...] = r
+        m[up] = c[up] / up_k
+        m[dn] = c[dn] / dn_k
+        if series:
+            cl_out[s:e] = c
+        dev = np.abs(c / r - 1.0)
+        st.n_lead += lead
+        st.above += int(up.sum())
+        st.below += int(dn.sum())
+        st.sum_dev += float(dev.sum())
+        st.max_dev = max(st.max_dev, float(dev.max()))
+        st.max_model_dev = max(st.max_model_dev, float(np.abs(m / r - 1.0).max()))
+    if not series:
+        return None, None, st
+    return model_out, cl_out, st
@@ -0,0 +1,210 @@
+"""Native OHLCV candle file: streaming ingest, memory map, range query, append.
+
+The candle inputs (btcusdt-2024-F2026.json.xz, ~1.08M rows) are one xz JSON
+array of Binance kline rows [open_time_ms, open, high, low, close, volume, ...]
+(numbers or numeric strings). json.load turns that into ~6.5M Python objects
+before numpy ever sees it. Here the xz stream is read in CHUNK-sized pieces and
+each piece's complete rows are rewritten as CSV lines and parsed by one
+C-level np.loadtxt call, so memory stays at a few chunks and no per-row Python
+object is created.
+
+The converted file (.ohlcv) is
+
+    header   16 bytes: MAGIC (8) + uint64 row width in bytes (48)
+    rows     n x RECORD, little-endian, sorted by ts, no gaps in the file:
+             ts (float64 unix seconds), o, h, l, c, v (float64)
+
+so n = (size - 16) / 48, any row is at a fixed offset, `open_ohlcv` is a
+zero-copy np.memmap (columns are strided views), a time window is two
+searchsorted calls on the memory-mapped ts column (`window`), and newer candles
+are appended in place (`append`, rows <= the last stored ts are skipped).
+
+CLI
+---
+    uv run python candles.py btcusdt-2024-F2026.json.xz              # -> .ohlcv
+    uv run python candles.py newer.json.xz --out btcusdt.ohlcv --append
+    uv run python candles.py btcusdt.ohlcv --info
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import lzma
+import os
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+MAGIC = b"OHLCV\x00\x01\x00"
+HEADER = 16
+RECORD = np.dtype([("ts", "<f8"), ("o", "<f8"), ("h", "<f8"), ("l", "<f8"),
+                   ("c", "<f8"), ("v", "<f8")])
+# decompressed bytes per parse step
+CHUNK = 8 << 20
+
+
+def _parse_rows(text: bytes) -> np.ndarray:
+    """A run of complete JSON rows ("[[..],[..]" / ",[..],[..]") -> (n, 6)
+    float64, first 6 fields of each row."""
+    text = text.translate(None, b' \t\r\n"').strip(b",[]")
+    if not text:
+        return np.empty((0, 6))
+    lines = io.BytesIO(text.replace(b"],[", b"\n"))
+    return np.loadtxt(lines, delimiter=",", usecols=range(6), dtype=np.float64,
+                      ndmin=2)
+
+
+def iter_json_rows(path: Path, chunk: int = CHUNK) -> Iterator[np.ndarray]:
+    """Stream a (xz) JSON array of kline rows as (n, 6) float64 blocks with ts
+    converted to unix seconds. Only complete rows are parsed per block; the
+    remainder is carried into the next read."""
+    opener = lzma.open if path.suffix == ".xz" else open
+    carry = b""
+    with opener(path, "rb") as fh:
+        while True:
+            data = fh.read(chunk)
+            buf = carry + data
+            # a row ends at "]" followed by "," or the closing "]"
+            cut = buf.rfind(b"]", 0, len(buf) - 1) if data else len(buf)
+            if cut <= 0:
+                if not data:
+                    break
+                carry = buf
+                continue
+            head, carry = buf[:cut + 1], buf[cut + 1:]
+            block = _parse_rows(head)
+            if block.size:
+                block[:, 0] /= 1000.0
+                yield block
+            if not data:
+                break
+
+
+def _write_header(fh) -> None:
+    fh.write(MAGIC + np.uint64(RECORD.itemsize).tobytes())
+
+
+def open_ohlcv(path: Path) -> np.ndarray:
+    """Read-only structured memmap of a .ohlcv file (fields ts, o, h, l, c, v)."""
+    with open(path, "rb") as fh:
+        head = fh.read(HEADER)
+    if head[:8] != MAGIC or int(np.frombuffer(head[8:], "<u8")[0]) != RECORD.itemsize:
+        raise ValueError(f"{path} is not an .ohlcv file")
+    n = (os.path.getsize(path) - HEADER) // RECORD.itemsize
+    if n == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", offset=HEADER, shape=(n,))
+
+
+def append(path: Path, blocks) -> int:
+    """Append (n, 6) blocks newer than the file's last ts (creating the file
+    if needed); returns rows written. Rows must arrive in time order."""
+    last = -np.inf
+    if path.exists():
+        rec = open_ohlcv(path)
+        if rec.size:
+            last = float(rec["ts"][-1])
+        del rec
+    n = 0
+    with open(path, "ab") as fh:
+        if fh.tell() == 0:
+            _write_header(fh)
+        for block in blocks:
+            block = block[block[:, 0] > last]
+            if not block.size:
+                continue
+            if np.any(np.diff(block[:, 0]) <= 0):
+                raise ValueError("candle rows are not strictly increasing in ts")
+            fh.write(np.ascontiguousarray(block, dtype="<f8").tobytes())
+            last = float(block[-1, 0])
+            n += block.shape[0]
+    return n
+
+
+def convert(src: Path, dst: Path) -> int:
+    """(xz) JSON candles -> new .ohlcv file, written atomically."""
+    tmp = dst.with_name(dst.name + f".tmp{os.getpid()}")
+    tmp.unlink(missing_ok=True)
+    n = append(tmp, iter_json_rows(src))
+    tmp.replace(dst)
+    return n
+
+
+def window(rec: np.ndarray, t0: float | None = None,
+           t1: float | None = None) -> np.ndarray:
+    """Rows with t0 <= ts < t1 (a view, no copy)."""
+    ts = rec["ts"]
+    i0 = 0 if t0 is None else int(np.searchsorted(ts, t0, "left"))
+    i1 = rec.size if t1 is None else int(np.searchsorted(ts, t1, "left"))
+    return rec[i0:i1]
+
+
+def load(path: Path, t0: float | None = None,
+         t1: float | None = None) -> np.ndarray:
+    """Candles in [t0, t1) from a .ohlcv file (memmap view) or a JSON file
+    (streamed, only the window kept)."""
+    if path.suffix == ".ohlcv":
+        return window(open_ohlcv(path), t0, t1)
+    keep = []
+    for block in iter_json_rows(path):
+        ts = block[:, 0]
+        m = np.ones(ts.size, dtype=bool)
+        if t0 is not None:
+            m &= ts >= t0
+        if t1 is not None:
+            m &= ts < t1
+        keep.append(block[m])
+    arr = np.concatenate(keep) if keep else np.empty((0, 6))
+    return np.ascontiguousarray(arr).view(RECORD)[:, 0]
+
+
+def time_range(path: Path) -> tuple[int, int]:
+    """First and last candle open time (unix seconds)."""
+    if path.suffix == ".ohlcv":
+        rec = open_ohlcv(path)
+        return int(rec["ts"][0]), int(rec["ts"][-1])
+    first = last = None
+    for block in iter_json_rows(path):
+        if first is None:
+            first = block[0, 0]
+        last = block[-1, 0]
+    if first is None:
+        raise ValueError(f"{path} has no candles")
+    return int(first), int(last)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("src", type=Path, help="(xz) JSON candles, or .ohlcv with --info")
+    ap.add_argument("--out", type=Path, default=None,
+                    help="default: <src without .json[.xz]>.ohlcv")
+    ap.add_argument("--append", action="store_true",
+                    help="append rows newer than --out's last candle")
+    ap.add_argument("--info", action="store_true",
+                    help="print row count and time range of an .ohlcv file")
+    args = ap.parse_args()
+
+    if args.info:
+        rec = open_ohlcv(args.src)
+        t0, t1 = time_range(args.src)
+        print(f"{args.src}: {rec.size:,} candles  "
+              f"{np.datetime64(t0, 's')} .. {np.datetime64(t1, 's')}")
+        return 0
+
+    out = args.out
+    if out is None:
+        stem = args.src.name.removesuffix(".xz").removesuffix(".json")
+        out = args.src.with_name(stem + ".ohlcv")
+    if args.append:
+        n = append(out, iter_json_rows(args.src))
+        print(f"appended {n:,} candles -> {out}")
+    else:
+        n = convert(args.src, out)
+        print(f"wrote {n:,} candles -> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
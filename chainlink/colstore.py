@@ -0,0 +1,140 @@
+"""Shared, memory-mapped column cache for the chainlink plot inputs.
+
+The inputs are compressed text (candles: xz JSON array of
+[ts_ms, o, h, l, c, v] rows; oracle rounds and pool samples: (xz) CSV, or a
+poolstore.py directory for pool samples). Parsing them is the slow part of
+every plot start, so each source file is converted ONCE into a directory of
+plain, uncompressed `.npy` columns under cache/:
+
+    cache/candles_<name>_<size>_<mtime_ns>/{ts,o,h,l,c,v}.npy
+    cache/oracle_<name>_<size>_<mtime_ns>/{ts,price,block}.npy
+    cache/pool_<name>_<size>_<mtime_ns>/{ts,po,ps,block}.npy
+
+and afterwards opened with np.load(mmap_mode="r"): no parsing, no copy, pages
+are faulted in by the OS only when a plot actually touches them. `ts` is always
+float64 unix seconds (what the plotters and date2num want). Arrays returned are
+read-only memmaps; derive new arrays from them rather than writing in place.
+
+A changed source (size or mtime) gets a new directory; a conversion is written
+to a temp directory and renamed into place, so a crash never leaves a partial
+cache behind.
+
+Candles already converted to the native .ohlcv format (candles.py) skip the
+cache entirely: that file is itself fixed-width and memory-mappable.
+"""
+from __future__ import annotations
+
+import csv
+import lzma
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+import candles
+from poolstore import PoolStore, is_store
+
+HERE = Path(__file__).resolve().parent
+CACHE = HERE / "cache"
+
+CANDLE_COLUMNS = ("ts", "o", "h", "l", "c", "v")
+ORACLE_COLUMNS = ("ts", "price", "block")
+POOL_COLUMNS = ("ts", "po", "ps", "block")
+
+
+def _open_text(path: Path):
+    return lzma.open(path, "rt") if path.suffix == ".xz" else open(path)
+
+
+def cache_dir(path: Path, kind: str) -> Path:
+    # a poolstore directory grows by appends to its column files
+    st = (path / "block.u32").stat() if path.is_dir() else path.stat()
+    return CACHE / f"{kind}_{path.name}_{st.st_size}_{st.st_mtime_ns}"
+
+
+def open_columns(d: Path, names) -> dict[str, np.ndarray] | None:
+    """Memory-map every column of a converted directory, or None if absent."""
+    if not all((d / f"{n}.npy").exists() for n in names):
+        return None
+    return {n: np.load(d / f"{n}.npy", mmap_mode="r") for n in names}
+
+
+def write_columns(d: Path, cols: dict[str, np.ndarray]) -> None:
+    """Write columns as .npy into `d` atomically (temp dir + rename)."""
+    CACHE.mkdir(exist_ok=True)
+    tmp = d.with_name(d.name + f".tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    for n, a in cols.items():
+        np.save(tmp / f"{n}.npy", np.ascontiguousarray(a))
+    try:
+        tmp.rename(d)
+    except OSError:  # another process converted it first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _cached(path: Path, kind: str, names, convert) -> dict[str, np.ndarray]:
+    d = cache_dir(path, kind)
+    cols = open_columns(d, names)
+    if cols is None:
+        write_columns(d, convert(path))
+        cols = open_columns(d, names)
+    return cols
+
+
+def _read_csv_columns(path: Path, wanted: dict[str, str]) -> dict[str, np.ndarray]:
+    """Numeric CSV columns by header name -> float64 arrays, one C-level
+    np.loadtxt pass (non-numeric columns such as datetime_utc are skipped)."""
+    with _open_text(path) as fh:
+        header = next(csv.reader([fh.readline()]))
+        idx = [header.index(src) for src in wanted.values()]
+        arr = np.loadtxt(fh, delimiter=",", usecols=idx, dtype=np.float64,
+                         ndmin=2)
+    return {dst: arr[:, i] for i, dst in enumerate(wanted)}
+
+
+def _convert_candles(path: Path) -> dict[str, np.ndarray]:
+    # streamed (candles.py), never a json.load of the whole array
+    arr = np.concatenate(list(candles.iter_json_rows(path)))  # ts already in s
+    return {n: arr[:, i] for i, n in enumerate(CANDLE_COLUMNS)}
+
+
+def _convert_oracle(path: Path) -> dict[str, np.ndarray]:
+    c = _read_csv_columns(path, {"ts": "updated_at", "price": "price",
+                                 "block": "block_number"})
+    order = np.argsort(c["ts"], kind="stable")
+    return {"ts": c["ts"][order], "price": c["price"][order],
+            "block": c["block"][order].astype(np.int64)}
+
+
+def _convert_pool(path: Path) -> dict[str, np.ndarray]:
+    if is_store(path):
+        store = PoolStore(path)
+        return {"ts": store.column("ts").astype(np.float64),
+                "po": store.column("po"), "ps": store.column("ps"),
+                "block": store.column("block").astype(np.int64)}
+    c = _read_csv_columns(path, {"ts": "timestamp", "po": "price_oracle",
+                                 "ps": "price_scale", "block": "block_number"})
+    c["block"] = c["block"].astype(np.int64)
+    return c
+
+
+def candle_columns(path: Path) -> dict[str, np.ndarray]:
+    """{ts, o, h, l, c, v} memmaps for a candle .json.xz or .ohlcv file (the
+    latter is mapped directly: strided views into its records, no cache)."""
+    if path.suffix == ".ohlcv":
+        rec = candles.open_ohlcv(path)
+        return {n: rec[n] for n in CANDLE_COLUMNS}
+    return _cached(path, "candles", CANDLE_COLUMNS, _convert_candles)
+
+
+def oracle_columns(path: Path) -> dict[str, np.ndarray]:
+    """{ts, price, block} memmaps for a Chainlink rounds CSV, sorted by time."""
+    return _cached(path, "oracle", ORACLE_COLUMNS, _convert_oracle)
+
+
+def pool_columns(path: Path) -> dict[str, np.ndarray]:
+    """{ts, po, ps, block} memmaps for a fetch_pool_oracle.py CSV or column
+    store directory."""
+    return _cached(path, "pool", POOL_COLUMNS, _convert_pool)
@@ -1,4 +1,4 @@
-"""Fetch the Chainlink BTC/USD on-chain feed over the candle time range.
+"""Fetch Chainlink on-chain feeds (BTC/USD by default) over the candle time range.
 
 What "every block" means here
 -----------------------------
@@ -12,15 +12,35 @@ eth_call per block (~5.4M). The CSV is the compact change-point series; to get a
 value "at block B" or "at candle minute T", as-of join (forward fill) on
 `block_number` / `updated_at`.
 
-Feed
-----
-Chainlink BTC/USD proxy on Ethereum mainnet:
-    0xF4030086522a5bEEa4988F8cA5B36dbC97BeE88c   (8 decimals)
-The proxy delegates to a phase aggregator; the actual `AnswerUpdated` logs are
+Feeds
+-----
+Chainlink proxies on Ethereum mainnet (all 8 decimals), selected with --feed
+(repeatable, several feeds are scanned in one run):
+    btcusd  0xF4030086522a5bEEa4988F8cA5B36dbC97BeE88c   (default)
+    ethusd  0x5f4eC3Df9cbd43714FE2740f5E3616155c5b8419
+    crvusd  0xCd627aA160A6fA45Eb793D19Ef54f5062F20f33f   (as in rates/fetch_crvusd_pools.py)
+A proxy delegates to a phase aggregator; the actual `AnswerUpdated` logs are
 emitted by the underlying aggregator(s). We resolve every phase aggregator that
 was active in the window via `phaseId()` / `phaseAggregators(uint16)` and scan
 each, so phase transitions inside the window are handled.
 
+Scanning
+--------
+All (feed, phase aggregator) ranges are scanned concurrently by a pool of
+workers, each pulling the next block window off a shared scheduler. The window
+size is AIMD-controlled: every successful eth_getLogs grows it by LOG_CHUNK_STEP
+(up to LOG_CHUNK_MAX), a provider rejection halves it and the failed window is
+split and re-queued. So a provider with a range/size cap settles near its limit
+instead of being stuck at the smallest size after the first error.
+
+Rounds are appended to the output CSV as windows complete (so an interrupted
+run keeps what it got) and the file is keyed by (phase_id, agg_round_id): rows
+already present are never written twice. When the scan finishes the file is
+rewritten sorted by block. Without --since-last the file is started afresh, so
+it holds exactly the requested window; --since-last keeps it and resumes each
+feed from the last stored block up to the chain head (unless --end is given),
+i.e. a top-up.
+
 Time range
 ----------
 Defaults to the exact span of the candle file (`btcusdt-2024-F2026.json.xz`):
@@ -38,8 +58,11 @@ Usage
     uv run python fetch_chainlink.py
     uv run python fetch_chainlink.py --out chainlink_btcusd_rounds.csv
     uv run python fetch_chainlink.py --start 1706054400 --end 1771199940
+    uv run python fetch_chainlink.py --feed btcusd --feed ethusd --feed crvusd
+    uv run python fetch_chainlink.py --feed btcusd --since-last
 
-Output: chainlink_btcusd_rounds.csv with one row per AnswerUpdated round:
+Output: chainlink_<feed>_rounds.csv (or --out, single feed only) with one row
+per AnswerUpdated round:
     phase_id, agg_round_id, block_number, updated_at, datetime_utc,
     answer_raw, price
 """
@@ -48,10 +71,12 @@ from __future__ import annotations
 import argparse
 import csv
 import datetime as dt
-import lzma
 import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import boa
@@ -60,11 +85,20 @@ from dotenv import load_dotenv
 from eth_utils import keccak
 from tqdm import tqdm
 
+import candles
+
 HERE = Path(__file__).resolve().parent
 
 # Chainlink BTC/USD proxy (Ethereum mainnet).
 PROXY = "0xF4030086522a5bEEa4988F8cA5B36dbC97BeE88c"
 
+# Chainlink proxies by short feed name (Ethereum mainnet, all 8 decimals).
+FEEDS = {
+    "btcusd": PROXY,
+    "ethusd": "0x5f4eC3Df9cbd43714FE2740f5E3616155c5b8419",
+    "crvusd": "0xCd627aA160A6fA45Eb793D19Ef54f5062F20f33f",
+}
+
 # AnswerUpdated(int256 indexed current, uint256 indexed roundId, uint256 updatedAt)
 ANSWER_UPDATED_TOPIC = "0x" + keccak(
     text="AnswerUpdated(int256,uint256,uint256)"
@@ -86,11 +120,18 @@ PROXY_ABI = json.dumps([
 ])
 
 DEFAULT_CANDLES = HERE / "btcusdt-2024-F2026.json.xz"
-DEFAULT_OUT = HERE / "chainlink_btcusd_rounds.csv"
 
-# eth_getLogs chunk; a local node handles large ranges, but we stay polite and
-# back off on provider errors. Smaller chunks => smoother progress bar.
+COLUMNS = ["phase_id", "agg_round_id", "block_number",
+           "updated_at", "datetime_utc", "answer_raw", "price"]
+
+# eth_getLogs window, AIMD-controlled: start at LOG_CHUNK, +LOG_CHUNK_STEP per
+# success up to LOG_CHUNK_MAX, halve on a provider error down to LOG_CHUNK_MIN.
 LOG_CHUNK = 50_000
+LOG_CHUNK_STEP = 10_000
+LOG_CHUNK_MIN = 1_000
+LOG_CHUNK_MAX = 500_000
+# Concurrent eth_getLogs workers (one RPC connection each).
+WORKERS = 16
 
 
 def hex_(n: int) -> str:
@@ -105,13 +146,6 @@ def to_int256(topic: str) -> int:
     return v
 
 
-def candle_time_range(path: Path) -> tuple[int, int]:
-    """First and last candle open-times (unix seconds) from the .xz file."""
-    with lzma.open(path) as fh:
-        data = json.load(fh)
-    return data[0][0] // 1000, data[-1][0] // 1000
-
-
 def block_timestamp(rpc: EthereumRPC, block: int) -> int:
     blk = rpc.fetch("eth_getBlockByNumber", [hex_(block), False])
     return int(blk["timestamp"], 16)
@@ -153,8 +187,9 @@ def find_block_at_or_before(rpc: EthereumRPC, ts: int, lo: int, hi: int) -> int:
     return res
 
 
-def call_proxy(rpc: EthereumRPC, selector_data: str, block: int | str = "latest") -> str:
-    return rpc.fetch("eth_call", [{"to": PROXY, "data": selector_data}, block])
+def call_proxy(rpc: EthereumRPC, selector_data: str, block: int | str = "latest",
+               proxy: str = PROXY) -> str:
+    return rpc.fetch("eth_call", [{"to": proxy, "data": selector_data}, block])
 
 
 def phase_aggregators_in_window(
@@ -167,8 +202,9 @@ def phase_aggregators_in_window(
     """
     # phaseId() selector via raw call at specific blocks (read at the bounds).
     sel = "0x" + keccak(text="phaseId()").hex()[:8]
-    p_start = int(call_proxy(rpc, sel, hex_(start_block)), 16)
-    p_end = int(call_proxy(rpc, sel, hex_(end_block)), 16)
+    addr = str(proxy.address)
+    p_start = int(call_proxy(rpc, sel, hex_(start_block), addr), 16)
+    p_end = int(call_proxy(rpc, sel, hex_(end_block), addr), 16)
     out = []
     for p in range(p_start, p_end + 1):
         agg = str(proxy.phaseAggregators(p))
@@ -180,41 +216,203 @@ def phase_aggregators_in_window(
 def fetch_answer_updated(
     rpc: EthereumRPC, aggregator: str, from_block: int, to_block: int
 ) -> list[dict]:
-    """All AnswerUpdated logs for one aggregator in [from_block, to_block]."""
-    rows: list[dict] = []
-    chunk = LOG_CHUNK
-    b = from_block
-    pbar = tqdm(total=to_block - from_block + 1, unit="blk", unit_scale=True,
-                desc=f"AnswerUpdated {aggregator[:10]}…", leave=True,
+    """All AnswerUpdated logs for one aggregator in ONE eth_getLogs over
+    [from_block, to_block]. Provider errors propagate (the scheduler splits)."""
+    logs = rpc.fetch("eth_getLogs", [{
+        "fromBlock": hex_(from_block),
+        "toBlock": hex_(to_block),
+        "address": aggregator,
+        "topics": [ANSWER_UPDATED_TOPIC],
+    }])
+    return [{
+        "block_number": int(lg["blockNumber"], 16),
+        "answer_raw": to_int256(lg["topics"][1]),
+        "agg_round_id": int(lg["topics"][2], 16),
+        "updated_at": int(lg["data"][2:66], 16),
+    } for lg in logs]
+
+
+class WindowScheduler:
+    """Hands out (task, lo, hi) block windows over many aggregator ranges to
+    concurrent workers, with an AIMD-controlled window size.
+
+    Ranges are carved lazily from per-task cursors at the *current* size, so a
+    size change applies to everything not yet handed out. A failed window is
+    halved into two windows put back at the front of the queue. After any
+    error (recorded in `errors`) no more windows are handed out."""
+
+    def __init__(self, tasks: list[dict], chunk: int = LOG_CHUNK):
+        self.tasks = tasks          # each: {"cursor", "end", ...}
+        self.chunk = chunk
+        self.retry: list[tuple[int, int, int]] = []
+        self.inflight = 0
+        self.rr = 0
+        self.errors: list[BaseException] = []
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+
+    def next(self) -> tuple[int, int, int] | None:
+        with self.cond:
+            while True:
+                if self.errors:
+                    return None
+                if self.retry:
+                    self.inflight += 1
+                    return self.retry.pop()
+                open_ = [i for i, t in enumerate(self.tasks)
+                         if t["cursor"] <= t["end"]]
+                if open_:
+                    # round-robin over aggregators so all feeds progress together
+                    i = open_[self.rr % len(open_)]
+                    self.rr += 1
+                    t = self.tasks[i]
+                    lo = t["cursor"]
+                    hi = min(lo + self.chunk - 1, t["end"])
+                    t["cursor"] = hi + 1
+                    self.inflight += 1
+                    return i, lo, hi
+                if self.inflight == 0:
+                    return None
+                # nothing to hand out, but an in-flight window may still fail
+                # and be re-queued: wait for it
+                self.cond.wait()
+
+    def done(self, ok: bool, window: tuple[int, int, int]) -> None:
+        i, lo, hi = window
+        with self.cond:
+            self.inflight -= 1
+            if ok:
+                self.chunk = min(self.chunk + LOG_CHUNK_STEP, LOG_CHUNK_MAX)
+            else:
+                if hi - lo + 1 <= LOG_CHUNK_MIN:
+                    e = RuntimeError(
+                        f"eth_getLogs keeps failing at {lo}-{hi} "
+                        f"({self.tasks[i]['feed']} p{self.tasks[i]['phase_id']})")
+                    self.errors.append(e)
+                    self.cond.notify_all()
+                    raise e
+                self.chunk = max(self.chunk // 2, LOG_CHUNK_MIN)
+                mid = (lo + hi) // 2
+                # retry is popped from the end: keep block order within a task
+                self.retry.append((i, mid + 1, hi))
+                self.retry.append((i, lo, mid))
+            self.cond.notify_all()
+
+    def fail(self, window: tuple[int, int, int], exc: BaseException) -> None:
+        """Window `window` could not be processed: stop handing out windows."""
+        with self.cond:
+            self.inflight -= 1
+            self.errors.append(exc)
+            self.cond.notify_all()
+
+
+class RoundStore:
+    """Append-only rounds CSV keyed by (phase_id, agg_round_id). With
+    resume=False an existing file is replaced by an empty one."""
+
+    def __init__(self, path: Path, scale: int, resume: bool = True):
+        self.path = path
+        self.scale = scale
+        self.keys: set[tuple[int, int]] = set()
+        self.last_block: int | None = None
+        self.lock = threading.Lock()
+        if resume and path.exists() and path.stat().st_size:
+            with open(path, newline="") as fh:
+                for row in csv.DictReader(fh):
+                    self.keys.add((int(row["phase_id"]), int(row["agg_round_id"])))
+                    b = int(row["block_number"])
+                    if self.last_block is None or b > self.last_block:
+                        self.last_block = b
+        else:
+            with open(path, "w", newline="") as fh:
+                csv.writer(fh).writerow(COLUMNS)
+        self.n_new = 0
+
+    def append(self, rows: list[dict]) -> int:
+        with self.lock:
+            fresh = []
+            for r in rows:
+                key = (r["phase_id"], r["agg_round_id"])
+                if key in self.keys:
+                    continue
+                self.keys.add(key)
+                fresh.append(r)
+            if fresh:
+                with open(self.path, "a", newline="") as fh:
+                    w = csv.writer(fh)
+                    for r in fresh:
+                        w.writerow([
+                            r["phase_id"], r["agg_round_id"], r["block_number"],
+                            r["updated_at"],
+                            dt.datetime.fromtimestamp(r["updated_at"], dt.UTC).isoformat(),
+                            r["answer_raw"], r["answer_raw"] / self.scale,
+                        ])
+            self.n_new += len(fresh)
+            return len(fresh)
+
+    def compact(self) -> list[list[str]]:
+        """Rewrite the file sorted by (block_number, agg_round_id)."""
+        with open(self.path, newline="") as fh:
+            r = csv.reader(fh)
+            header = next(r)
+            rows = list(r)
+        rows.sort(key=lambda row: (int(row[2]), int(row[1])))
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", newline="") as fh:
+            w = csv.writer(fh)
+            w.writerow(header)
+            w.writerows(rows)
+        tmp.replace(self.path)
+        return rows
+
+
+def scan_all(url: str, tasks: list[dict], stores: dict[str, RoundStore],
+             workers: int) -> None:
+    """Scan every task's [cursor, end] concurrently, appending to its store."""
+    sched = WindowScheduler(tasks)
+    total = sum(t["end"] - t["cursor"] + 1 for t in tasks)
+    pbar = tqdm(total=total, unit="blk", unit_scale=True, desc="AnswerUpdated",
                 dynamic_ncols=True)
-    while b <= to_block:
-        hi = min(b + chunk - 1, to_block)
-        params = [{
-            "fromBlock": hex_(b),
-            "toBlock": hex_(hi),
-            "address": aggregator,
-            "topics": [ANSWER_UPDATED_TOPIC],
-        }]
-        try:
-            logs = rpc.fetch("eth_getLogs", params)
-        except Exception as e:  # provider range/size limit -> shrink and retry
-            if chunk > 1000:
-                chunk //= 2
-                pbar.set_postfix_str(f"shrank chunk→{chunk}")
+    plock = threading.Lock()
+
+    def worker():
+        rpc_t = EthereumRPC(url)  # one RPC connection per worker thread
+        while True:
+            w = sched.next()
+            if w is None:
+                return
+            i, lo, hi = w
+            t = tasks[i]
+            try:
+                rows = fetch_answer_updated(rpc_t, t["aggregator"], lo, hi)
+            except Exception:  # provider range/size limit -> shrink and retry
+                try:
+                    sched.done(False, w)
+                except RuntimeError:  # recorded in sched.errors
+                    return
+                time.sleep(0.1)
                 continue
-            raise RuntimeError(f"eth_getLogs failed at {b}-{hi}: {e}") from e
-        for lg in logs:
-            rows.append({
-                "block_number": int(lg["blockNumber"], 16),
-                "answer_raw": to_int256(lg["topics"][1]),
-                "agg_round_id": int(lg["topics"][2], 16),
-                "updated_at": int(lg["data"][2:66], 16),
-            })
-        pbar.update(hi - b + 1)
-        pbar.set_postfix(rounds=len(rows), block=hi)
-        b = hi + 1
+            try:
+                for r in rows:
+                    r["phase_id"] = t["phase_id"]
+                rows = [r for r in rows
+                        if t["start_ts"] <= r["updated_at"] <= t["end_ts"]]
+                stores[t["feed"]].append(rows)
+            except BaseException as e:  # bad row, disk full, ...: stop the scan
+                sched.fail(w, e)
+                return
+            sched.done(True, w)
+            with plock:
+                pbar.update(hi - lo + 1)
+                pbar.set_postfix(chunk=sched.chunk,
+                                 rounds=sum(s.n_new for s in stores.values()))
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for f in [ex.submit(worker) for _ in range(workers)]:
+            f.result()
     pbar.close()
-    return rows
+    if sched.errors:
+        raise sched.errors[0]
 
 
 def main() -> int:
@@ -223,40 +421,48 @@ def main() -> int:
     ap.add_argument("--start", type=int, default=None,
                     help="start unix seconds (default: first candle)")
     ap.add_argument("--end", type=int, default=None,
-                    help="end unix seconds (default: last candle)")
+                    help="end unix seconds (default: last candle, or chain head "
+                         "with --since-last)")
     ap.add_argument("--candles", type=Path, default=DEFAULT_CANDLES,
                     help="candle .xz file to derive the default range from")
-    ap.add_argument("--out", type=Path, default=DEFAULT_OUT)
+    ap.add_argument("--feed", action="append", choices=sorted(FEEDS),
+                    help="feed to fetch, repeatable (default: btcusd)")
+    ap.add_argument("--out", type=Path, default=None,
+                    help="output CSV (single feed only; default "
+                         "chainlink_<feed>_rounds.csv)")
+    ap.add_argument("--since-last", action="store_true",
+                    help="resume each feed from the last block already stored")
+    ap.add_argument("--workers", type=int, default=WORKERS,
+                    help=f"concurrent eth_getLogs requests (default {WORKERS})")
     args = ap.parse_args()
 
+    feeds = args.feed or ["btcusd"]
+    feeds = list(dict.fromkeys(feeds))
+    if args.out is not None and len(feeds) > 1:
+        sys.exit("--out only applies to a single --feed")
+    outs = {f: args.out or HERE / f"chainlink_{f}_rounds.csv" for f in feeds}
+
     load_dotenv(HERE / ".env")
     url = os.environ.get("ETH_RPC_URL")
     if not url:
         sys.exit("ETH_RPC_URL not set (see .env / .env.example)")
 
-    # Resolve time range.
-    if args.start is not None and args.end is not None:
-        start_ts, end_ts = args.start, args.end
-    else:
+    # Resolve time range. --since-last tops up to the chain head by default.
+    start_ts, end_ts = args.start, args.end
+    if start_ts is None or (end_ts is None and not args.since_last):
         print(f"reading candle range from {args.candles.name} …", flush=True)
-        c_start, c_end = candle_time_range(args.candles)
-        start_ts = args.start if args.start is not None else c_start
-        end_ts = args.end if args.end is not None else c_end
+        c_start, c_end = candles.time_range(args.candles)
+        start_ts = start_ts if start_ts is not None else c_start
+        if end_ts is None and not args.since_last:
+            end_ts = c_end
 
     print(f"connecting to {url} (boa fork) …", flush=True)
     rpc = EthereumRPC(url)
     boa.fork(url, block_identifier="latest")
-    proxy = boa.loads_abi(PROXY_ABI).at(PROXY)
-
-    decimals = proxy.decimals()
-    scale = 10 ** decimals
-    try:
-        desc = proxy.description()
-    except Exception:
-        desc = "BTC / USD"
     latest_block = int(rpc.fetch("eth_blockNumber", []), 16)
+    if end_ts is None:
+        end_ts = block_timestamp(rpc, latest_block)
 
-    print(f"feed:        {desc}  proxy={PROXY}  decimals={decimals}")
     print(f"time range:  {dt.datetime.fromtimestamp(start_ts, dt.UTC)} .. "
           f"{dt.datetime.fromtimestamp(end_ts, dt.UTC)}  (unix {start_ts}..{end_ts})")
     print(f"latest block on node: {latest_block}")
@@ -266,50 +472,46 @@ def main() -> int:
     print(f"block range: {start_block} .. {end_block} "
           f"({end_block - start_block + 1:,} blocks)")
 
-    aggs = phase_aggregators_in_window(proxy, rpc, start_block, end_block)
-    print(f"phase aggregators in window: "
-          + ", ".join(f"p{p}={a}" for p, a in aggs))
-
-    all_rows: list[dict] = []
-    for phase_id, agg in aggs:
-        rows = fetch_answer_updated(rpc, agg, start_block, end_block)
-        for r in rows:
-            r["phase_id"] = phase_id
-        all_rows.extend(rows)
-        print(f"  phase {phase_id} {agg}: {len(rows):,} AnswerUpdated rounds")
-
-    # Clamp to the time window (updatedAt is the block timestamp of the update),
-    # sort chronologically, drop any dupes across phase-boundary overlaps.
-    all_rows = [r for r in all_rows if start_ts <= r["updated_at"] <= end_ts]
-    all_rows.sort(key=lambda r: (r["block_number"], r["agg_round_id"]))
-    seen = set()
-    deduped = []
-    for r in all_rows:
-        key = (r["phase_id"], r["agg_round_id"])
-        if key in seen:
+    tasks: list[dict] = []
+    stores: dict[str, RoundStore] = {}
+    for feed in feeds:
+        proxy = boa.loads_abi(PROXY_ABI).at(FEEDS[feed])
+        decimals = proxy.decimals()
+        try:
+            desc = proxy.description()
+        except Exception:
+            desc = feed
+        store = stores[feed] = RoundStore(outs[feed], 10 ** decimals,
+                                          resume=args.since_last)
+        lo = start_block
+        if args.since_last and store.last_block is not None:
+            lo = max(lo, store.last_block + 1)
+        print(f"feed:        {desc}  proxy={FEEDS[feed]}  decimals={decimals}  "
+              f"-> {outs[feed].name} ({len(store.keys):,} rounds stored)")
+        if lo > end_block:
+            print("  up to date")
             continue
-        seen.add(key)
-        deduped.append(r)
-    all_rows = deduped
-
-    with open(args.out, "w", newline="") as fh:
-        w = csv.writer(fh)
-        w.writerow(["phase_id", "agg_round_id", "block_number",
-                    "updated_at", "datetime_utc", "answer_raw", "price"])
-        for r in all_rows:
-            w.writerow([
-                r["phase_id"], r["agg_round_id"], r["block_number"],
-                r["updated_at"],
-                dt.datetime.fromtimestamp(r["updated_at"], dt.UTC).isoformat(),
-                r["answer_raw"], r["answer_raw"] / scale,
-            ])
-
-    print(f"\nwrote {len(all_rows):,} rounds -> {args.out}")
-    if all_rows:
-        print(f"first: block {all_rows[0]['block_number']} "
-              f"price {all_rows[0]['answer_raw'] / scale:,.2f}")
-        print(f"last:  block {all_rows[-1]['block_number']} "
-              f"price {all_rows[-1]['answer_raw'] / scale:,.2f}")
+        aggs = phase_aggregators_in_window(proxy, rpc, lo, end_block)
+        print("  phase aggregators in window: "
+              + ", ".join(f"p{p}={a}" for p, a in aggs)
+              + f"  (blocks {lo}..{end_block})")
+        for phase_id, agg in aggs:
+            tasks.append({"feed": feed, "phase_id": phase_id, "aggregator": agg,
+                          "cursor": lo, "end": end_block,
+                          "start_ts": start_ts, "end_ts": end_ts})
+
+    if tasks:
+        scan_all(url, tasks, stores, args.workers)
+
+    for feed, store in stores.items():
+        # Sorted chronologically; dupes across phase-boundary overlaps were
+        # already dropped by the (phase_id, agg_round_id) key on append.
+        rows = store.compact()
+        print(f"\n{feed}: +{store.n_new:,} new rounds, {len(rows):,} total "
+              f"-> {store.path}")
+        if rows:
+            print(f"first: block {rows[0][2]} price {float(rows[0][6]):,.2f}")
+            print(f"last:  block {rows[-1][2]} price {float(rows[-1][6]):,.2f}")
     return 0
 
 
@@ -18,19 +18,59 @@ The pool's lifespan is auto-detected: the inception block is found by binary
 search for the first block where the pool address has code; the end is the
 chain head (override with --start-block/--end-block). --stride subsamples.
 
-Output (CSV, default pool_oracle_scale.csv), one row per sampled block:
+Event-driven mode (--mode events)
+---------------------------------
+price_scale() only changes inside a pool transaction, and price_oracle() is
+the pool's EMA
+    po(t) = m + (po_0 - m) * exp(-(t - t_0) / ma_time),
+    m = min(last_prices, 2 * price_scale)
+which between two transactions evolves deterministically with the block
+timestamp. ma_time here is the stored 1/e time, the low 64 bits of
+packed_rebalancing_params(); the ma_time() getter of twocrypto-ng returns it
+scaled by 694/1000 (a half-life) and would relax the oracle ~1.44x too fast.
+So instead of an archive eth_call at every block, this mode:
+  1. scans ALL logs emitted by the pool (TokenExchange, AddLiquidity,
+     RemoveLiquidity(One), ClaimAdminFee, NewParameters, LP Transfer, ...; no
+     topic filter, so no state-changing action can be missed) -> the
+     change-point blocks;
+  2. samples price_oracle, price_scale, last_prices and
+     packed_rebalancing_params (+ block time) only at those blocks and at
+     the start;
+  3. fetches plain block headers (cheap, non-archive) for the timestamps of
+     the output grid, and reconstructs every block's values from the last
+     change point before it (as-of join, asof.py) with the formula above.
+The EMA is memoryless, so anchoring at the sampled (t_0, po_0) needs no
+history; one archive call per pool transaction block instead of one per
+block. The float exp differs from the contract's integer wad_exp, so the two
+modes agree only approximately; --check runs both over a range and fails if
+any block that is not a change point is off by more than CHECK_RTOL:
+
+    uv run python fetch_pool_oracle.py --check --start-block B --end-block B+5000
+
+Output (default ./pool_oracle_scale/), one row per sampled block: an
+appendable binary column store (poolstore.py) of block, timestamp,
+price_oracle, price_scale as floats and the raw uint256 values. Rows are
+appended batch by batch, so a rerun (or a daily top-up) resumes after the last
+stored block instead of refetching the pool's lifetime, with the stride and
+mode the store was created with (a different --stride/--mode is refused);
+--start-block overrides that only for a new store. --export writes the CSV
+layout
     block_number, timestamp, datetime_utc, price_oracle, price_scale
+(datetimes are derived there, not while fetching). plot_pool_model.py reads
+either the store or the CSV.
 
 Usage
 -----
     uv run python fetch_pool_oracle.py
-    uv run python fetch_pool_oracle.py --stride 10 --out pool_sparse.csv
+    uv run python fetch_pool_oracle.py --stride 10 --out pool_sparse
+    uv run python fetch_pool_oracle.py --export pool_oracle_scale.csv
     uv run python fetch_pool_oracle.py --start-block 23433451 --end-block 23500000
+    uv run python fetch_pool_oracle.py --mode events
+    uv run python fetch_pool_oracle.py --check --start-block 23500000 --end-block 23505000
 """
 from __future__ import annotations
 
 import argparse
-import csv
 import datetime as dt
 import os
 import threading
@@ -39,17 +79,21 @@ from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import eth_abi
+import numpy as np
 import boa  # noqa: F401  (kept so the env/.env story matches the other scripts)
 from boa.rpc import EthereumRPC
 from dotenv import load_dotenv
 from eth_utils import keccak
 from tqdm import tqdm
 
+from asof import asof_join
+from poolstore import PoolStore, is_store
+
 HERE = Path(__file__).resolve().parent
 
 POOL = "0x83f24023d15d835a213df24fd309c47dAb5BEb32"
 MC3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
-DEFAULT_OUT = HERE / "pool_oracle_scale.csv"
+DEFAULT_OUT = HERE / "pool_oracle_scale"
 
 # Chainlink BTC/USD proxy — the feed to fetch for the companion file.
 CHAINLINK_BTCUSD = "0xF4030086522a5bEEa4988F8cA5B36dbC97BeE88c"
@@ -60,17 +104,29 @@ WAD = 10 ** 18
 # batches concurrently; throughput plateaus around 32 workers (~3.3k blk/s).
 BATCH = 100
 WORKERS = 32
+# eth_getLogs window for the change-point scan (halved per window on errors).
+LOG_CHUNK = 50_000
+
+# Views sampled at change-point blocks in --mode events (allowFailure: a view
+# the pool lacks comes back as None). packed_rebalancing_params packs
+# (allowed_extra_profit, adjustment_step, ma_time) as 64-bit fields.
+STATE_VIEWS = ["price_oracle()", "price_scale()", "last_prices()",
+               "packed_rebalancing_params()"]
+MA_TIME_MASK = 2 ** 64 - 1
+# --check: max |events / blocks - 1| of price_oracle and price_scale at blocks
+# that are not change points.
+CHECK_RTOL = 1e-9
 
 
 def selector(sig: str) -> bytes:
     return bytes.fromhex(keccak(text=sig).hex()[:8])
 
 
-def aggregate3_calldata() -> str:
+def aggregate3_calldata(pool: str = POOL) -> str:
     """Constant calldata: aggregate3([price_oracle, price_scale, timestamp])."""
     calls = [
-        (POOL, False, selector("price_oracle()")),
-        (POOL, False, selector("price_scale()")),
+        (pool, False, selector("price_oracle()")),
+        (pool, False, selector("price_scale()")),
         (MC3, False, selector("getCurrentBlockTimestamp()")),
     ]
     payload = eth_abi.encode(["(address,bool,bytes)[]"], [calls])
@@ -86,6 +142,21 @@ def decode_aggregate3(result_hex: str) -> tuple[int, int, int]:
     return po, ps, ts
 
 
+def state_calldata(pool: str) -> str:
+    """aggregate3 over STATE_VIEWS (allowFailure) + the block timestamp."""
+    calls = [(pool, True, selector(v)) for v in STATE_VIEWS]
+    calls.append((MC3, False, selector("getCurrentBlockTimestamp()")))
+    payload = eth_abi.encode(["(address,bool,bytes)[]"], [calls])
+    return "0x" + (selector("aggregate3((address,bool,bytes)[])") + payload).hex()
+
+
+def decode_state(result_hex: str) -> tuple:
+    """-> (*STATE_VIEWS values or None, timestamp)."""
+    items = eth_abi.decode(["(bool,bytes)[]"], bytes.fromhex(result_hex[2:]))[0]
+    return tuple(int.from_bytes(data[:32], "big") if ok and len(data) >= 32
+                 else None for ok, data in items)
+
+
 def has_code(rpc: EthereumRPC, addr: str, block: int) -> bool:
     return rpc.fetch("eth_getCode", [addr, hex(block)]) not in ("0x", "0x0", "")
 
@@ -109,23 +180,216 @@ def find_inception(rpc: EthereumRPC, addr: str, latest: int) -> int:
     return lo
 
 
+def batched(url: str, items: list, payload, decode, batch: int, workers: int,
+            desc: str):
+    """Run one JSON-RPC request per item, `batch` per fetch_multi, `workers`
+    batches concurrently. Yields lists of (item, decoded) in input order."""
+    batch = min(batch, 100)  # node hard limit
+    chunks = [items[i:i + batch] for i in range(0, len(items), batch)]
+
+    # One RPC connection per worker thread (the client isn't shared-safe).
+    tl = threading.local()
+
+    def fetch_chunk(chunk):
+        rpc_t = getattr(tl, "rpc", None)
+        if rpc_t is None:
+            rpc_t = tl.rpc = EthereumRPC(url)
+        payloads = [payload(it) for it in chunk]
+        last = None
+        for attempt in range(4):
+            try:
+                results = rpc_t.fetch_multi(payloads)
+                return [(it, decode(r)) for it, r in zip(chunk, results)]
+            except Exception as e:  # transient; back off and retry
+                last = e
+                time.sleep(0.25 * (attempt + 1))
+        raise RuntimeError(f"batch at {chunk[0]} failed: {last}")
+
+    pbar = tqdm(total=len(items), unit="blk", unit_scale=True, desc=desc,
+                dynamic_ncols=True)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        # ex.map preserves input order -> rows stay sorted by block.
+        for rows in ex.map(fetch_chunk, chunks):
+            pbar.update(len(rows))
+            if rows:
+                pbar.set_postfix(block=rows[-1][0])
+            yield rows
+    pbar.close()
+
+
+def pool_log_blocks(url: str, pool: str, start: int, end: int,
+                    workers: int) -> list[int]:
+    """Sorted unique blocks in [start, end] where `pool` emitted any log."""
+    tl = threading.local()
+
+    def scan(lo: int, hi: int) -> list[int]:
+        rpc_t = getattr(tl, "rpc", None)
+        if rpc_t is None:
+            rpc_t = tl.rpc = EthereumRPC(url)
+        try:
+            logs = rpc_t.fetch("eth_getLogs", [{
+                "fromBlock": hex(lo), "toBlock": hex(hi), "address": pool}])
+        except Exception as e:  # provider range/size limit -> split
+            if hi - lo < 1000:
+                raise RuntimeError(f"eth_getLogs failed at {lo}-{hi}: {e}") from e
+            mid = (lo + hi) // 2
+            return scan(lo, mid) + scan(mid + 1, hi)
+        return [int(lg["blockNumber"], 16) for lg in logs]
+
+    windows = [(b, min(b + LOG_CHUNK - 1, end)) for b in range(start, end + 1, LOG_CHUNK)]
+    out: set[int] = set()
+    pbar = tqdm(total=end - start + 1, unit="blk", unit_scale=True,
+                desc="pool logs", dynamic_ncols=True)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for (lo, hi), blocks in zip(windows, ex.map(lambda w: scan(*w), windows)):
+            out.update(blocks)
+            pbar.update(hi - lo + 1)
+            pbar.set_postfix(change_points=len(out))
+    pbar.close()
+    return sorted(out)
+
+
+def reconstruct(blocks: np.ndarray, ts: np.ndarray, cp: dict) -> tuple[np.ndarray, np.ndarray]:
+    """price_oracle / price_scale (floats) at `blocks` with timestamps `ts`,
+    from the change-point samples `cp` (sorted by block, first <= blocks[0]).
+
+    The state at change point k holds until the next one; in between the
+    oracle relaxes towards m_k = min(last_prices, 2*price_scale) with 1/e time
+    ma_time, anchored at the sampled (t_k, po_k)."""
+    k, _ = asof_join(cp["block"], np.arange(cp["block"].size, dtype=np.float64),
+                     blocks, leading="clamp")
+    k = k.astype(np.int64)
+    po0, m, ma = cp["po"][k], cp["target"][k], cp["ma_time"][k]
+    age = ts - cp["ts"][k]
+    po = m + (po0 - m) * np.exp(-np.maximum(age, 0) / ma)
+    return po, cp["ps"][k]
+
+
+def sweep_batches(url: str, pool: str, blocks: list[int], batch: int,
+                  workers: int):
+    """Per-block mode: one aggregate3 eth_call at every sampled block.
+    Yields one PoolStore.append batch per RPC batch."""
+    data = aggregate3_calldata(pool)
+    for rows in batched(url, blocks,
+                        lambda b: ("eth_call", [{"to": MC3, "data": data}, hex(b)]),
+                        decode_aggregate3, batch, workers, "price_oracle/scale"):
+        po_raw = [v[0] for _, v in rows]
+        ps_raw = [v[1] for _, v in rows]
+        yield {"block": [b for b, _ in rows], "ts": [v[2] for _, v in rows],
+               "po": [v / WAD for v in po_raw], "ps": [v / WAD for v in ps_raw],
+               "po_raw": po_raw, "ps_raw": ps_raw}
+
+
+def change_points(url: str, pool: str, start: int, end: int,
+                  workers: int) -> list[int]:
+    """`start` and every block in [start, end] with a pool log."""
+    cps = sorted({start, *pool_log_blocks(url, pool, start, end, workers)})
+    print(f"change points: {len(cps):,} blocks with pool logs "
+          f"({len(cps) / max(end - start + 1, 1):.2%} of the range)", flush=True)
+    return cps
+
+
+def event_batches(url: str, pool: str, blocks: list[int], batch: int,
+                  workers: int, cps: list[int] | None = None):
+    """Event-driven mode: sample only at change points, rebuild the rest."""
+    if cps is None:
+        cps = change_points(url, pool, blocks[0], blocks[-1], workers)
+
+    data = state_calldata(pool)
+    samples = []
+    for rows in batched(url, cps,
+                        lambda b: ("eth_call", [{"to": MC3, "data": data}, hex(b)]),
+                        decode_state, batch, workers, "change-point state"):
+        samples.extend(rows)
+    if any(v is None for _b, vals in samples for v in vals):
+        raise RuntimeError("pool lacks one of " + ", ".join(STATE_VIEWS)
+                           + "; use --mode blocks")
+    # mask the packed word as an int: as a float it would lose the low bits
+    samples = [(b, (*vals[:3], vals[3] & MA_TIME_MASK, vals[4])) for b, vals in samples]
+    po, ps, last, ma, ts = (np.array([vals[i] for _b, vals in samples],
+                                     dtype=np.float64) for i in range(5))
+    cp = {
+        "block": np.array(cps, dtype=np.int64),
+        "ts": ts,
+        "po": po / WAD,
+        "ps": ps / WAD,
+        "target": np.minimum(last, 2 * ps) / WAD,
+        "ma_time": ma,
+    }
+
+    hdr = batched(url, blocks,
+                  lambda b: ("eth_getBlockByNumber", [hex(b), False]),
+                  lambda r: int(r["timestamp"], 16), batch, workers,
+                  "block timestamps")
+    for rows in hdr:
+        b = np.array([r[0] for r in rows], dtype=np.int64)
+        t = np.array([r[1] for r in rows], dtype=np.int64)
+        po_b, ps_b = reconstruct(b, t.astype(np.float64), cp)
+        yield {"block": b, "ts": t, "po": po_b, "ps": ps_b,
+               "po_raw": [round(v * WAD) for v in po_b.tolist()],
+               "ps_raw": [round(v * WAD) for v in ps_b.tolist()]}
+
+
+def check_modes(url: str, pool: str, blocks: list[int], batch: int,
+                workers: int) -> float:
+    """Max relative difference of --mode events vs --mode blocks (price_oracle
+    and price_scale) over `blocks`, at the blocks that are not change points."""
+    cps = change_points(url, pool, blocks[0], blocks[-1], workers)
+    ev = list(event_batches(url, pool, blocks, batch, workers, cps))
+    sw = list(sweep_batches(url, pool, blocks, batch, workers))
+    cols = {}
+    for name, parts in (("events", ev), ("blocks", sw)):
+        cols[name] = {k: np.concatenate([np.asarray(c[k], dtype=np.float64) for c in parts])
+                      for k in ("block", "po", "ps")}
+    if not np.array_equal(cols["events"]["block"], cols["blocks"]["block"]):
+        raise RuntimeError("the two modes sampled different blocks")
+    free = ~np.isin(cols["blocks"]["block"], cps)
+    worst = 0.0
+    for k in ("po", "ps"):
+        dev = np.abs(cols["events"][k][free] / cols["blocks"][k][free] - 1.0)
+        if dev.size:
+            i = int(np.argmax(dev))
+            print(f"{k}: {int(free.sum()):,} blocks between change points, "
+                  f"max rel diff {dev[i]:.2e} at block "
+                  f"{int(cols['blocks']['block'][free][i])}")
+            worst = max(worst, float(dev[i]))
+    return worst
+
+
 def main() -> int:
     ap = argparse.ArgumentParser(
         description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
     ap.add_argument("--pool", default=POOL, help="twocrypto pool address")
     ap.add_argument("--start-block", type=int, default=None,
-                    help="default: auto-detected pool inception block")
+                    help="new store only (default: auto-detected pool inception "
+                         "block); an existing store resumes after its last block")
     ap.add_argument("--end-block", type=int, default=None,
                     help="default: current chain head")
-    ap.add_argument("--stride", type=int, default=1,
-                    help="sample every Nth block (default 1 = every block)")
+    ap.add_argument("--stride", type=int, default=None,
+                    help="sample every Nth block (default 1 = every block; an "
+                         "existing store keeps the stride it was written with)")
+    ap.add_argument("--mode", choices=["blocks", "events"], default=None,
+                    help="blocks: eth_call at every sampled block; events: "
+                         "sample at pool-log blocks and reconstruct (default "
+                         "blocks; an existing store keeps its mode)")
     ap.add_argument("--batch", type=int, default=BATCH,
                     help=f"blocks per JSON-RPC batch, node max 100 (default {BATCH})")
     ap.add_argument("--workers", type=int, default=WORKERS,
                     help=f"concurrent batch requests (default {WORKERS})")
-    ap.add_argument("--out", type=Path, default=DEFAULT_OUT)
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUT,
+                    help="column store directory (created or resumed)")
+    ap.add_argument("--export", type=Path, default=None, metavar="CSV",
+                    help="write the store at --out as CSV and exit (no RPC)")
+    ap.add_argument("--check", action="store_true",
+                    help="compare --mode events with --mode blocks over "
+                         "--start-block..--end-block and exit (no store)")
     args = ap.parse_args()
 
+    if args.export is not None:
+        n = PoolStore(args.out).export_csv(args.export)
+        print(f"wrote {n:,} rows -> {args.export}")
+        return 0
+
     load_dotenv(HERE / ".env")
     url = os.environ.get("ETH_RPC_URL")
     if not url:
@@ -134,7 +398,39 @@ def main() -> int:
 
     latest = int(rpc.fetch("eth_blockNumber", []), 16)
     end_block = args.end_block if args.end_block is not None else latest
-    if args.start_block is not None:
+    if args.check:
+        if args.start_block is None or args.end_block is None:
+            raise SystemExit("--check needs --start-block and --end-block")
+        blocks = list(range(args.start_block, end_block + 1, args.stride or 1))
+        worst = check_modes(url, args.pool, blocks, args.batch, args.workers)
+        ok = worst <= CHECK_RTOL
+        print(f"events vs blocks: max rel diff {worst:.2e} "
+              f"({'ok' if ok else 'FAILED'}, tolerance {CHECK_RTOL:g})")
+        return 0 if ok else 1
+    if is_store(args.out):
+        store = PoolStore(args.out)
+        if store.meta["pool"].lower() != args.pool.lower():
+            raise SystemExit(f"{args.out} holds pool {store.meta['pool']}, "
+                             f"not {args.pool}")
+        for key in ("stride", "mode"):
+            given = getattr(args, key)
+            if given is not None and given != store.meta[key]:
+                raise SystemExit(f"{args.out} was written with --{key} "
+                                 f"{store.meta[key]}, not {given}")
+            setattr(args, key, store.meta[key])
+    else:
+        args.stride = args.stride or 1
+        args.mode = args.mode or "blocks"
+        store = PoolStore.create(args.out, pool=args.pool, stride=args.stride,
+                                 mode=args.mode)
+    if store.last_block is not None:
+        start_block = store.last_block + args.stride
+        print(f"resuming {args.out} ({len(store):,} rows, last block "
+              f"{store.last_block})", flush=True)
+        if start_block > end_block:
+            print("up to date")
+            return 0
+    elif args.start_block is not None:
         start_block = args.start_block
     else:
         print("detecting pool inception block …", flush=True)
@@ -146,55 +442,19 @@ def main() -> int:
     blocks = list(range(start_block, end_block + 1, args.stride))
     print(f"pool:   {args.pool}")
     print(f"blocks: {start_block} .. {end_block}  stride={args.stride}  "
-          f"-> {len(blocks):,} samples")
+          f"-> {len(blocks):,} samples  (mode {args.mode})")
     print(f"window: {dt.datetime.fromtimestamp(t0, dt.UTC)} .. "
           f"{dt.datetime.fromtimestamp(t1, dt.UTC)}  (unix {t0}..{t1})")
 
-    data = aggregate3_calldata()
-    batch = min(args.batch, 100)  # node hard limit
-    chunks = [blocks[i:i + batch] for i in range(0, len(blocks), batch)]
+    print(f"fetching with {args.workers} workers x batch {min(args.batch, 100)} …",
+          flush=True)
+    batches_fn = event_batches if args.mode == "events" else sweep_batches
+    n0 = len(store)
+    for cols in batches_fn(url, args.pool, blocks, args.batch, args.workers):
+        store.append(cols)
 
-    # One RPC connection per worker thread (the client isn't shared-safe).
-    tl = threading.local()
-
-    def fetch_chunk(blk_list):
-        rpc_t = getattr(tl, "rpc", None)
-        if rpc_t is None:
-            rpc_t = tl.rpc = EthereumRPC(url)
-        payloads = [("eth_call", [{"to": MC3, "data": data}, hex(b)])
-                    for b in blk_list]
-        last = None
-        for attempt in range(4):
-            try:
-                results = rpc_t.fetch_multi(payloads)
-                return [(b, *decode_aggregate3(r)) for b, r in zip(blk_list, results)]
-            except Exception as e:  # transient; back off and retry
-                last = e
-                time.sleep(0.25 * (attempt + 1))
-        raise RuntimeError(f"batch at block {blk_list[0]} failed: {last}")
-
-    print(f"fetching with {args.workers} workers x batch {batch} …", flush=True)
-    with open(args.out, "w", newline="") as fh:
-        w = csv.writer(fh)
-        w.writerow(["block_number", "timestamp", "datetime_utc",
-                    "price_oracle", "price_scale"])
-        pbar = tqdm(total=len(blocks), unit="blk", unit_scale=True,
-                    desc="price_oracle/scale", dynamic_ncols=True)
-        with ThreadPoolExecutor(max_workers=args.workers) as ex:
-            # ex.map preserves input order -> rows stay sorted by block.
-            for rows in ex.map(fetch_chunk, chunks):
-                for b, po, ps, ts in rows:
-                    w.writerow([
-                        b, ts,
-                        dt.datetime.fromtimestamp(ts, dt.UTC).isoformat(),
-                        po / WAD, ps / WAD,
-                    ])
-                pbar.update(len(rows))
-                if rows:
-                    pbar.set_postfix(block=rows[-1][0])
-        pbar.close()
-
-    print(f"\nwrote {len(blocks):,} rows -> {args.out}")
+    print(f"\nappended {len(store) - n0:,} rows -> {args.out} "
+          f"({len(store):,} total)")
     print("\nCompanion Chainlink BTC/USD over the SAME period — run:")
     print(f"  uv run python fetch_chainlink.py --start {t0} --end {t1} "
           f"--out chainlink_pool_window.csv")
@@ -0,0 +1,211 @@
+"""Sample every Yield Basis market's cryptopool at every block, in one pass.
+
+fetch_pool_oracle.py follows a single --pool. The YB Factory
+(factory.yieldbasis.eth) holds one Curve twocrypto pool per market
+(Factory.markets(i).cryptopool, cf. pnl/yb.py), and at any block reading all
+of them costs the same round-trip as reading one: this script puts
+
+    for each cryptopool: price_oracle(), price_scale(), virtual_price(),
+                         xcp_profit()
+    + MC3.getCurrentBlockTimestamp()
+
+into ONE Multicall3.aggregate3 per block (allowFailure, so a pool not yet
+deployed at that block just reads NaN), and reuses fetch_pool_oracle.py's
+batched, threaded fetch over a single block grid.
+
+Output: one column store (poolstore.py, default ./yb_pools/) with the shared
+block/ts columns and float64 columns m<idx>_po, m<idx>_ps, m<idx>_vp,
+m<idx>_xcp (value / 1e18) per market. Like fetch_pool_oracle.py it resumes
+after the last stored block; a market created since the last run gets its
+columns added, back-filled with NaN. --export writes the store as CSV.
+
+The grid starts at the first cryptopool's inception block unless
+--start-block is given.
+
+Usage
+-----
+    uv run python fetch_yb_pools.py
+    uv run python fetch_yb_pools.py --stride 50
+    uv run python fetch_yb_pools.py --export yb_pools.csv
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import os
+from pathlib import Path
+
+import eth_abi
+import numpy as np
+from boa.rpc import EthereumRPC
+from dotenv import load_dotenv
+from eth_utils import keccak
+
+from fetch_pool_oracle import (BATCH, MC3, WAD, WORKERS, batched, find_inception,
+                               selector)
+from poolstore import PoolStore, is_store
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_OUT = HERE / "yb_pools"
+
+FACTORY_ENS = "factory.yieldbasis.eth"
+ENS_REGISTRY = "0x00000000000C2E074eC69A0dFb2997BA6C7d2e1e"
+
+# view -> column suffix
+VIEWS = {
+    "price_oracle()": "po",
+    "price_scale()": "ps",
+    "virtual_price()": "vp",
+    "xcp_profit()": "xcp",
+}
+MARKET_TUPLE = "(address,address,address,address,address,address,address)"
+
+
+def namehash(name: str) -> bytes:
+    node = b"\0" * 32
+    for label in reversed(name.split(".")):
+        node = keccak(node + keccak(text=label))
+    return node
+
+
+def call(rpc: EthereumRPC, to: str, data: bytes, block="latest") -> bytes:
+    res = rpc.fetch("eth_call", [{"to": to, "data": "0x" + data.hex()}, block])
+    return bytes.fromhex(res[2:])
+
+
+def resolve_ens(rpc: EthereumRPC, name: str) -> str:
+    node = namehash(name)
+    resolver = eth_abi.decode(["address"], call(
+        rpc, ENS_REGISTRY, selector("resolver(bytes32)") + node))[0]
+    if int(resolver, 16) == 0:
+        raise RuntimeError(f"no ENS resolver for {name}")
+    return eth_abi.decode(["address"], call(
+        rpc, resolver, selector("addr(bytes32)") + node))[0]
+
+
+def cryptopools(rpc: EthereumRPC, factory: str) -> list[str]:
+    """Factory.markets(i).cryptopool for every market, by index."""
+    n = eth_abi.decode(["uint256"], call(rpc, factory, selector("market_count()")))[0]
+    out = []
+    for i in range(n):
+        data = selector("markets(uint256)") + eth_abi.encode(["uint256"], [i])
+        market = eth_abi.decode([MARKET_TUPLE], call(rpc, factory, data))[0]
+        out.append(market[1])
+    return out
+
+
+def multi_calldata(pools: list[str]) -> str:
+    calls = [(p, True, selector(v)) for p in pools for v in VIEWS]
+    calls.append((MC3, False, selector("getCurrentBlockTimestamp()")))
+    payload = eth_abi.encode(["(address,bool,bytes)[]"], [calls])
+    return "0x" + (selector("aggregate3((address,bool,bytes)[])") + payload).hex()
+
+
+def decode_multi(result_hex: str) -> tuple[list[float], int]:
+    """-> (per-pool view values / 1e18, NaN on failure, timestamp)."""
+    items = eth_abi.decode(["(bool,bytes)[]"], bytes.fromhex(result_hex[2:]))[0]
+    vals = [int.from_bytes(data[:32], "big") / WAD if ok and len(data) >= 32
+            else np.nan for ok, data in items[:-1]]
+    return vals, int.from_bytes(items[-1][1], "big")
+
+
+def column_names(n_pools: int) -> list[str]:
+    return [f"m{i}_{suffix}" for i in range(n_pools) for suffix in VIEWS.values()]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--factory", default=None,
+                    help=f"YB factory address (default: resolve {FACTORY_ENS})")
+    ap.add_argument("--start-block", type=int, default=None,
+                    help="new store only (default: first cryptopool inception)")
+    ap.add_argument("--end-block", type=int, default=None,
+                    help="default: current chain head")
+    ap.add_argument("--stride", type=int, default=1,
+                    help="sample every Nth block (default 1 = every block)")
+    ap.add_argument("--batch", type=int, default=BATCH,
+                    help=f"blocks per JSON-RPC batch, node max 100 (default {BATCH})")
+    ap.add_argument("--workers", type=int, default=WORKERS,
+                    help=f"concurrent batch requests (default {WORKERS})")
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUT,
+                    help="column store directory (created or resumed)")
+    ap.add_argument("--export", type=Path, default=None, metavar="CSV",
+                    help="write the store at --out as CSV and exit (no RPC)")
+    args = ap.parse_args()
+
+    if args.export is not None:
+        n = PoolStore(args.out).export_csv(args.export)
+        print(f"wrote {n:,} rows -> {args.export}")
+        return 0
+
+    load_dotenv(HERE / ".env")
+    url = os.environ.get("ETH_RPC_URL")
+    if not url:
+        raise SystemExit("ETH_RPC_URL not set (see .env / .env.example)")
+    rpc = EthereumRPC(url)
+
+    factory = args.factory or resolve_ens(rpc, FACTORY_ENS)
+    pools = cryptopools(rpc, factory)
+    if not pools:
+        raise SystemExit(f"factory {factory} has no markets")
+    for i, p in enumerate(pools):
+        print(f"  market {i}: cryptopool {p}")
+
+    latest = int(rpc.fetch("eth_blockNumber", []), 16)
+    end_block = args.end_block if args.end_block is not None else latest
+    names = column_names(len(pools))
+    if is_store(args.out):
+        store = PoolStore(args.out)
+        known = store.meta["pools"]
+        if [p.lower() for p in pools[:len(known)]] != [p.lower() for p in known]:
+            raise SystemExit(f"{args.out} was written for other pools: {known}")
+        store.meta["pools"] = pools  # persisted by add_column
+        for name in names:
+            if name not in store.columns:
+                store.add_column(name)
+    else:
+        store = PoolStore.create(args.out,
+                                 {"block": "u32", "ts": "u32",
+                                  **{n: "f64" for n in names}},
+                                 factory=factory, pools=pools, stride=args.stride)
+
+    if store.last_block is not None:
+        start_block = store.last_block + args.stride
+        print(f"resuming {args.out} ({len(store):,} rows, last block "
+              f"{store.last_block})", flush=True)
+        if start_block > end_block:
+            print("up to date")
+            return 0
+    elif args.start_block is not None:
+        start_block = args.start_block
+    else:
+        print("detecting first cryptopool inception block …", flush=True)
+        start_block = min(find_inception(rpc, p, latest) for p in pools)
+
+    blocks = list(range(start_block, end_block + 1, args.stride))
+    print(f"blocks: {start_block} .. {end_block}  stride={args.stride}  "
+          f"-> {len(blocks):,} samples x {len(pools)} pools "
+          f"({len(pools) * len(VIEWS) + 1} calls per aggregate3)", flush=True)
+
+    data = multi_calldata(pools)
+    n0 = len(store)
+    for rows in batched(url, blocks,
+                        lambda b: ("eth_call", [{"to": MC3, "data": data}, hex(b)]),
+                        decode_multi, args.batch, args.workers, "yb cryptopools"):
+        vals = np.array([v for _b, (v, _t) in rows], dtype=np.float64)
+        cols = {"block": [b for b, _ in rows], "ts": [t for _b, (_v, t) in rows]}
+        cols.update({n: vals[:, j] for j, n in enumerate(names)})
+        store.append(cols)
+
+    print(f"\nappended {len(store) - n0:,} rows -> {args.out} "
+          f"({len(store):,} total)")
+    if len(store) > n0:
+        ts = store.column("ts")
+        print(f"window: {dt.datetime.fromtimestamp(int(ts[n0]), dt.UTC)} .. "
+              f"{dt.datetime.fromtimestamp(int(ts[-1]), dt.UTC)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
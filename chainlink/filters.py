@@ -0,0 +1,158 @@
+"""First-order IIR (EMA) kernels, vectorized.
+
+Every EMA in these scripts is the same recursion
+
+    acc_k = d_k * acc_{k-1} + (1 - d_k) * x_k,     acc_{-1} = x_0
+
+with a per-sample decay d_k: constant (fixed alpha, or a time constant on a
+uniform grid: d = exp(-dt/tau)) or time-varying (irregular timestamps:
+d_k = exp(-(t_k - t_{k-1})/tau)). Written as a Python loop that is ~1 s per
+pass over the 1.08M candles; here it is:
+
+  uniform grid   scipy.signal.lfilter (C recursion) when scipy is installed,
+                 else the blocked scan below.
+  irregular      numba-compiled loop when numba is installed, else the
+                 blocked scan.
+  banks          many taus at once on a uniform grid: one blocked scan over
+                 (n_tau, n), x is read once.
+
+Blocked scan: within a block starting after state c, with L_i the cumulative
+log-decay since the block start,
+
+    acc_i - c = exp(L_i) * sum_{j<=i} (1 - d_j) (x_j - c) exp(-L_j)
+
+which is a cumsum. Blocks are cut whenever -L reaches SCAN_LOG_LIMIT (so the
+exp(-L_j) factors stay moderate) or after SCAN_BLOCK samples; centering on c
+keeps the sum well scaled. Over 1.08M one-minute samples and tau from 5
+minutes to 30 days the scan agrees with the loop (irregular) and lfilter
+(banks) to ~1e-13 relative; the worst case seen is 2.6e-13, a 7-day bank
+row. That residue grows with tau/dt like the reference recursions' own
+rounding and does not shrink with shorter blocks (64 to 1024 samples give
+the same figures); dropping the length cap and raising the log limit to
+500 is what costs accuracy, to ~1e-12.
+
+All functions return float64 arrays of x's shape (banks: (n_tau, n)).
+"""
+from __future__ import annotations
+
+import numpy as np
+
+try:
+    from scipy.signal import lfilter
+except ImportError:  # chainlink/ does not depend on scipy
+    lfilter = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Max cumulative -log(decay) inside one scan block (exp(50) ~ 5e21).
+SCAN_LOG_LIMIT = 50.0
+# Max samples per scan block.
+SCAN_BLOCK = 1024
+# Per-sample decay floor: exp(-50) ~ 2e-22 is below float64 resolution, so
+# clamping here is exact in practice and bounds the block count.
+LOG_DECAY_FLOOR = -50.0
+
+
+def _scan(x: np.ndarray, logd: np.ndarray) -> np.ndarray:
+    """Blocked scan along the last axis. `logd` (per-sample log decay,
+    broadcastable to x) must be <= 0."""
+    x = np.asarray(x, dtype=np.float64)
+    logd = np.maximum(np.broadcast_to(logd, x.shape), LOG_DECAY_FLOOR)
+    n = x.shape[-1]
+    out = np.empty_like(x)
+    if n == 0:
+        return out
+    # block boundaries from the fastest-decaying row
+    cum = np.cumsum(-logd, axis=-1)
+    worst = cum.max(axis=0) if cum.ndim > 1 else cum
+    c = x[..., :1].copy()  # acc_{-1} = x_0
+    s = 0
+    while s < n:
+        base = worst[s - 1] if s else 0.0
+        e = int(np.searchsorted(worst, base + SCAN_LOG_LIMIT, "right"))
+        e = min(max(e, s + 1), n, s + SCAN_BLOCK)
+        ld = logd[..., s:e]
+        L = np.cumsum(ld, axis=-1)
+        g = -np.expm1(ld)  # 1 - d, accurate for d close to 1
+        acc = np.cumsum(g * (x[..., s:e] - c) * np.exp(-L), axis=-1)
+        out[..., s:e] = c + np.exp(L) * acc
+        c = out[..., e - 1:e]
+        s = e
+    return out
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _irregular_loop(t, x, tau):  # pragma: no cover - compiled
+        out = np.empty(x.size, dtype=np.float64)
+        acc = x[0]
+        out[0] = acc
+        for k in range(1, x.size):
+            a = 1.0 - np.exp(-(t[k] - t[k - 1]) / tau)
+            acc += a * (x[k] - acc)
+            out[k] = acc
+        return out
+else:
+    _irregular_loop = None
+
+
+def ema_alpha(x: np.ndarray, alpha: float) -> np.ndarray:
+    """Fixed-alpha EMA (pandas adjust=False), seeded with x[0]."""
+    x = np.asarray(x, dtype=np.float64)
+    if x.size == 0:
+        return x.copy()
+    if alpha >= 1.0:
+        return x.copy()
+    if lfilter is not None:
+        d = 1.0 - alpha
+        y, _ = lfilter([alpha], [1.0, -d], x, zi=[d * x[0]])
+        return y
+    return _scan(x, np.log1p(-alpha))
+
+
+def ema_span(x: np.ndarray, span: float) -> np.ndarray:
+    """EMA with pandas' span convention, alpha = 2 / (span + 1)."""
+    return ema_alpha(x, 2.0 / (span + 1.0))
+
+
+def ema_tau(x: np.ndarray, tau: float, dt: float | None = None,
+            t: np.ndarray | None = None) -> np.ndarray:
+    """Time-aware EMA with continuous 1/e constant `tau`.
+
+    Uniform grid: pass the spacing `dt` (alpha = 1 - exp(-dt/tau)).
+    Irregular: pass the sample times `t` (alpha_k = 1 - exp(-dt_k/tau)).
+    `tau`, `dt` and `t` share a time unit."""
+    if (dt is None) == (t is None):
+        raise ValueError("pass exactly one of dt (uniform) or t (irregular)")
+    if dt is not None:
+        return ema_alpha(x, -np.expm1(-dt / tau))
+    x = np.asarray(x, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    if x.size == 0:
+        return x.copy()
+    if _irregular_loop is not None:
+        return _irregular_loop(t, x, float(tau))
+    logd = np.empty_like(t)
+    logd[0] = 0.0
+    logd[1:] = -np.diff(t) / tau
+    return _scan(x, logd)
+
+
+def ema_bank(x: np.ndarray, taus, dt: float | None = None,
+             t: np.ndarray | None = None) -> np.ndarray:
+    """EMA of one series for many time constants, shape (len(taus), n).
+
+    On a uniform grid all taus run in the same blocked pass over x; on an
+    irregular grid (t given) each tau is an `ema_tau` pass."""
+    taus = np.asarray(taus, dtype=np.float64).ravel()
+    x = np.asarray(x, dtype=np.float64)
+    if t is not None:
+        return np.stack([ema_tau(x, tau, t=t) for tau in taus]) if taus.size \
+            else np.empty((0, x.size))
+    if dt is None:
+        raise ValueError("pass dt (uniform) or t (irregular)")
+    logd = (-dt / taus)[:, None]
+    return _scan(np.broadcast_to(x, (taus.size, x.size)), logd)
@@ -9,13 +9,16 @@ Two series, very different sizes:
 Why this isn't insane to render
 -------------------------------
 A screen is only ~2-3k pixels wide, so drawing 1.08M points is wasted work.
-We keep the full arrays in memory (~17 MB) but only ever *draw* a viewport
+The full arrays are memory-mapped from the column cache (colstore.py, ~17 MB,
+converted from the .xz inputs on first use only), but only ever *draw* a viewport
 min/max decimation: slice to the visible x-range, bucket it into ~1 bucket per
 horizontal pixel, and emit the min and max of each bucket. That's ~2x the pixel
 width in points (~5k) at any zoom level, and min/max keeps every visible spike,
 so the curve looks identical to the full render. Zoom in -> fewer points per
 bucket -> automatically sharper, down to raw points when a region is sparser
-than the pixels covering it. Re-decimation runs on every zoom/pan/resize.
+than the pixels covering it. Re-decimation runs on every zoom/pan/resize, off a
+min/max pyramid (pyramid.py) so it only touches ~2 blocks per pixel no matter
+how wide the view is; the close's pyramid is persisted next to its column cache.
 
 The oracle (28.7k) is cheap, so it is drawn in full as a `steps-post` line.
 
@@ -35,17 +38,17 @@ Inputs default to the files in this directory:
 from __future__ import annotations
 
 import argparse
-import csv
-import json
-import lzma
 from pathlib import Path
 
 import numpy as np
 
+from colstore import cache_dir, candle_columns, oracle_columns
+from filters import ema_span
+from pyramid import MinMaxPyramid
+
 HERE = Path(__file__).resolve().parent
 DEFAULT_CANDLES = HERE / "btcusdt-2024-F2026.json.xz"
 DEFAULT_ORACLE = HERE / "chainlink_btcusd_rounds.csv.xz"
-CACHE = HERE / "cache"
 
 # matplotlib's default epoch is 1970-01-01, and date2num is "days since epoch",
 # so a unix-seconds timestamp maps to a date number by /86400 (+ offset, =0 in
@@ -53,46 +56,22 @@ CACHE = HERE / "cache"
 
 
 def load_candles(path: Path) -> tuple[np.ndarray, np.ndarray]:
-    """Return (unix_seconds float64, close float64). Cached as .npz."""
-    CACHE.mkdir(exist_ok=True)
-    cache_f = CACHE / f"candles_{path.stem}_{int(path.stat().st_mtime)}.npz"
-    if cache_f.exists():
-        d = np.load(cache_f)
-        return d["ts"], d["close"]
-    with lzma.open(path) as fh:
-        rows = json.load(fh)
-    arr = np.asarray(rows, dtype=np.float64)  # [ts_ms, o, h, l, c, v]
-    ts = arr[:, 0] / 1000.0
-    close = arr[:, 4]
-    np.savez(cache_f, ts=ts, close=close)
-    return ts, close
+    """Return (unix_seconds float64, close float64) as read-only memmaps of
+    the converted column cache (colstore.py); parsed only on the first run."""
+    cols = candle_columns(path)
+    return cols["ts"], cols["c"]
 
 
 def load_oracle(path: Path) -> tuple[np.ndarray, np.ndarray]:
-    """Return (unix_seconds float64, price float64) sorted by time."""
-    op = lzma.open(path, "rt") if path.suffix == ".xz" else open(path)
-    with op as fh:
-        r = csv.DictReader(fh)
-        ts, px = [], []
-        for row in r:
-            ts.append(float(row["updated_at"]))
-            px.append(float(row["price"]))
-    ts = np.asarray(ts, dtype=np.float64)
-    px = np.asarray(px, dtype=np.float64)
-    order = np.argsort(ts, kind="stable")
-    return ts[order], px[order]
+    """Return (unix_seconds float64, price float64) sorted by time (memmaps)."""
+    cols = oracle_columns(path)
+    return cols["ts"], cols["price"]
 
 
 def ema(x: np.ndarray, span_minutes: int) -> np.ndarray:
-    """EMA over the candle close (adjust=False), candles being 1-min spaced."""
-    a = 2.0 / (span_minutes + 1.0)
-    out = np.empty_like(x)
-    acc = x[0]
-    one_minus = 1.0 - a
-    for i in range(x.size):
-        acc = a * x[i] + one_minus * acc
-        out[i] = acc
-    return out
+    """EMA over the candle close (adjust=False), candles being 1-min spaced.
+    Vectorized IIR kernel from filters.py."""
+    return ema_span(x, span_minutes)
 
 
 def minmax_decimate(x: np.ndarray, y: np.ndarray, n_px: int):
@@ -120,20 +99,24 @@ def minmax_decimate(x: np.ndarray, y: np.ndarray, n_px: int):
 
 
 class LazyPlot:
-    """Re-decimates the dense series to the current viewport on every nav event."""
+    """Re-decimates the dense series to the current viewport on every nav event.
+
+    Each dense series (`close`, `ema_arr`, every array in `extra`) may be given
+    as a plain array or a prebuilt MinMaxPyramid (pyramid.py); arrays get a
+    pyramid built once here, so a redraw costs O(pixels) at any zoom level."""
 
     def __init__(self, ax, xc, close, line_real, ema_arr=None, line_ema=None,
                  xo=None, extra=None):
         self.ax = ax
         self.xc = xc            # candle x (date nums), sorted
-        self.close = close
+        self.close = MinMaxPyramid.of(close)
         self.line_real = line_real
-        self.ema_arr = ema_arr
+        self.ema_arr = None if ema_arr is None else MinMaxPyramid.of(ema_arr)
         self.line_ema = line_ema
         self.xo = xo            # oracle x (for y-rescale to viewport)
         self.yo = None
-        # extra dense series sharing xc: list of (array, Line2D) decimated too.
-        self.extra = list(extra) if extra else []
+        # extra dense series sharing xc: list of (pyramid, Line2D) decimated too.
+        self.extra = [(MinMaxPyramid.of(a), line) for a, line in extra or []]
         self._busy = False
 
     def redraw(self, *_):
@@ -152,28 +135,17 @@ class LazyPlot:
             i1 = np.searchsorted(self.xc, x1, "right")
             i0 = max(i0 - 1, 0)
             i1 = min(i1 + 1, self.xc.size)
-            xv = self.xc[i0:i1]
-            yv = self.close[i0:i1]
-            xd, yd = minmax_decimate(xv, yv, n_px)
-            self.line_real.set_data(xd, yd)
 
+            # y-range from the decimated envelope: same min/max as the slice
             ylo, yhi = (np.inf, -np.inf)
-            if yv.size:
-                ylo, yhi = min(ylo, yv.min()), max(yhi, yv.max())
-
+            series = [(self.close, self.line_real), *self.extra]
             if self.line_ema is not None:
-                ev = self.ema_arr[i0:i1]
-                exd, eyd = minmax_decimate(xv, ev, n_px)
-                self.line_ema.set_data(exd, eyd)
-                if ev.size:
-                    ylo, yhi = min(ylo, ev.min()), max(yhi, ev.max())
-
-            for arr, line in self.extra:
-                av = arr[i0:i1]
-                axd, ayd = minmax_decimate(xv, av, n_px)
-                line.set_data(axd, ayd)
-                if av.size:
-                    ylo, yhi = min(ylo, av.min()), max(yhi, av.max())
+                series.insert(1, (self.ema_arr, self.line_ema))
+            for pyr, line in series:
+                xd, yd = pyr.decimate(self.xc, i0, i1, n_px)
+                line.set_data(xd, yd)
+                if yd.size:
+                    ylo, yhi = min(ylo, yd.min()), max(yhi, yd.max())
 
             # include visible oracle in the y-rescale
             if self.xo is not None and self.yo is not None:
@@ -256,7 +228,8 @@ def main() -> int:
     ax.grid(True, alpha=0.3)
     ax.legend(loc="upper left")
 
-    lazy = LazyPlot(ax, xc, close, line_real, ema_arr, line_ema, xo)
+    close_pyr = MinMaxPyramid.cached(close, cache_dir(args.candles, "candles"), "c")
+    lazy = LazyPlot(ax, xc, close_pyr, line_real, ema_arr, line_ema, xo)
     lazy.yo = px_o
     ax.callbacks.connect("xlim_changed", lazy.redraw)
     fig.canvas.mpl_connect("resize_event", lazy.redraw)
@@ -14,7 +14,9 @@ point series is computed at once.
 
 Two lines are drawn: Binance spot (real) and the model price. The dense series
 use the same viewport min/max decimation + lazy redraw as
-plot_chainlink_vs_price.py, so it renders instantly at any zoom.
+plot_chainlink_vs_price.py (LazyPlot over min/max pyramids; the Binance close
+pyramid is shared with that script's on-disk cache), so it renders instantly at
+any zoom.
 
 Usage
 -----
@@ -29,6 +31,10 @@ from pathlib import Path
 
 import numpy as np
 
+from asof import asof_join
+from colstore import cache_dir
+from filters import ema_tau
+from pyramid import MinMaxPyramid
 # Reuse the loaders / decimation / lazy-redraw engine from the sibling script.
 from plot_chainlink_vs_price import (
     DEFAULT_CANDLES,
@@ -49,10 +55,11 @@ EMA_TAU_SECONDS = 866.0
 CHAINLINK_PRECISION = 0.005
 
 
-def model_price(ema_binance: np.ndarray, chainlink: np.ndarray) -> np.ndarray:
+def model_price(ema_binance: np.ndarray, chainlink: np.ndarray,
+                precision: float | None = None) -> np.ndarray:
     """Aggregate the EMA of Binance spot and the current Chainlink price.
 
-    Per timestamp, with p = CHAINLINK_PRECISION:
+    Per timestamp, with p = precision (default CHAINLINK_PRECISION):
         chainlink > (1+p)*ema  ->  chainlink / (1+p)
         chainlink < (1-p)*ema  ->  chainlink / (1-p)
         otherwise              ->  ema
@@ -61,7 +68,7 @@ def model_price(ema_binance: np.ndarray, chainlink: np.ndarray) -> np.ndarray:
 
     Vectorized over the candle grid (inputs/output are same-shape arrays); also
     works on scalars."""
-    p = CHAINLINK_PRECISION
+    p = CHAINLINK_PRECISION if precision is None else precision
     ema = np.asarray(ema_binance, dtype=np.float64)
     cl = np.asarray(chainlink, dtype=np.float64)
     return np.select(
@@ -75,15 +82,9 @@ def ema_time_constant(x: np.ndarray, dt: float, tau: float) -> np.ndarray:
     """EMA with a continuous-time 1/e constant `tau`, sampled every `dt` secs.
 
     alpha = 1 - exp(-dt/tau) makes the discrete EMA match the continuous decay
-    exp(-t/tau), independent of the sampling interval."""
-    alpha = 1.0 - np.exp(-dt / tau)
-    one_minus = 1.0 - alpha
-    out = np.empty_like(x)
-    acc = x[0]
-    for i in range(x.size):
-        acc = alpha * x[i] + one_minus * acc
-        out[i] = acc
-    return out
+    exp(-t/tau), independent of the sampling interval. Vectorized IIR kernel
+    from filters.py, so re-running with another --tau is milliseconds."""
+    return ema_tau(x, tau, dt=dt)
 
 
 def chainlink_on_grid(ts_grid: np.ndarray, ts_o: np.ndarray, px_o: np.ndarray):
@@ -92,10 +93,7 @@ def chainlink_on_grid(ts_grid: np.ndarray, ts_o: np.ndarray, px_o: np.ndarray):
     Returns (chainlink_price_per_minute, n_leading_clamped). For minutes before
     the first oracle round (the ~47-min edge at the series start), there is no
     prior value, so we clamp to the first oracle price and report how many."""
-    idx = np.searchsorted(ts_o, ts_grid, side="right") - 1
-    n_lead = int((idx < 0).sum())
-    idx = np.clip(idx, 0, ts_o.size - 1)
-    return px_o[idx], n_lead
+    return asof_join(ts_o, px_o, ts_grid, mode="step", leading="clamp")
 
 
 def main() -> int:
@@ -165,7 +163,8 @@ def main() -> int:
 
     # Reuse LazyPlot: "real" slot = Binance spot; EMA and model ride along as
     # extra dense series (all share the candle x-grid).
-    lazy = LazyPlot(ax, xc, close, line_real, xo=None,
+    close_pyr = MinMaxPyramid.cached(close, cache_dir(args.candles, "candles"), "c")
+    lazy = LazyPlot(ax, xc, close_pyr, line_real, xo=None,
                     extra=[(cl_grid, line_cl), (ema_b, line_ema),
                            (model, line_model)])
     ax.callbacks.connect("xlim_changed", lazy.redraw)
@@ -10,9 +10,14 @@ band threshold. Per timestamp, with f = POOL_FEE:
 
 Inputs (over the pool's lifespan, same window):
   * pool_oracle_scale.csv(.xz)  — per-block price_oracle/price_scale + time
-                                   (from fetch_pool_oracle.py)
-  * chainlink_pool_window.csv(.xz) — Chainlink BTC/USD rounds, forward-filled
-                                   onto the pool block grid (from fetch_chainlink.py)
+                                   (from fetch_pool_oracle.py; its
+                                   pool_oracle_scale/ column store works too)
+  * chainlink_pool_window.csv(.xz) — Chainlink BTC/USD rounds over the pool
+                                   window (from fetch_chainlink.py), raw rounds
+
+Chainlink is forward-filled onto the pool block grid and clamped in one
+chunked pass (band.py), which also reports the branch shares and deviations;
+--stats prints just those without building the plot series.
 
 Three lines, all viewport-decimated / lazily redrawn on zoom:
   price_oracle (red), Chainlink (gray), model (black).
@@ -21,17 +26,19 @@ Usage
 -----
     uv run python plot_pool_model.py
     uv run python plot_pool_model.py --fee 0.01 --save pool_model.png
+    uv run python plot_pool_model.py --stats --fee 0.005
 """
 from __future__ import annotations
 
 import argparse
-import csv
-import lzma
 from pathlib import Path
 
 import numpy as np
 
-from plot_chainlink_vs_price import CACHE, LazyPlot, load_oracle
+from band import band_model
+from colstore import cache_dir, pool_columns
+from plot_chainlink_vs_price import LazyPlot, load_oracle
+from pyramid import MinMaxPyramid
 
 HERE = Path(__file__).resolve().parent
 DEFAULT_POOL = HERE / "pool_oracle_scale.csv.xz"
@@ -41,38 +48,11 @@ DEFAULT_CHAINLINK = HERE / "chainlink_pool_window.csv.xz"
 POOL_FEE = 0.01
 
 
-def model_price(price_oracle: np.ndarray, chainlink: np.ndarray,
-                fee: float) -> np.ndarray:
-    """Clamp Chainlink to the edge of the +/-fee band around price_oracle, and
-    fall back to price_oracle inside the band. Vectorized."""
-    po = np.asarray(price_oracle, dtype=np.float64)
-    cl = np.asarray(chainlink, dtype=np.float64)
-    return np.select(
-        [cl > (1 + fee) * po, cl < (1 - fee) * po],
-        [cl / (1 + fee), cl / (1 - fee)],
-        default=po,
-    )
-
-
 def load_pool(path: Path):
-    """Return (timestamp, price_oracle, price_scale) float64 arrays. Cached."""
-    CACHE.mkdir(exist_ok=True)
-    cache_f = CACHE / f"pool_{path.stem}_{int(path.stat().st_mtime)}.npz"
-    if cache_f.exists():
-        d = np.load(cache_f)
-        return d["ts"], d["po"], d["ps"]
-    op = lzma.open(path, "rt") if path.suffix == ".xz" else open(path)
-    ts, po, ps = [], [], []
-    with op as fh:
-        for row in csv.DictReader(fh):
-            ts.append(float(row["timestamp"]))
-            po.append(float(row["price_oracle"]))
-            ps.append(float(row["price_scale"]))
-    ts = np.asarray(ts, dtype=np.float64)
-    po = np.asarray(po, dtype=np.float64)
-    ps = np.asarray(ps, dtype=np.float64)
-    np.savez(cache_f, ts=ts, po=po, ps=ps)
-    return ts, po, ps
+    """Return (timestamp, price_oracle, price_scale) float64 arrays, memory-
+    mapped from the column cache (colstore.py)."""
+    cols = pool_columns(path)
+    return cols["ts"], cols["po"], cols["ps"]
 
 
 def main() -> int:
@@ -82,20 +62,12 @@ def main() -> int:
     ap.add_argument("--chainlink", type=Path, default=DEFAULT_CHAINLINK)
     ap.add_argument("--fee", type=float, default=POOL_FEE,
                     help=f"precision band / pool fee (default {POOL_FEE})")
+    ap.add_argument("--stats", action="store_true",
+                    help="print the model statistics only, no plot")
     ap.add_argument("--save", type=Path, default=None)
     ap.add_argument("--width", type=int, default=2400)
     args = ap.parse_args()
 
-    import matplotlib
-    if args.save is not None:
-        matplotlib.use("Agg")
-    else:
-        matplotlib.use("QtAgg")
-    import matplotlib.dates as mdates
-    import matplotlib.pyplot as plt
-
-    epoch = mdates.date2num(np.datetime64("1970-01-01T00:00:00"))
-
     print(f"loading pool      {args.pool.name} …", flush=True)
     ts_p, po, _ps = load_pool(args.pool)
     print(f"loading chainlink {args.chainlink.name} …", flush=True)
@@ -103,20 +75,25 @@ def main() -> int:
     print(f"pool samples: {ts_p.size:,}   chainlink rounds: {ts_o.size:,}",
           flush=True)
 
-    # Forward-fill Chainlink onto the pool block grid (as-of join on time).
-    idx = np.searchsorted(ts_o, ts_p, side="right") - 1
-    n_lead = int((idx < 0).sum())
-    idx = np.clip(idx, 0, ts_o.size - 1)
-    cl_grid = px_o[idx]
-    if n_lead:
-        print(f"note: {n_lead} leading pool sample(s) before first Chainlink "
+    # Forward-fill Chainlink onto the pool block grid and clamp, one pass.
+    model, cl_grid, st = band_model(ts_p, po, ts_o, px_o, args.fee,
+                                    series=not args.stats)
+    if st.n_lead:
+        print(f"note: {st.n_lead} leading pool sample(s) before first Chainlink "
               f"round clamped to first price {px_o[0]:,.2f}", flush=True)
+    print(st.summary(args.fee), flush=True)
+    if args.stats:
+        return 0
 
-    model = model_price(po, cl_grid, args.fee)
-    above = float((cl_grid > (1 + args.fee) * po).mean())
-    below = float((cl_grid < (1 - args.fee) * po).mean())
-    print(f"model branches: above={above*100:.2f}%  below={below*100:.2f}%  "
-          f"in-band(=price_oracle)={ (1-above-below)*100:.2f}%", flush=True)
+    import matplotlib
+    if args.save is not None:
+        matplotlib.use("Agg")
+    else:
+        matplotlib.use("QtAgg")
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+
+    epoch = mdates.date2num(np.datetime64("1970-01-01T00:00:00"))
 
     xc = epoch + ts_p / 86400.0
 
@@ -140,7 +117,8 @@ def main() -> int:
     ax.legend(loc="upper left")
 
     # price_oracle is the primary dense series; Chainlink + model ride along.
-    lazy = LazyPlot(ax, xc, po, line_oracle, xo=None,
+    po_pyr = MinMaxPyramid.cached(po, cache_dir(args.pool, "pool"), "po")
+    lazy = LazyPlot(ax, xc, po_pyr, line_oracle, xo=None,
                     extra=[(cl_grid, line_cl), (model, line_model)])
     ax.callbacks.connect("xlim_changed", lazy.redraw)
     fig.canvas.mpl_connect("resize_event", lazy.redraw)
@@ -0,0 +1,160 @@
+"""Appendable binary column store for fetch_pool_oracle.py output.
+
+A CSV of the pool's whole lifetime (~1.78M rows) has to be rewritten from
+scratch on every run and formats a datetime string per row. The store is a
+directory of flat little-endian column files plus a small meta.json; the
+column set is recorded there ("columns": name -> u32 | f64 | u256) and
+defaults to the fetch_pool_oracle.py layout:
+
+    <dir>/meta.json     {"version", "columns", ...writer's own keys}
+    <dir>/block.u32     uint32 block number
+    <dir>/ts.u32        uint32 block timestamp (unix s)
+    <dir>/po.f64        float64 price_oracle / 1e18
+    <dir>/ps.f64        float64 price_scale  / 1e18
+    <dir>/po_raw.u256   32-byte big-endian raw price_oracle()
+    <dir>/ps_raw.u256   32-byte big-endian raw price_scale()
+
+Rows are appended batch by batch (plain `ab` writes), so an interrupted run
+keeps everything fetched so far and a later run resumes after `last_block`.
+Every open truncates all columns to the shortest one, dropping a half-written
+last batch. Reading is np.memmap per column (no parse); human-readable
+datetimes only appear in `export_csv`.
+
+In --mode events the raw columns hold the reconstructed value rounded to wad
+(exact at change-point blocks, within float rounding elsewhere).
+
+fetch_yb_pools.py uses the same store with per-pool float columns; a column
+added to an existing store (a new market) is back-filled with NaN.
+"""
+from __future__ import annotations
+
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+
+VERSION = 1
+# file extension -> (numpy dtype, bytes per row); u256 columns are (n, 32) uint8
+TYPES = {"u32": ("<u4", 4), "f64": ("<f8", 8), "u256": ("u1", 32)}
+# fetch_pool_oracle.py layout
+COLUMNS = {"block": "u32", "ts": "u32", "po": "f64", "ps": "f64",
+           "po_raw": "u256", "ps_raw": "u256"}
+# the CSV names of the fetch_pool_oracle.py columns
+CSV_NAMES = {"block": "block_number", "ts": "timestamp", "po": "price_oracle",
+             "ps": "price_scale"}
+
+
+def is_store(path: Path) -> bool:
+    return (Path(path) / "meta.json").exists()
+
+
+class PoolStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        if self.meta.get("version") != VERSION:
+            raise ValueError(f"{self.path}: store version {self.meta.get('version')}"
+                             f" != {VERSION}")
+        self.columns = self.meta.get("columns", COLUMNS)
+        self._repair()
+
+    def _file(self, name: str) -> Path:
+        return self.path / f"{name}.{self.columns[name]}"
+
+    @classmethod
+    def create(cls, path: Path, columns: dict[str, str] | None = None,
+               **meta) -> "PoolStore":
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        columns = dict(columns or COLUMNS)
+        for name, ext in columns.items():
+            (path / f"{name}.{ext}").touch()
+        (path / "meta.json").write_text(json.dumps(
+            {"version": VERSION, "columns": columns, **meta}, indent=1))
+        return cls(path)
+
+    def add_column(self, name: str, ext: str = "f64") -> None:
+        """New column, back-filled with NaN (f64) or zeros for existing rows."""
+        dtype, w = TYPES[ext]
+        fill = np.full(self.n, np.nan, dtype) if ext == "f64" \
+            else np.zeros(self.n * w // np.dtype(dtype).itemsize, dtype)
+        (self.path / f"{name}.{ext}").write_bytes(fill.tobytes())
+        self.columns[name] = ext
+        self.meta["columns"] = self.columns
+        (self.path / "meta.json").write_text(json.dumps(self.meta, indent=1))
+
+    def _repair(self) -> None:
+        """Truncate every column to the shortest complete row count."""
+        widths = {n: TYPES[ext][1] for n, ext in self.columns.items()}
+        self.n = min(self._file(n).stat().st_size // w for n, w in widths.items())
+        for name, w in widths.items():
+            f = self._file(name)
+            if f.stat().st_size != self.n * w:
+                with open(f, "r+b") as fh:
+                    fh.truncate(self.n * w)
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def last_block(self) -> int | None:
+        if not self.n:
+            return None
+        with open(self._file("block"), "rb") as fh:
+            fh.seek((self.n - 1) * 4)
+            return int(np.frombuffer(fh.read(4), "<u4")[0])
+
+    def append(self, cols: dict) -> None:
+        """Append one batch: every column, as arrays (u256: lists of int)."""
+        if set(cols) != set(self.columns):
+            raise ValueError(f"columns {sorted(cols)} != store {sorted(self.columns)}")
+        block = cols["block"]
+        n = len(block)
+        if not n:
+            return
+        last = self.last_block
+        if last is not None and block[0] <= last:
+            raise ValueError(f"block {block[0]} <= stored last block {last}")
+        # block last: a crash mid-batch leaves it short, so _repair drops the
+        # whole partial batch
+        for name in (*[c for c in self.columns if c != "block"], "block"):
+            ext = self.columns[name]
+            if ext == "u256":
+                data = b"".join(v.to_bytes(32, "big") for v in cols[name])
+            else:
+                data = np.asarray(cols[name], dtype=TYPES[ext][0]).tobytes()
+            with open(self._file(name), "ab") as fh:
+                fh.write(data)
+        self.n += n
+
+    def column(self, name: str) -> np.ndarray:
+        """Read-only memmap of one column ((n, 32) uint8 for u256 columns)."""
+        ext = self.columns[name]
+        dtype = TYPES[ext][0]
+        shape = (self.n, 32) if ext == "u256" else (self.n,)
+        if not self.n:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape)
+
+    def export_csv(self, out: Path, chunk: int = 1 << 16) -> int:
+        """Write every non-u256 column as CSV, with a datetime_utc column
+        derived from ts (for the default layout: the old fetch_pool_oracle
+        CSV)."""
+        names = [c for c, ext in self.columns.items() if ext != "u256"]
+        cols = [self.column(c) for c in names]
+        t = self.column("ts")
+        header = [CSV_NAMES.get(c, c) for c in names]
+        header.insert(names.index("ts") + 1, "datetime_utc")
+        with open(out, "w", newline="") as fh:
+            w = csv.writer(fh)
+            w.writerow(header)
+            for s in range(0, self.n, chunk):
+                e = min(s + chunk, self.n)
+                parts = [c[s:e].tolist() for c in cols]
+                iso = (np.asarray(t[s:e], dtype="datetime64[s]")
+                       .astype(str).astype(object) + "+00:00")
+                parts.insert(names.index("ts") + 1, iso)
+                w.writerows(zip(*parts))
+        return self.n
+
@@ -0,0 +1,125 @@
+"""Multi-resolution min/max pyramid for viewport decimation.
+
+`minmax_decimate` (plot_chainlink_vs_price.py) reduces the whole visible slice
+on every redraw, so a wide view scans ~1M points per line per zoom/pan event.
+The pyramid does that work once: level k holds the min and the max of every
+aligned block of 2**k raw points (level 0 is the raw series itself), each level
+built from the one below by a pairwise reduction, ~2x the series in total.
+
+A redraw of [i0, i1) at n_px pixels picks the deepest level whose blocks are
+still no wider than one pixel bucket (2**k <= (i1-i0)/n_px), so the view spans
+between n_px and 2*n_px blocks at that level, and reduces just those into the
+n_px buckets. Cost is O(pixels) at any zoom. Buckets are unions of whole
+blocks, so the visible envelope (every spike) is preserved exactly as with the
+flat decimation; bucket edges may shift by up to one block.
+
+Pyramids can be persisted as two flat .npy files (all levels >= 1
+concatenated) and memory-mapped back, for static series such as candle closes.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+# Stop adding levels once a level is this short.
+MIN_LEVEL_SIZE = 2
+
+
+def _halve(a: np.ndarray, op) -> np.ndarray:
+    n = a.size
+    out = op(a[0:n - n % 2:2], a[1:n:2])
+    if n % 2:
+        out = np.append(out, a[-1:])
+    return out
+
+
+class MinMaxPyramid:
+    """Per-level block minima / maxima of a dense 1-D series `y`."""
+
+    def __init__(self, y: np.ndarray, lo: list[np.ndarray], hi: list[np.ndarray]):
+        self.y = y
+        self.lo = [y, *lo]  # lo[k], hi[k]: level k, blocks of 2**k points
+        self.hi = [y, *hi]
+
+    @classmethod
+    def build(cls, y: np.ndarray) -> "MinMaxPyramid":
+        y = np.asarray(y)
+        lo, hi = [], []
+        a, b = y, y
+        while a.size > MIN_LEVEL_SIZE:
+            a = _halve(a, np.minimum)
+            b = _halve(b, np.maximum)
+            lo.append(a)
+            hi.append(b)
+        return cls(y, lo, hi)
+
+    @classmethod
+    def of(cls, y) -> "MinMaxPyramid":
+        """`y` itself if it already is a pyramid, else a freshly built one."""
+        return y if isinstance(y, cls) else cls.build(y)
+
+    @property
+    def size(self) -> int:
+        return self.y.size
+
+    def save(self, d: Path, name: str) -> None:
+        d.mkdir(parents=True, exist_ok=True)
+        np.save(d / f"{name}.pyr_lo.npy", np.concatenate(self.lo[1:] or [self.y[:0]]))
+        np.save(d / f"{name}.pyr_hi.npy", np.concatenate(self.hi[1:] or [self.y[:0]]))
+
+    @classmethod
+    def load(cls, y: np.ndarray, d: Path, name: str) -> "MinMaxPyramid | None":
+        """Memory-map a saved pyramid for `y`; None if missing or mismatched."""
+        f_lo, f_hi = d / f"{name}.pyr_lo.npy", d / f"{name}.pyr_hi.npy"
+        if not (f_lo.exists() and f_hi.exists()):
+            return None
+        flat_lo = np.load(f_lo, mmap_mode="r")
+        flat_hi = np.load(f_hi, mmap_mode="r")
+        sizes, n = [], y.size
+        while n > MIN_LEVEL_SIZE:
+            n = (n + 1) // 2
+            sizes.append(n)
+        if flat_lo.size != sum(sizes) or flat_hi.size != flat_lo.size:
+            return None
+        lo, hi, off = [], [], 0
+        for s in sizes:
+            lo.append(flat_lo[off:off + s])
+            hi.append(flat_hi[off:off + s])
+            off += s
+        return cls(y, lo, hi)
+
+    @classmethod
+    def cached(cls, y: np.ndarray, d: Path, name: str) -> "MinMaxPyramid":
+        """Load the persisted pyramid of `y` from `d`, building it on a miss.
+        `d` must be specific to the data (e.g. a colstore cache directory)."""
+        pyr = cls.load(y, d, name)
+        if pyr is None:
+            pyr = cls.build(y)
+            pyr.save(d, name)
+        return pyr
+
+    def decimate(self, x: np.ndarray, i0: int, i1: int, n_px: int):
+        """(min, max) pairs per ~pixel bucket over raw indices [i0, i1).
+
+        Same output layout as `minmax_decimate`: x of each bucket's first point
+        repeated twice, y alternating min, max. Returns the raw slice when it
+        already fits the 2*n_px point budget."""
+        n_px = max(n_px, 2)
+        m = i1 - i0
+        if m <= 2 * n_px:
+            return x[i0:i1], self.y[i0:i1]
+        k = min(int(np.log2(m / n_px)), len(self.lo) - 1)
+        j0 = i0 >> k
+        j1 = min((i1 + (1 << k) - 1) >> k, self.lo[k].size)
+        # j1 - j0 >= n_px blocks, so the bucket starts are strictly increasing
+        n_px = min(n_px, j1 - j0)
+        starts = np.linspace(j0, j1, n_px + 1).astype(np.int64)[:-1]
+        ymin = np.minimum.reduceat(self.lo[k][j0:j1], starts - j0)
+        ymax = np.maximum.reduceat(self.hi[k][j0:j1], starts - j0)
+        xs = x[np.minimum(starts << k, x.size - 1)]
+        xout = np.repeat(xs, 2)
+        yout = np.empty(xs.size * 2, dtype=ymin.dtype)
+        yout[0::2] = ymin
+        yout[1::2] = ymax
+        return xout, yout
@@ -0,0 +1,268 @@
+"""Headless batch renderer for the chainlink plot family.
+
+plot_chainlink_vs_price.py, plot_model_vs_price.py and plot_pool_model.py each
+load, derive and decimate their data for ONE --save PNG per run. This script
+renders a whole list of jobs
+
+    (series set, time window, width)
+
+in a process pool. The dataset is prepared once in the parent: inputs come
+memory-mapped from the column cache (colstore.py), derived dense series (EMA,
+Chainlink on the candle / pool grid, model) are written there too, and every
+dense series gets its persisted min/max pyramid (pyramid.py). Workers only
+memory-map all of that (shared page cache, nothing pickled) and decimate each
+window straight off the pyramids, O(pixels) per series and job.
+
+Series sets
+-----------
+  price   Binance close + Chainlink step        (plot_chainlink_vs_price.py)
+  model   close, Chainlink on grid, EMA, model  (plot_model_vs_price.py)
+  pool    price_oracle, Chainlink on grid, model with the pool fee band
+          (plot_pool_model.py; skipped when --pool does not exist)
+
+Jobs
+----
+Without --job, the standard report set: each series set over the full range,
+the 2024-08 crash zoom (2024-08-04 .. 2024-08-08) for price and model, and one
+price and one model panel per calendar month. --job SET:START:END[:WIDTH]
+(ISO dates, empty = data edge) replaces it and may be repeated.
+
+Usage
+-----
+    uv run python render_batch.py
+    uv run python render_batch.py --job model:2024-08-04:2024-08-08:3000
+    uv run python render_batch.py --job price:: --job pool:: --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from band import band_model
+from colstore import CACHE, cache_dir, open_columns, write_columns
+from plot_chainlink_vs_price import DEFAULT_CANDLES, DEFAULT_ORACLE, load_candles, load_oracle
+from plot_model_vs_price import (EMA_TAU_SECONDS, CHAINLINK_PRECISION,
+                                 chainlink_on_grid, ema_time_constant, model_price)
+from plot_pool_model import DEFAULT_CHAINLINK, DEFAULT_POOL, POOL_FEE, load_pool
+from pyramid import MinMaxPyramid
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_OUT = HERE / "report"
+DEFAULT_WIDTH = 2400
+CRASH_WINDOW = ("2024-08-04", "2024-08-08")
+SETS = ("price", "model", "pool")
+
+
+@dataclass(frozen=True)
+class Job:
+    set: str
+    t0: float | None  # unix seconds, None = data start
+    t1: float | None  # unix seconds, None = data end
+    width: int
+    name: str
+
+
+def _unix(day: str) -> float | None:
+    return float(np.datetime64(day, "s").astype(np.int64)) if day else None
+
+
+def parse_job(spec: str) -> Job:
+    parts = spec.split(":")
+    if len(parts) not in (3, 4) or parts[0] not in SETS:
+        raise argparse.ArgumentTypeError(
+            f"bad job {spec!r}: want SET:START:END[:WIDTH], SET in {SETS}")
+    width = int(parts[3]) if len(parts) == 4 and parts[3] else DEFAULT_WIDTH
+    name = f"{parts[0]}_{parts[1] or 'start'}_{parts[2] or 'end'}"
+    return Job(parts[0], _unix(parts[1]), _unix(parts[2]), width, name)
+
+
+def report_jobs(ts_c: np.ndarray, with_pool: bool) -> list[Job]:
+    """Full range per set, the 2024-08 crash zoom, monthly price/model panels."""
+    jobs = [Job(s, None, None, DEFAULT_WIDTH, f"{s}_full")
+            for s in SETS if s != "pool" or with_pool]
+    c0, c1 = _unix(CRASH_WINDOW[0]), _unix(CRASH_WINDOW[1])
+    if ts_c[0] < c1 and ts_c[-1] > c0:
+        jobs += [Job(s, c0, c1, DEFAULT_WIDTH, f"{s}_crash_2024-08")
+                 for s in ("price", "model")]
+    m = np.datetime64(int(ts_c[0]), "s").astype("datetime64[M]")
+    last = np.datetime64(int(ts_c[-1]), "s").astype("datetime64[M]")
+    while m <= last:
+        t0 = float(m.astype("datetime64[s]").astype(np.int64))
+        t1 = float((m + 1).astype("datetime64[s]").astype(np.int64))
+        jobs += [Job(s, t0, t1, DEFAULT_WIDTH, f"{s}_{m}") for s in ("price", "model")]
+        m += 1
+    return jobs
+
+
+# ---------------------------------------------------------------------------
+# dataset: prepared once in the parent, memory-mapped by every worker
+
+def _derived(d: Path, names, compute) -> dict[str, np.ndarray]:
+    cols = open_columns(d, names)
+    if cols is None:
+        write_columns(d, compute())
+        cols = open_columns(d, names)
+    return cols
+
+
+def prepare(args) -> dict:
+    """Build (or open) every dense series + pyramid; returns the dataset dict
+    (memmaps only). Called in the parent, then again in each worker where it
+    is all cache hits."""
+    ts_c, close = load_candles(args.candles)
+    ts_o, px_o = load_oracle(args.oracle)
+    cdir = cache_dir(args.candles, "candles")
+    odir = cache_dir(args.oracle, "oracle")
+    ds = {"ts_c": ts_c, "ts_o": ts_o, "px_o": px_o, "pyr": {}}
+    ds["pyr"]["close"] = MinMaxPyramid.cached(close, cdir, "c")
+
+    def model_cols():
+        dt = float(np.median(np.diff(ts_c[:10_000])))
+        ema_b = ema_time_constant(close, dt, args.tau)
+        cl, _ = chainlink_on_grid(ts_c, ts_o, px_o)
+        return {"ema": ema_b, "cl": cl,
+                "model": model_price(ema_b, cl, args.precision)}
+    ddir = CACHE / f"render_{cdir.name}_{odir.name}_tau{args.tau:g}_p{args.precision:g}"
+    for n, a in _derived(ddir, ("ema", "cl", "model"), model_cols).items():
+        ds["pyr"][n] = MinMaxPyramid.cached(a, ddir, n)
+
+    if args.pool.exists():
+        ts_p, po, _ps = load_pool(args.pool)
+        ts_w, px_w = load_oracle(args.chainlink)
+        pdir = cache_dir(args.pool, "pool")
+
+        def pool_cols():
+            model, cl, _st = band_model(ts_p, po, ts_w, px_w, args.fee)
+            return {"cl": cl, "model": model}
+        wdir = cache_dir(args.chainlink, "oracle")
+        ddir = CACHE / f"render_{pdir.name}_{wdir.name}_fee{args.fee:g}"
+        ds["ts_p"] = ts_p
+        ds["pyr"]["po"] = MinMaxPyramid.cached(po, pdir, "po")
+        for n, a in _derived(ddir, ("cl", "model"), pool_cols).items():
+            ds["pyr"][f"pool_{n}"] = MinMaxPyramid.cached(a, ddir, n)
+    return ds
+
+
+_DS: dict = {}
+_ARGS = None
+
+
+def _init(args) -> None:
+    global _ARGS
+    import matplotlib
+    matplotlib.use("Agg")
+    _ARGS = args
+    _DS.update(prepare(args))
+
+
+# per set: (x-grid key, [(pyramid key, label, line style), ...])
+SERIES = {
+    "price": ("ts_c", [("close", "BTC/USDT 1m close (real)",
+                        dict(lw=1.2, color="steelblue", alpha=0.9))]),
+    "model": ("ts_c", [("close", "Binance 1m close (real)",
+                        dict(lw=1.2, color="steelblue", alpha=0.9)),
+                       ("cl", "Chainlink price (on grid)",
+                        dict(lw=1.2, color="gray", alpha=0.8)),
+                       ("ema", "EMA of Binance", dict(lw=1.2, color="red")),
+                       ("model", "model price", dict(lw=1.2, color="black", zorder=4))]),
+    "pool": ("ts_p", [("po", "pool price_oracle()", dict(lw=1.2, color="red")),
+                      ("pool_cl", "Chainlink price (on grid)",
+                       dict(lw=1.2, color="gray", alpha=0.8)),
+                      ("pool_model", "model price",
+                       dict(lw=1.2, color="black", zorder=4))]),
+}
+TITLES = {
+    "price": "Real BTC price vs Chainlink BTC/USD oracle",
+    "model": "Real Binance price vs model price",
+    "pool": "crvUSD/cbBTC pool: model vs Chainlink vs price_oracle",
+}
+
+
+def render(job: Job) -> str:
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+
+    grid_key, series = SERIES[job.set]
+    ts = _DS[grid_key]
+    i0 = 0 if job.t0 is None else int(np.searchsorted(ts, job.t0, "left"))
+    i1 = ts.size if job.t1 is None else int(np.searchsorted(ts, job.t1, "right"))
+    if i1 - i0 < 2:
+        return f"{job.name}: no data in window, skipped"
+    epoch = mdates.date2num(np.datetime64("1970-01-01T00:00:00"))
+    x = epoch + np.asarray(ts[i0:i1]) / 86400.0
+
+    fig, ax = plt.subplots(figsize=(15, 7))
+    ylo, yhi = np.inf, -np.inf
+    for key, label, style in series:
+        td, yd = _DS["pyr"][key].decimate(ts, i0, i1, job.width)
+        ax.plot(epoch + np.asarray(td) / 86400.0, yd, label=label, **style)
+        if yd.size:
+            ylo, yhi = min(ylo, float(yd.min())), max(yhi, float(yd.max()))
+    if job.set == "price":
+        ts_o, px_o = _DS["ts_o"], _DS["px_o"]
+        j0 = max(int(np.searchsorted(ts_o, ts[i0], "right")) - 1, 0)
+        j1 = int(np.searchsorted(ts_o, ts[i1 - 1], "right"))
+        seg = np.asarray(px_o[j0:j1])
+        ax.step(epoch + np.asarray(ts_o[j0:j1]) / 86400.0, seg, where="post",
+                lw=1.2, color="crimson", zorder=3,
+                label="Chainlink BTC/USD (on-chain, step)")
+        if seg.size:
+            ylo, yhi = min(ylo, float(seg.min())), max(yhi, float(seg.max()))
+
+    ax.set_xlim(x[0], x[-1])
+    if np.isfinite(ylo) and yhi > ylo:
+        pad = (yhi - ylo) * 0.05
+        ax.set_ylim(ylo - pad, yhi + pad)
+    loc = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(loc)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(loc))
+    ax.set_ylabel("BTC price (USD)")
+    ax.set_title(TITLES[job.set])
+    ax.grid(True, alpha=0.3)
+    ax.legend(loc="upper left")
+    fig.tight_layout()
+    out = _ARGS.out / f"{job.name}.png"
+    fig.savefig(out, dpi=job.width / 15)  # fig is 15in wide
+    plt.close(fig)
+    return f"{job.name}: {out.name}"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candles", type=Path, default=DEFAULT_CANDLES)
+    ap.add_argument("--oracle", type=Path, default=DEFAULT_ORACLE)
+    ap.add_argument("--pool", type=Path, default=DEFAULT_POOL)
+    ap.add_argument("--chainlink", type=Path, default=DEFAULT_CHAINLINK,
+                    help="Chainlink rounds over the pool window")
+    ap.add_argument("--tau", type=float, default=EMA_TAU_SECONDS)
+    ap.add_argument("--precision", type=float, default=CHAINLINK_PRECISION)
+    ap.add_argument("--fee", type=float, default=POOL_FEE)
+    ap.add_argument("--job", type=parse_job, action="append", default=None,
+                    metavar="SET:START:END[:WIDTH]")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUT)
+    args = ap.parse_args()
+    if args.job and any(j.set == "pool" for j in args.job) and not args.pool.exists():
+        raise SystemExit(f"pool jobs need {args.pool}")
+
+    print("preparing dataset (column cache, derived series, pyramids) …", flush=True)
+    ds = prepare(args)
+    jobs = args.job or report_jobs(ds["ts_c"], "ts_p" in ds)
+    args.out.mkdir(parents=True, exist_ok=True)
+    print(f"rendering {len(jobs)} image(s) with {args.workers} worker(s) "
+          f"-> {args.out}", flush=True)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init,
+                             initargs=(args,)) as ex:
+        for msg in ex.map(render, jobs):
+            print(f"  {msg}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
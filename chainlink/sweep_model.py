@@ -0,0 +1,283 @@
+"""Batch-evaluate the oracle models over a (tau, precision, fee) grid.
+
+plot_model_vs_price.py shows ONE (EMA tau, Chainlink precision) model per run
+and plot_pool_model.py ONE pool fee band. This script scores the whole candle
+grid against the real Binance close over the full 1.08M-minute series, runs
+the pool model for every fee, and writes tables plus heatmaps, so tuning is
+one run instead of hundreds of interactive ones.
+
+For every grid point the model is exactly plot_model_vs_price.model_price:
+    model = band-clamp(EMA_tau(close), chainlink on the candle grid, precision)
+and with r = model / close - 1 the statistics are
+    rmse_bps      sqrt(mean r^2), in basis points
+    max_dev_bps   max |r|
+    outside       fraction of minutes with |r| > fee, i.e. where the model is
+                  off the real price by more than the pool fee would absorb
+                  (fee only enters here, so the fee axis is nearly free)
+    lag_min       shift s (minutes, 0..--max-lag) minimizing the RMSE of
+                  model[t] vs close[t - s], on every --lag-stride'th minute
+    above, below  fraction of minutes on each clamped branch of the model
+
+Pool model. For every fee the band model of plot_pool_model.py (pool
+price_oracle vs Chainlink, band = fee) runs over the whole pool block grid
+(band.band_model, statistics only), giving
+    above, below, inside   fraction of pool samples on each branch
+    mean_cl_dev_bps, max_cl_dev_bps   |chainlink / price_oracle - 1|
+    max_model_dev_bps      max |model / price_oracle - 1|
+
+How it is fast
+--------------
+Workers each take a chunk of taus and compute all of that chunk's EMAs as one
+filter bank (filters.ema_bank, a single pass over the closes); every precision
+and fee then reuses those EMAs. Candles and Chainlink rounds come from the
+memory-mapped column cache (colstore.py), so each worker process opens them
+without parsing or pickling ~17 MB per task. Each pool fee is one more task
+on the same pool, over the memory-mapped pool columns.
+
+Outputs (into --out, default ./sweep):
+    sweep.csv                         one row per (tau, precision, fee)
+    heat_rmse.png, heat_outside_fee<f>.png, heat_lag.png
+    pool_sweep.csv                    pool model, one row per fee
+    heat_pool_branches.png            pool model branch shares per fee
+
+Usage
+-----
+    uv run python sweep_model.py
+    uv run python sweep_model.py --taus 120,300,866,1800,3600 --precisions 0.0025,0.005,0.01
+    uv run python sweep_model.py --fees 0.001,0.003,0.01 --workers 8
+    uv run python sweep_model.py --no-pool
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from band import band_model
+from filters import ema_bank
+from plot_chainlink_vs_price import DEFAULT_CANDLES, DEFAULT_ORACLE, load_candles, load_oracle
+from plot_model_vs_price import chainlink_on_grid, model_price
+from plot_pool_model import DEFAULT_CHAINLINK as DEFAULT_POOL_CHAINLINK
+from plot_pool_model import DEFAULT_POOL, load_pool
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_OUT = HERE / "sweep"
+
+DEFAULT_TAUS = np.geomspace(60.0, 4 * 3600.0, 16)   # seconds
+DEFAULT_PRECISIONS = [0.0, 0.001, 0.0025, 0.005, 0.0075, 0.01]
+DEFAULT_FEES = [0.001, 0.002, 0.005, 0.01]
+# taus per worker task: one filter bank of this many rows x 1.08M per task
+TAUS_PER_TASK = 2
+MAX_LAG_MIN = 60
+LAG_STRIDE = 10
+
+FIELDS = ["tau_s", "precision", "fee", "rmse_bps", "max_dev_bps", "outside",
+          "lag_min", "above", "below"]
+POOL_FIELDS = ["fee", "n", "above", "below", "inside", "mean_cl_dev_bps",
+               "max_cl_dev_bps", "max_model_dev_bps"]
+
+# per-process dataset, opened once by the pool initializer
+_DATA: dict = {}
+
+
+def _init(candles: Path, oracle: Path) -> None:
+    ts_c, close = load_candles(candles)
+    ts_o, px_o = load_oracle(oracle)
+    cl_grid, _ = chainlink_on_grid(ts_c, ts_o, px_o)
+    _DATA.update(close=np.asarray(close), cl=cl_grid,
+                 dt=float(np.median(np.diff(ts_c[:10_000]))))
+
+
+def best_lag(model: np.ndarray, real: np.ndarray, max_lag: int,
+             stride: int) -> int:
+    """Shift (in samples) of `real` that best matches `model` in RMSE."""
+    idx = np.arange(max_lag, real.size, stride)
+    m = model[idx]
+    errs = [np.mean((m - real[idx - s]) ** 2) for s in range(max_lag + 1)]
+    return int(np.argmin(errs))
+
+
+def eval_chunk(taus, precisions, fees, max_lag: int = MAX_LAG_MIN,
+               lag_stride: int = LAG_STRIDE) -> list[dict]:
+    close, cl, dt = _DATA["close"], _DATA["cl"], _DATA["dt"]
+    bank = ema_bank(close, taus, dt=dt)
+    inv = 1.0 / close
+    rows = []
+    for tau, ema_b in zip(taus, bank):
+        for p in precisions:
+            model = model_price(ema_b, cl, p)
+            r = model * inv - 1.0
+            a = np.abs(r)
+            base = {
+                "tau_s": float(tau), "precision": float(p),
+                "rmse_bps": float(np.sqrt(np.mean(r * r))) * 1e4,
+                "max_dev_bps": float(a.max()) * 1e4,
+                "lag_min": best_lag(model, close, max_lag, lag_stride) * dt / 60.0,
+                "above": float(np.mean(cl > (1 + p) * ema_b)),
+                "below": float(np.mean(cl < (1 - p) * ema_b)),
+            }
+            for f in fees:
+                rows.append({**base, "fee": float(f),
+                             "outside": float(np.mean(a > f))})
+    return rows
+
+
+def eval_pool(pool: Path, chainlink: Path, fee: float) -> dict:
+    """plot_pool_model's band model at `fee` over the whole pool grid."""
+    ts_p, po, _ps = load_pool(pool)
+    ts_o, px_o = load_oracle(chainlink)
+    _, _, st = band_model(ts_p, po, ts_o, px_o, fee, series=False)
+    n = max(st.n, 1)
+    return {"fee": float(fee), "n": st.n, "above": st.above / n,
+            "below": st.below / n, "inside": st.inside / n,
+            "mean_cl_dev_bps": st.mean_dev * 1e4,
+            "max_cl_dev_bps": st.max_dev * 1e4,
+            "max_model_dev_bps": st.max_model_dev * 1e4}
+
+
+def _floats(s: str) -> list[float]:
+    return [float(v) for v in s.split(",") if v.strip()]
+
+
+def heatmap(path: Path, rows: list[dict], taus, precisions, key: str,
+            title: str, fee: float | None = None) -> None:
+    import matplotlib.pyplot as plt
+    grid = np.full((len(precisions), len(taus)), np.nan)
+    ti = {t: i for i, t in enumerate(taus)}
+    pi = {p: i for i, p in enumerate(precisions)}
+    for r in rows:
+        if fee is not None and r["fee"] != fee:
+            continue
+        grid[pi[r["precision"]], ti[r["tau_s"]]] = r[key]
+    fig, ax = plt.subplots(figsize=(12, 5))
+    im = ax.imshow(grid, aspect="auto", origin="lower", cmap="viridis")
+    ax.set_xticks(range(len(taus)), [f"{t:.0f}" for t in taus], rotation=45)
+    ax.set_yticks(range(len(precisions)), [f"{p*100:g}%" for p in precisions])
+    ax.set_xlabel("EMA tau (s)")
+    ax.set_ylabel("Chainlink precision band")
+    ax.set_title(title)
+    for (i, j), v in np.ndenumerate(grid):
+        if np.isfinite(v):
+            ax.text(j, i, f"{v:.3g}", ha="center", va="center", fontsize=7,
+                    color="white")
+    fig.colorbar(im, ax=ax)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def pool_heatmap(path: Path, pool_rows: list[dict]) -> None:
+    import matplotlib.pyplot as plt
+    keys = ["below", "inside", "above"]
+    grid = np.array([[100.0 * r[k] for r in pool_rows] for k in keys])
+    fig, ax = plt.subplots(figsize=(max(6, 1.2 * len(pool_rows) + 3), 3.5))
+    im = ax.imshow(grid, aspect="auto", origin="lower", cmap="viridis")
+    ax.set_xticks(range(len(pool_rows)), [f"{r['fee']*100:g}%" for r in pool_rows])
+    ax.set_yticks(range(len(keys)), keys)
+    ax.set_xlabel("pool fee band")
+    ax.set_title("pool model: % of pool samples per branch")
+    for (i, j), v in np.ndenumerate(grid):
+        ax.text(j, i, f"{v:.3g}", ha="center", va="center", fontsize=7,
+                color="white")
+    fig.colorbar(im, ax=ax)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candles", type=Path, default=DEFAULT_CANDLES)
+    ap.add_argument("--oracle", type=Path, default=DEFAULT_ORACLE)
+    ap.add_argument("--taus", type=_floats, default=list(DEFAULT_TAUS),
+                    help="comma-separated EMA tau values in seconds")
+    ap.add_argument("--precisions", type=_floats, default=DEFAULT_PRECISIONS,
+                    help="comma-separated Chainlink precision bands (fractions)")
+    ap.add_argument("--fees", type=_floats, default=DEFAULT_FEES,
+                    help="comma-separated fee bands: the 'outside' stat and "
+                         "the pool model's band")
+    ap.add_argument("--pool", type=Path, default=DEFAULT_POOL)
+    ap.add_argument("--pool-chainlink", type=Path, default=DEFAULT_POOL_CHAINLINK)
+    ap.add_argument("--no-pool", action="store_true",
+                    help="skip the pool model sweep")
+    ap.add_argument("--max-lag", type=int, default=MAX_LAG_MIN,
+                    help=f"max lag searched, in candles (default {MAX_LAG_MIN})")
+    ap.add_argument("--lag-stride", type=int, default=LAG_STRIDE)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUT)
+    args = ap.parse_args()
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+    taus = sorted(args.taus)
+    precisions = sorted(args.precisions)
+    fees = sorted(args.fees)
+    n_models = len(taus) * len(precisions)
+    print(f"grid: {len(taus)} taus x {len(precisions)} precisions x "
+          f"{len(fees)} fees = {n_models * len(fees)} points "
+          f"({n_models} model evaluations)", flush=True)
+
+    # Warm the column cache once in the parent so workers only memory-map it.
+    load_candles(args.candles)
+    load_oracle(args.oracle)
+    if not args.no_pool:
+        load_pool(args.pool)
+        load_oracle(args.pool_chainlink)
+
+    chunks = [taus[i:i + TAUS_PER_TASK] for i in range(0, len(taus), TAUS_PER_TASK)]
+    rows: list[dict] = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init,
+                             initargs=(args.candles, args.oracle)) as ex:
+        futs = [ex.submit(eval_chunk, c, precisions, fees, args.max_lag,
+                          args.lag_stride) for c in chunks]
+        pool_futs = [] if args.no_pool else [
+            ex.submit(eval_pool, args.pool, args.pool_chainlink, f) for f in fees]
+        for i, f in enumerate(futs, 1):
+            rows.extend(f.result())
+            print(f"  tau chunk {i}/{len(chunks)} done", flush=True)
+        pool_rows = [f.result() for f in pool_futs]
+
+    rows.sort(key=lambda r: (r["tau_s"], r["precision"], r["fee"]))
+    args.out.mkdir(parents=True, exist_ok=True)
+    with open(args.out / "sweep.csv", "w", newline="") as fh:
+        w = csv.DictWriter(fh, fieldnames=FIELDS)
+        w.writeheader()
+        w.writerows({k: r[k] for k in FIELDS} for r in rows)
+
+    heatmap(args.out / "heat_rmse.png", rows, taus, precisions, "rmse_bps",
+            "tracking RMSE vs Binance close (bps)", fee=fees[0])
+    heatmap(args.out / "heat_lag.png", rows, taus, precisions, "lag_min",
+            "best-fit lag (min)", fee=fees[0])
+    for f in fees:
+        heatmap(args.out / f"heat_outside_fee{f:g}.png", rows, taus, precisions,
+                "outside", f"fraction of time |model/real-1| > {f*100:g}%", fee=f)
+
+    if pool_rows:
+        with open(args.out / "pool_sweep.csv", "w", newline="") as fh:
+            w = csv.DictWriter(fh, fieldnames=POOL_FIELDS)
+            w.writeheader()
+            w.writerows(pool_rows)
+        pool_heatmap(args.out / "heat_pool_branches.png", pool_rows)
+
+    best = min(rows, key=lambda r: r["rmse_bps"])
+    print(f"\nwrote {len(rows)} rows -> {args.out / 'sweep.csv'}")
+    print(f"lowest RMSE: tau={best['tau_s']:.0f}s precision={best['precision']*100:g}% "
+          f"rmse={best['rmse_bps']:.2f}bps max={best['max_dev_bps']:.1f}bps "
+          f"lag={best['lag_min']:.0f}min")
+    if pool_rows:
+        print(f"pool model: {len(pool_rows)} fees -> {args.out / 'pool_sweep.csv'}")
+        for r in pool_rows:
+            print(f"  fee={r['fee']*100:g}%: above={r['above']*100:.2f}% "
+                  f"below={r['below']*100:.2f}% "
+                  f"max |model/po-1|={r['max_model_dev_bps']:.1f}bps")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Tabulated StableSwap portfolio value with a measured wad-error bound.
+
+V(D, p) = x0 + p * x1 scales with D, so for a fixed _amp V / D is a function
+of p alone. This module tabulates
+
+    g(u) = log(V / D),   u = log(p / WAD)
+
+on [log P_MIN, log P_MAX] as a piecewise Chebyshev interpolant of degree
+DEGREE, node values from the float kernel in stableswap_fast.py. Pieces start
+as SEGMENTS equal ones in u and are halved until the fit is resolved (the
+curvature concentrates around p = 1). Evaluating a point is one searchsorted
+over the breakpoints, DEGREE Clenshaw steps and one exp, vectorized over
+arrays of (D, p).
+
+Error estimate. Two sampled maxima are stored with the table:
+
+    err_rel    max |V_fast / V_float - 1| over DENSE + 1 points per piece
+               against the float kernel (itself within ~2e-16 of the
+               integer solver), plus one float64 ulp: the interpolation
+               error between nodes
+    err_wad    max |V_fast - V_exact| at D = WAD, in wei per WAD of V, over
+               CHECK + 1 points per piece, V_exact from the integer solver
+               (portfolio_value_exact: wad-exact get_y / get_p)
+
+build() refuses a table with err_wad > TOL_WAD. error_bound(D, V) turns the
+two into a wei bound for any D (the float64 product D * V/D is part of what
+err_wad measures). DENSE is 40x the density at which a point between
+samples was first seen above err_rel; at DENSE, err_rel is already at
+rounding level (a few ulps), and for _amp 10 .. 2e7 neither 4x denser grids
+nor 3e6 random points exceed it by more than the ulp added to it.
+
+The bound is measured, not proven. A rigorous one would need bounds on the
+high derivatives of log(V/D) over every piece (V is only implicit, through
+the invariant) and a rounding analysis of the float kernel, the Clenshaw sum
+and the final exp, all carried through interval arithmetic; with the error
+at a few ulps, the sampled maximum is the more useful number.
+
+portfolio_value_fast(D, p, _amp) uses the table for P_MIN <= p <= P_MAX and
+falls back to the exact solver outside; tables are built once per _amp
+(~0.5 s) and kept in memory. scripts/oracle_backtest.py runs its lp_price_table
+estimator through portfolio_values_fast.
+
+Usage:
+    python portfolio_value_interp.py                  # build + check A=10
+    python portfolio_value_interp.py 100000 20000000  # other _amp values
+"""
+
+import math
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from portfolio_value_solver import WAD
+from stableswap_fast import portfolio_value_exact, portfolio_values_float, solve_x1
+
+P_MIN = 1e-3
+P_MAX = 1e3
+SEGMENTS = 32        # initial uniform split of [log P_MIN, log P_MAX]
+DEGREE = 16
+CHECK = 4 * DEGREE   # integer-solver checks per segment
+DENSE = 320 * DEGREE # float-kernel checks per segment
+TOL_WAD = 5000       # wei per WAD of V
+TAIL = 1e-15         # split a piece while its last two coefficients exceed this
+MIN_WIDTH = 1e-4     # in log p
+
+
+def _cheb_nodes(n):
+    """Chebyshev points of the second kind on [-1, 1] (ends included)."""
+    return np.cos(np.pi * np.arange(n) / (n - 1))[::-1]
+
+
+def _fit(a, b, amp, degree=DEGREE):
+    """Chebyshev coefficients of log(V/D) on u in [a, b] (arrays of segments)."""
+    t = _cheb_nodes(degree + 1)
+    u = a[:, None] + (b - a)[:, None] * 0.5 * (t + 1.0)
+    g = np.log(portfolio_values_float(1.0, np.exp(u) * WAD, float(amp)))
+    V = np.polynomial.chebyshev.chebvander(t, degree)
+    return np.linalg.solve(V, g.T).T
+
+
+def _clenshaw(x, c):
+    b1 = np.zeros_like(x)
+    b2 = np.zeros_like(x)
+    for j in range(c.shape[-1] - 1, 0, -1):
+        b1, b2 = 2.0 * x * b1 - b2 + c[..., j], b1
+    return x * b1 - b2 + c[..., 0]
+
+
+def _points(edges, n):
+    """n + 1 evenly spaced u per segment (ends included), flattened."""
+    t = np.linspace(0.0, 1.0, n + 1)
+    a, b = edges[:-1, None], edges[1:, None]
+    return (a + (b - a) * t).ravel()
+
+
+class PortfolioValueTable:
+    """Piecewise Chebyshev fit of log(V/D) in log p for one _amp."""
+
+    def __init__(self, amp: int, edges: np.ndarray, coeffs: np.ndarray):
+        self.amp = amp
+        self.edges = edges    # (segments + 1,) breakpoints in u = log p
+        self.coeffs = coeffs  # (segments, DEGREE + 1)
+        self.err_wad = None
+        self.err_rel = None
+
+    @property
+    def segments(self) -> int:
+        return self.coeffs.shape[0]
+
+    @classmethod
+    def fit(cls, amp: int, p_min: float = P_MIN, p_max: float = P_MAX):
+        """
+        Fit on SEGMENTS uniform pieces, then halve every piece whose last two
+        Chebyshev coefficients exceed TAIL (not yet resolved to float64).
+        log(V/D) is analytic but curves sharply around p = 1 (more so for
+        large A), where pieces end up much narrower than in the tails.
+        """
+        edges = np.linspace(math.log(p_min), math.log(p_max), SEGMENTS + 1)
+        while True:
+            coeffs = _fit(edges[:-1], edges[1:], amp)
+            bad = np.abs(coeffs[:, -2:]).max(axis=1) > TAIL
+            bad &= np.diff(edges) > MIN_WIDTH
+            if not bad.any():
+                break
+            mid = 0.5 * (edges[:-1] + edges[1:])[bad]
+            edges = np.sort(np.concatenate([edges, mid]))
+        table = cls(amp, edges, coeffs)
+        u = np.exp(_points(edges, DENSE))
+        ref = portfolio_values_float(1.0, u * WAD, float(amp))
+        table.err_rel = float(np.max(np.abs(table.v_over_d(u) / ref - 1.0))) + np.finfo(np.float64).eps
+        return table
+
+    def in_range(self, p):
+        u = np.log(np.asarray(p, dtype=np.float64) / WAD)
+        return (u >= self.edges[0]) & (u <= self.edges[-1])
+
+    def v_over_d(self, pf):
+        """V / D for float prices pf (1.0 == balanced) inside the table."""
+        u = np.log(np.asarray(pf, dtype=np.float64))
+        k = np.clip(np.searchsorted(self.edges, u, "right") - 1, 0, self.segments - 1)
+        a, b = self.edges[k], self.edges[k + 1]
+        return np.exp(_clenshaw((2.0 * u - a - b) / (b - a), self.coeffs[k]))
+
+    def values(self, D, p):
+        """V for arrays of wad (D, p) inside the table, as float64 wad values."""
+        return np.asarray(D, dtype=np.float64) * \
+            self.v_over_d(np.asarray(p, dtype=np.float64) / WAD)
+
+    def error_bound(self, D: int, V: int) -> int:
+        """
+        Bound on |V_fast - V_exact| in wei at invariant D and value ~V,
+        from the sampled maxima err_wad / err_rel (measured, not proven).
+        """
+        per_wad = max(self.err_wad, self.err_rel * WAD)
+        return math.ceil(per_wad * max(V, D, WAD) / WAD) + 1
+
+    def measure(self):
+        """
+        err_wad: max |V_fast - V_exact| at D = WAD, in wei per WAD of V,
+        over CHECK + 1 points per segment; V_exact from the integer solver.
+        """
+        u = _points(self.edges, CHECK)
+        p_wad = [int(round(math.exp(x) * WAD)) for x in u]
+        seeds = solve_x1(np.array(p_wad, dtype=np.float64) / WAD, float(self.amp))
+        fast = self.values(WAD, np.array(p_wad, dtype=np.float64))
+        worst = 0.0
+        for q, x1, f in zip(p_wad, seeds, fast):
+            exact = portfolio_value_exact(WAD, q, self.amp, float(x1))[0]
+            worst = max(worst, abs(int(f) - exact) * WAD / max(exact, WAD))
+        self.err_wad = math.ceil(worst)
+        return self
+
+    @classmethod
+    def build(cls, amp: int, p_min: float = P_MIN, p_max: float = P_MAX):
+        """Fit and measure; raises if err_wad exceeds TOL_WAD."""
+        table = cls.fit(amp, p_min, p_max).measure()
+        if table.err_wad > TOL_WAD:
+            raise RuntimeError(f"_amp={amp}: err_wad={table.err_wad} wei > {TOL_WAD}")
+        return table
+
+
+@lru_cache(maxsize=None)
+def table_for(_amp: int) -> PortfolioValueTable:
+    return PortfolioValueTable.build(_amp)
+
+
+def portfolio_value_fast(D: int, p: int, _amp: int) -> int:
+    """V like portfolio_value, from the table; exact solver off-table."""
+    if p == WAD:
+        return D
+    table = table_for(_amp)
+    if not table.in_range(p):
+        return portfolio_value_exact(D, p, _amp)[0]
+    return int(D * float(table.v_over_d(p / WAD)))
+
+
+def portfolio_values_fast(D, p, _amp: int) -> np.ndarray:
+    """Vectorized V over arrays of wad (D, p) for one _amp, float64 wad values;
+    off-table points go through the exact solver."""
+    D, p = np.broadcast_arrays(np.asarray(D, dtype=np.float64),
+                               np.asarray(p, dtype=np.float64))
+    table = table_for(_amp)
+    ok = table.in_range(p)
+    out = np.empty(p.shape)
+    out[ok] = table.values(D[ok], p[ok])
+    for i in zip(*np.nonzero(~ok)):
+        out[i] = portfolio_value_exact(int(D[i]), int(p[i]), _amp)[0]
+    return out
+
+
+# ──────────── Check ────────────
+
+def check(amps=(200_000,)):
+    import time
+
+    ok = True
+    for amp in amps:
+        t0 = time.perf_counter()
+        table = PortfolioValueTable.build(amp)
+        t_build = time.perf_counter() - t0
+        print(f"_amp={amp:>10d}  segments={table.segments:4d} degree={DEGREE}  "
+              f"err_wad={table.err_wad} wei  err_rel={table.err_rel:.2e}  "
+              f"build {t_build:.2f}s")
+
+        rng = np.random.default_rng(1)
+        ps = [int(q * WAD) for q in np.exp(rng.uniform(math.log(P_MIN), math.log(P_MAX), 500))]
+        for D in (WAD, 37 * WAD // 10, 10**24):
+            excess = 0
+            for q in ps:
+                V = portfolio_value_exact(D, q, amp)[0]
+                err = abs(int(D * float(table.v_over_d(q / WAD))) - V)
+                excess = max(excess, err - table.error_bound(D, V))
+            ok &= excess <= 0
+            print(f"    D={D / WAD:>10g}  500 random p within bound: {excess <= 0}")
+
+        # off-table prices fall back to the exact solver
+        for q in (WAD // 10**4, 10**4 * WAD):
+            ok &= portfolio_value_fast(WAD, q, amp) == portfolio_value_exact(WAD, q, amp)[0]
+
+        n = 1_000_000
+        p_arr = np.exp(rng.uniform(math.log(P_MIN), math.log(P_MAX), n)) * WAD
+        t0 = time.perf_counter()
+        table.values(WAD, p_arr)
+        print(f"    {n:,} points: {time.perf_counter() - t0:.3f}s")
+    print("All checks passed!" if ok else "Some checks FAILED!")
+    return ok
+
+
+if __name__ == "__main__":
+    check(tuple(int(a) for a in sys.argv[1:]) or (200_000,))
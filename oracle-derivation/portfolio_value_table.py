@@ -2,9 +2,13 @@
 """
 Compute a table of StableSwap portfolio values V = x0 + p*x1
 for D=1.0, A=10, with p ranging from 0.1 to 10.0.
+
+Values come from the fast kernel (stableswap_fast.py): float seed + exact
+integer polish; iters counts the polish steps.
 """
 
-from portfolio_value_solver import portfolio_value, WAD, A_MULTIPLIER, N_COINS
+from portfolio_value_solver import WAD, A_MULTIPLIER, N_COINS
+from stableswap_fast import portfolio_value_exact
 
 D = WAD  # 1.0
 A = 10
@@ -18,7 +22,7 @@ def compute_table():
     rows = []
     for p_float in P_VALUES:
         p = int(p_float * WAD)
-        V, iters = portfolio_value(D, p, _amp)
+        V, iters = portfolio_value_exact(D, p, _amp)
         V_float = V / WAD
         rows.append((p_float, V_float, V_float, p_float**0.5, iters))
     return rows
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Fast StableSwap portfolio-value kernel.
+
+Same problem as portfolio_value_solver.portfolio_value: given D, a marginal
+price p and _amp, find V = x0 + p * x1 // WAD on the invariant where
+get_p([x0, x1]) == p. Two layers:
+
+  float   Everything scales with D, so the pool is solved at D = 1 in
+          float64, vectorized over arrays of (p, _amp):
+              x0(x1)  closed-form root of get_y's quadratic
+                      y^2 + (b - D) y - c = 0
+              p(x1)   get_p's formula, monotone decreasing in x1
+          x1 is bracketed by BISECT_STEPS halvings of log(x1/D) over
+          [-LOG_SPAN, LOG_SPAN], then finished by NEWTON_STEPS Newton steps
+          with the analytic slope below, so the whole batch is a fixed
+          number of array passes.
+
+  exact   Integer polish against the contract math: starting from the float
+          x1, Newton steps use the exact get_y / get_p ports from
+          portfolio_value_solver.py (so every evaluation is wad-exact against
+          StableswapMath.vy) and the ANALYTIC slope
+              dp/dx1 = dp/dx1|x0 - p * dp/dx0|x1
+          (along the invariant dx0/dx1 = -p), instead of two extra get_y
+          calls for a finite difference. Typically 1-3 steps from the seed.
+          Big-int arithmetic goes through gmpy2.mpz when it is installed.
+
+Unlike portfolio_value (bracket x1 in [1, D-1]), the float bracket is not
+capped at D: prices below get_p at x1 = D (x0 -> 0, x1 -> inf) are reachable.
+
+Usage:
+    python stableswap_fast.py           # cross-check vs portfolio_value
+"""
+
+import math
+
+import numpy as np
+
+from portfolio_value_solver import A_MULTIPLIER, N_COINS, WAD, get_p, get_y
+
+try:
+    from gmpy2 import mpz
+except ImportError:
+    mpz = int
+
+LOG_SPAN = 40.0
+BISECT_STEPS = 24
+NEWTON_STEPS = 3
+MAX_POLISH = 32
+# get_p is truncated integer math, so near the root it can jump by several
+# wei per x1 wei and |dp| <= 1 may not exist; stop after this many
+# non-improving steps and keep the best point (V is stationary there).
+STALL_STEPS = 3
+
+
+# ──────────── float64 kernel (D = 1, vectorized) ────────────
+
+def _ann(amp):
+    """Ann / A_MULTIPLIER as a float array."""
+    return np.asarray(amp, dtype=np.float64) * N_COINS / A_MULTIPLIER
+
+
+def x0_of_x1(x1, amp):
+    """get_y(amp, [0, x1], 1, 0) in floats: root of y^2 + (b - 1) y - c = 0."""
+    a = _ann(amp)
+    c = 1.0 / (4.0 * x1 * a)
+    B = x1 + 1.0 / a - 1.0
+    s = np.sqrt(B * B + 4.0 * c)
+    # cancellation-free branch of the quadratic formula
+    return np.where(B > 0, 2.0 * c / (B + s), (s - B) / 2.0)
+
+
+def p_of(x0, x1, amp):
+    """get_p([x0, x1], 1, [amp, 0]) in floats."""
+    a = _ann(amp)
+    r = 0.25  # D^3 / N^N at D = 1
+    return (a * x0 + r / (x1 * x1)) / (a * x0 + r / (x0 * x1))
+
+
+def dp_dx1(x0, x1, amp):
+    """Total derivative of get_p along the invariant, D = 1."""
+    a = _ann(amp)
+    r = 0.25
+    num = a * x0 + r / (x1 * x1)
+    den = a * x0 + r / (x0 * x1)
+    p = num / den
+    dnum_x0, dnum_x1 = a, -2.0 * r / (x1 ** 3)
+    dden_x0, dden_x1 = a - r / (x0 * x0 * x1), -r / (x0 * x1 * x1)
+    dp_x0 = (dnum_x0 - p * dden_x0) / den
+    dp_x1 = (dnum_x1 - p * dden_x1) / den
+    return dp_x1 - p * dp_x0
+
+
+def solve_x1(p, amp):
+    """x1 / D with get_p == p, vectorized (p as a float, 1.0 == balanced)."""
+    p = np.asarray(p, dtype=np.float64)
+    amp = np.broadcast_to(np.asarray(amp, dtype=np.float64), p.shape)
+    lo = np.full(p.shape, -LOG_SPAN)
+    hi = np.full(p.shape, LOG_SPAN)
+    for _ in range(BISECT_STEPS):
+        mid = 0.5 * (lo + hi)
+        x1 = np.exp(mid)
+        above = p_of(x0_of_x1(x1, amp), x1, amp) > p  # price falls as x1 grows
+        lo = np.where(above, mid, lo)
+        hi = np.where(above, hi, mid)
+    x1 = np.exp(0.5 * (lo + hi))
+    for _ in range(NEWTON_STEPS):
+        x0 = x0_of_x1(x1, amp)
+        x1 = np.clip(x1 - (p_of(x0, x1, amp) - p) / dp_dx1(x0, x1, amp),
+                     np.exp(lo), np.exp(hi))
+    return x1
+
+
+def portfolio_values_float(D, p, amp):
+    """V for arrays of wad-scaled (D, p) and _amp, as float64 wad values."""
+    D = np.asarray(D, dtype=np.float64)
+    pf = np.asarray(p, dtype=np.float64) / WAD
+    x1 = solve_x1(pf, amp)
+    x0 = x0_of_x1(x1, amp)
+    return D * (x0 + pf * x1)
+
+
+# ──────────── exact integer polish ────────────
+
+def portfolio_value_exact(D: int, p: int, _amp: int, x1_seed: float | None = None) -> tuple:
+    """
+    (V, iters) like portfolio_value, wad-exact get_y/get_p evaluations,
+    seeded from the float solve and stepped with the analytic slope.
+    """
+    if p == WAD:
+        return D, 0
+    if x1_seed is None:
+        x1_seed = float(solve_x1(p / WAD, _amp))
+    D, p, amp = mpz(D), mpz(p), mpz(_amp)
+    x1 = mpz(max(int(x1_seed * float(D)), 1))
+    best = None
+    iters = stall = 0
+    for _ in range(MAX_POLISH):
+        x0 = get_y(amp, [0, x1], D, 0)
+        dp = get_p([x0, x1], D, [amp, 0]) - p
+        if best is None or abs(dp) < best[0]:
+            best = (abs(dp), x0, x1)
+            stall = 0
+        else:
+            stall += 1
+        if abs(dp) <= 1 or stall >= STALL_STEPS:
+            break
+        iters += 1
+        # dp[wad] per x1[wei]: slope at D = 1 scaled by WAD / D
+        slope = float(dp_dx1(int(x0) / int(D), int(x1) / int(D), _amp)) * WAD / int(D)
+        step = mpz(round(int(dp) / slope)) if slope else mpz(0)
+        if step == 0:
+            step = mpz(1) if (dp > 0) == (slope < 0) else mpz(-1)
+        x1_new = max(x1 - step, mpz(1))
+        if x1_new == x1:
+            break
+        x1 = x1_new
+    _, x0, x1 = best
+    return int(x0 + p * x1 // WAD), iters
+
+
+def portfolio_values(D, p, _amp, exact: bool = True):
+    """
+    Batch V over broadcast arrays of (D, p, _amp). exact=False returns the
+    float64 kernel; exact=True polishes every point (list of wad ints),
+    reusing the vectorized float x1 as the seed.
+    """
+    D, p, amp = np.broadcast_arrays(np.asarray(D, dtype=object),
+                                    np.asarray(p, dtype=object),
+                                    np.asarray(_amp, dtype=object))
+    if not exact:
+        return portfolio_values_float(D.astype(np.float64), p.astype(np.float64),
+                                      amp.astype(np.float64))
+    seeds = solve_x1(p.astype(np.float64) / WAD, amp.astype(np.float64))
+    return [portfolio_value_exact(int(d), int(q), int(a), float(s))[0]
+            for d, q, a, s in zip(D.ravel(), p.ravel(), amp.ravel(), seeds.ravel())]
+
+
+# ──────────── Check ────────────
+
+def check():
+    from portfolio_value_solver import newton_D, portfolio_value
+
+    cases = [
+        (WAD, WAD, 2_000_000), (12 * WAD // 10, 8 * WAD // 10, 2_000_000),
+        (8 * WAD // 10, 12 * WAD // 10, 2_000_000), (11 * WAD // 10, 9 * WAD // 10, 20_000_000),
+        (15 * WAD // 10, 5 * WAD // 10, 2_000_000), (5 * WAD // 10, 15 * WAD // 10, 2_000_000),
+        (2 * WAD, WAD // 2, 100_000), (WAD // 2, 2 * WAD, 100_000), (3 * WAD, WAD // 3, 100_000),
+    ]
+    print(f"{'x0':>8s} {'x1':>8s} {'amp':>10s}  {'err ref':>8s} {'err fast':>8s} {'it':>3s}")
+    ok = True
+    for x0, x1, amp in cases:
+        D = newton_D(amp, [x0, x1])
+        p = get_p([x0, x1], D, [amp, 0])
+        V_exp = x0 + p * x1 // WAD
+        V_ref, _ = portfolio_value(D, p, amp)
+        V_fast, it = portfolio_value_exact(D, p, amp)
+        err = abs(V_fast - V_exp)
+        ok &= err <= 100
+        print(f"{x0 / WAD:8.4f} {x1 / WAD:8.4f} {amp:10d}  {abs(V_ref - V_exp):8d} {err:8d} {it:3d}")
+
+    # float kernel and analytic slope vs the exact solver
+    rng = np.random.default_rng(0)
+    ps = np.exp(rng.uniform(math.log(0.05), math.log(20.0), 200))
+    amps = rng.choice([100_000, 2_000_000, 20_000_000], ps.size)
+    p_wad = [int(q * WAD) for q in ps]
+    Vf = portfolio_values(WAD, p_wad, amps, exact=False)
+    Ve = np.array(portfolio_values(WAD, p_wad, amps), dtype=np.float64)
+    rel = np.max(np.abs(Vf / Ve - 1.0))
+    ok &= rel < 1e-12
+    print(f"\nfloat kernel vs exact, 200 random points: max rel err {rel:.2e}")
+    print("All checks passed!" if ok else "Some checks FAILED!")
+    return ok
+
+
+if __name__ == "__main__":
+    check()
@@ -1,9 +1,7 @@
 
-import csv
-import json
-import math
+import hashlib
+import io
 from pathlib import Path
-from datetime import datetime, timezone
 import pandas as pd
 import numpy as np
 
@@ -18,7 +16,221 @@ POOL_KEYS = ["wbtc", "tbtc", "cbbtc"]
 
 START_DATE = '2025-10-05'  # e.g., '2025-10-05' (UTC)
 
-data_dict = {}
+# Per-pool cache of parsed + derived series, next to the csvs it is built from.
+# fetch_events_data.py only ever appends rows to states.csv/events.csv, so the
+# cache remembers how many bytes of each file it has consumed and the sha256 of
+# that prefix. If the prefix still hashes the same, only the appended tail is
+# parsed; anything else (file rewritten/truncated) triggers a full rebuild.
+CACHE_NAME = "derived.npz"
+CACHE_VERSION = 1
+
+# raw states.csv column -> cached array name. All are wad-scaled ints.
+STATE_COLS = {
+    'cp.xcp_profit': 'cp_xcp_profit',
+    'amm.get_debt': 'amm_debt',
+    'amm.collateral_amount': 'amm_collateral',
+    'cp.price_scale': 'cp_price_scale',
+    'cp.price_oracle': 'cp_price_oracle',
+    'cp.lp_price': 'cp_lp_price',
+    'lt.stablecoin_allocated': 'lt_total_stables',
+}
+# virtual price column name changed between ABI versions
+VP_COLS = ['cp.get_virtual_price', 'cp.virtual_price']
+
+SERIES = [
+    'blocks', 'timestamps',
+    'amm_price_oracle', 'amm_value_oracle', 'cp_virtual_price', *STATE_COLS.values(),
+    'amm_value_oracle_adj_btc_ps', 'amm_value_oracle_adj_btc_po',
+    'pure_btc_po', 'pure_btc_ps',
+    'growth_step_po', 'growth_step_ps',
+]
+
+
+def _prefix_hash(path, nbytes):
+    h = hashlib.sha256()
+    left = nbytes
+    with path.open('rb') as f:
+        while left > 0:
+            chunk = f.read(min(left, 1 << 20))
+            if not chunk:
+                break
+            h.update(chunk)
+            left -= len(chunk)
+    return h
+
+
+def read_appended(path, nbytes=0, digest=None):
+    """Read the rows of `path` past the first `nbytes` bytes.
+
+    Returns (text, header, new_nbytes, new_digest, full). `text` is csv text
+    (header + complete new lines only, a partially written last line is left
+    for next time). `full` is True when the cached prefix no longer matches and
+    the whole file was re-read."""
+    h = None
+    if nbytes and digest and nbytes <= path.stat().st_size:
+        h = _prefix_hash(path, nbytes)
+        if h.hexdigest() != digest:
+            h = None
+    full = h is None
+    with path.open('rb') as f:
+        header = f.readline()
+        if full:
+            nbytes = len(header)
+            h = hashlib.sha256(header)
+        f.seek(nbytes)
+        tail = f.read()
+    tail = tail[:tail.rfind(b'\n') + 1]
+    # extend the running digest instead of rehashing the whole file
+    h.update(tail)
+    return header + tail, header, nbytes + len(tail), h.hexdigest(), full
+
+
+def parse_states(text, header):
+    """Parse a states.csv chunk into raw per-row arrays (vectorized)."""
+    cols = header.decode().strip().split(',')
+    num_cols = [c for c in [*STATE_COLS, *VP_COLS] if c in cols]
+    df = pd.read_csv(io.BytesIO(text), usecols=['block', 'timestamp', 'amm.value_oracle', *num_cols],
+                     dtype={c: np.float64 for c in ['timestamp', *num_cols]})
+    n = len(df)
+    out = {
+        'blocks': pd.to_numeric(df['block'], errors='coerce').fillna(0).to_numpy(dtype=np.int64),
+        'timestamps': df['timestamp'].fillna(0).to_numpy(dtype=np.int64),
+    }
+    # p_o from amm.value_oracle[0]; value_oracle x0/(2L-1) from [1]
+    vo = df['amm.value_oracle'].str.extract(r'\[\s*(-?\d+)\s*,\s*(-?\d+)').astype(np.float64)
+    out['amm_price_oracle'] = vo[0].to_numpy() / 1e18  # price_oracle (LP shares price based on price_scale
+    out['amm_value_oracle'] = vo[1].to_numpy() / 1e18  # value_oracle x0/(2L-1)
+
+    vp_col = next((c for c in VP_COLS if c in df.columns), None)
+    out['cp_virtual_price'] = (df[vp_col].fillna(0).to_numpy() / 1e18) if vp_col else np.zeros(n)
+    for col, name in STATE_COLS.items():
+        if col not in df.columns:
+            out[name] = np.zeros(n)
+            continue
+        v = df[col].to_numpy(dtype=np.float64) / 1e18
+        # stablecoin_allocated is kept raw (NaN on failed calls) like before
+        out[name] = v if name == 'lt_total_stables' else np.nan_to_num(v, nan=0.0)
+    return out
+
+
+def derive(d):
+    """Elementwise derived series; only depends on the same row, so it can be
+    computed for an appended chunk on its own."""
+    cp_xcp_profit = d['cp_xcp_profit']
+    cp_virtual_price = d['cp_virtual_price']
+    amm_price_oracle = d['amm_price_oracle']
+    amm_collateral = d['amm_collateral']
+    amm_debt = d['amm_debt']
+    cp_lp_price = d['cp_lp_price']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adj_coefficient = (1.0 + cp_xcp_profit) / (2.0 * cp_virtual_price) #lower bound of lp price drop due to rebalance
+        # collateral value according to amm internal logic (ses price_scale of twocrypto pool)
+        coll_value_amm_adj = amm_price_oracle * amm_collateral * adj_coefficient
+
+        # collateral value according to twocrypto pool internal logic (uses lp_price getter that depends on price_oracle, i.e. closer to spot value)
+        coll_value_cp_adj = cp_lp_price * amm_collateral * adj_coefficient
+        # adjusted collateral and x0/value
+        # recalculate x0/(2L-1) using adjusted lp_price (vp -> xcp_profit)
+        lev_ratio = 4.0/9.0
+        amm_x0_adj = (coll_value_amm_adj + np.sqrt(coll_value_amm_adj*coll_value_amm_adj - 4.0 * coll_value_amm_adj * lev_ratio * amm_debt)) / (2.0 * lev_ratio)
+        amm_value_oracle_adj = amm_x0_adj / 3.0
+
+        # amm value oracle normalized to BTC price (previous plots)
+        d['amm_value_oracle_adj_btc_ps'] = amm_value_oracle_adj / d['cp_price_scale']
+        d['amm_value_oracle_adj_btc_po'] = amm_value_oracle_adj / d['cp_price_oracle']
+
+        # pure BTC balances (collateral - debt) / price - how much BTC AMM currently owns
+        d['pure_btc_po'] = (coll_value_cp_adj - amm_debt) / d['cp_price_oracle']
+        d['pure_btc_ps'] = (coll_value_amm_adj - amm_debt) / d['cp_price_scale']
+    return d
+
+
+def growth_steps(metric, prev=None):
+    """Per-row growth factor metric[i] / metric[i-1]; row 0 is divided by
+    `prev` (last cached value) or set to 1.0 when there is none."""
+    den = np.concatenate(([np.nan if prev is None else prev], metric[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = metric / den
+    if prev is None and step.size:
+        step[0] = 1.0
+    return step
+
+
+def load_cache(path):
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as z:
+            if int(z['version']) != CACHE_VERSION:
+                return None
+            return {k: z[k] for k in z.files}
+    except Exception:
+        return None
+
+
+def update_states(st_path, cache):
+    """Bring the cached series up to date with states.csv; returns the cache
+    dict (new or extended) and the number of freshly parsed rows."""
+    nbytes = int(cache['states_nbytes']) if cache else 0
+    digest = str(cache['states_digest']) if cache else None
+    text, header, nbytes, digest, full = read_appended(st_path, nbytes, digest)
+    if full:
+        cache = None
+    new = derive(parse_states(text, header)) if len(text) > len(header) else None
+    n_new = 0 if new is None else len(new['blocks'])
+
+    if new is not None:
+        if cache is None or cache['blocks'].size == 0:
+            # fresh cache, or one saved from a header-only states.csv
+            fresh = {k: new[k] for k in SERIES if not k.startswith('growth_step')}
+            order = np.argsort(fresh['blocks'], kind='stable')
+            cache = {**(cache or {}), **{k: v[order] for k, v in fresh.items()}}
+            cache['growth_step_po'] = growth_steps(cache['pure_btc_po'])
+            cache['growth_step_ps'] = growth_steps(cache['pure_btc_ps'])
+        elif new['blocks'].min() > cache['blocks'][-1]:
+            # common case: a daily fetch appended later blocks, in order
+            order = np.argsort(new['blocks'], kind='stable')
+            new = {k: v[order] for k, v in new.items()}
+            new['growth_step_po'] = growth_steps(new['pure_btc_po'], cache['pure_btc_po'][-1])
+            new['growth_step_ps'] = growth_steps(new['pure_btc_ps'], cache['pure_btc_ps'][-1])
+            cache = {k: np.concatenate((cache[k], new[k])) if k in SERIES else cache[k] for k in cache}
+        else:
+            # back-filled blocks: merge and redo the (cheap) step ratios
+            merged = {k: np.concatenate((cache[k], new[k])) for k in SERIES if not k.startswith('growth_step')}
+            order = np.argsort(merged['blocks'], kind='stable')
+            cache = {**cache, **{k: v[order] for k, v in merged.items()}}
+            cache['growth_step_po'] = growth_steps(cache['pure_btc_po'])
+            cache['growth_step_ps'] = growth_steps(cache['pure_btc_ps'])
+    elif cache is None:
+        cache = {k: np.zeros(0) for k in SERIES}
+        cache['blocks'] = cache['blocks'].astype(np.int64)
+        cache['timestamps'] = cache['timestamps'].astype(np.int64)
+
+    cache['states_nbytes'] = np.int64(nbytes)
+    cache['states_digest'] = np.str_(digest)
+    return cache, n_new
+
+
+def update_events(ev_path, cache):
+    """Same append-only treatment for LT deposit/withdraw blocks."""
+    nbytes = int(cache['events_nbytes']) if 'events_nbytes' in cache else 0
+    digest = str(cache['events_digest']) if 'events_digest' in cache else None
+    text, _header, nbytes, digest, full = read_appended(ev_path, nbytes, digest)
+    if full:
+        cache['deposit_blocks'] = np.zeros(0, dtype=np.int64)
+        cache['withdraw_blocks'] = np.zeros(0, dtype=np.int64)
+    if len(text) > len(_header):
+        ev = pd.read_csv(io.BytesIO(text), usecols=['block', 'contract', 'event'])
+        is_lt = ev['contract'].str.lower() == 'lt'
+        event = ev['event'].str.lower()
+        for name, kind in (('deposit_blocks', 'deposit'), ('withdraw_blocks', 'withdraw')):
+            b = ev.loc[is_lt & (event == kind), 'block'].to_numpy(dtype=np.int64)
+            cache[name] = np.union1d(cache[name], b)
+    cache['events_nbytes'] = np.int64(nbytes)
+    cache['events_digest'] = np.str_(digest)
+    return cache
+
 
 def extract_data(pool_key):
     print(f"Processing {pool_key}")
@@ -26,94 +238,27 @@ def extract_data(pool_key):
     st_path = DATA_ROOT / pool_key / "states.csv"
     if not (ev_path.exists() and st_path.exists()):
         print(f"Missing data for {pool_key}, skipping")
-        
-    ev = pd.read_csv(ev_path)
-    deposit_blocks = set(ev.loc[(ev['contract'].str.lower() == 'lt') & (ev['event'].str.lower().isin(['deposit'])), 'block'].astype('int64'))
-    withdraw_blocks = set(ev.loc[(ev['contract'].str.lower() == 'lt') & (ev['event'].str.lower().isin(['withdraw'])), 'block'].astype('int64'))
-    print(f'Found {len(deposit_blocks)}/{len(withdraw_blocks)} LT deposit/withdraw events')
-    df = pd.read_csv(st_path)
-    print(f'Found {len(df)} state snapshots')
-    # order by block
-    blocks = pd.to_numeric(df['block'], errors='coerce').astype('Int64')
-    order = blocks.argsort()
-    df = df.iloc[order].reset_index(drop=True)
-    blocks = pd.to_numeric(df['block'], errors='coerce').fillna(0).astype('int64')
-    times = pd.to_datetime(pd.to_numeric(df['timestamp'], errors='coerce'), unit='s', utc=True)
-
-    # arrays
-    # p_o from amm.value_oracle[0]
-    vo_vals = df['amm.value_oracle'].to_numpy()
-    amm_price_oracle = np.zeros(len(df), dtype=np.float64) # price_oracle (LP shares price based on price_scale
-    amm_value_oracle = np.zeros(len(df), dtype=np.float64) # value_oracle x0/(2L-1)
-
-    for i, s in enumerate(vo_vals):
-        arr = json.loads(s)
-        amm_price_oracle[i] = float(int(arr[0])) / 1e18
-        amm_value_oracle[i] = float(int(arr[1])) / 1e18
-
-    cp_virtual_price = pd.to_numeric(df.get('cp.get_virtual_price', df.get('cp.virtual_price', 0)), errors='coerce').fillna(0).to_numpy(dtype=np.float64) / 1e18
-    cp_xcp_profit = pd.to_numeric(df.get('cp.xcp_profit', 0), errors='coerce').fillna(0).to_numpy(dtype=np.float64) / 1e18
-    amm_debt = pd.to_numeric(df.get('amm.get_debt', 0), errors='coerce').fillna(0).to_numpy(dtype=np.float64) / 1e18
-    amm_collateral = pd.to_numeric(df.get('amm.collateral_amount', 0), errors='coerce').fillna(0).to_numpy(dtype=np.float64) / 1e18
-    cp_price_scale = pd.to_numeric(df.get('cp.price_scale', 0), errors='coerce').fillna(0).to_numpy(dtype=np.float64) / 1e18
-    cp_price_oracle= pd.to_numeric(df.get('cp.price_oracle', 0), errors='coerce').fillna(0).to_numpy(dtype=np.float64) / 1e18
-    cp_lp_price = pd.to_numeric(df.get('cp.lp_price', 0), errors='coerce').fillna(0).to_numpy(dtype=np.float64) / 1e18
-    lt_total_stables = pd.to_numeric(df['lt.stablecoin_allocated'], errors='coerce').to_numpy(dtype=np.float64) / 10**18
-
-    df_dict = {
-        'times': times, 
-        'blocks': blocks,
-        'amm_price_oracle': amm_price_oracle, 
-        'amm_value_oracle': amm_value_oracle,
-        'amm_debt': amm_debt,
-        'amm_collateral': amm_collateral,
-        'cp_virtual_price': cp_virtual_price,
-        'cp_xcp_profit': cp_xcp_profit,
-        'cp_price_scale': cp_price_scale,
-        'cp_price_oracle': cp_price_oracle,
-        'cp_lp_price': cp_lp_price,
-        'lt_total_stables': lt_total_stables,
-        'deposit_blocks': deposit_blocks,
-        'withdraw_blocks': withdraw_blocks}
-
-
-    adj_coefficient = (1.0 + cp_xcp_profit) / (2.0 * cp_virtual_price) #lower bound of lp price drop due to rebalance
-    # collateral value according to amm internal logic (ses price_scale of twocrypto pool)
-    coll_value_amm = amm_price_oracle * amm_collateral 
-    coll_value_amm_adj = amm_price_oracle * amm_collateral * adj_coefficient
-
-    # collateral value according to twocrypto pool internal logic (uses lp_price getter that depends on price_oracle, i.e. closer to spot value)
-    coll_value_cp = cp_lp_price * amm_collateral
-    coll_value_cp_adj = cp_lp_price * amm_collateral * adj_coefficient
-    # adjusted collateral and x0/value
-    # recalculate x0/(2L-1) using adjusted lp_price (vp -> xcp_profit)
-    lev_ratio = 4.0/9.0
-    amm_x0_adj = (coll_value_amm_adj + np.sqrt(coll_value_amm_adj*coll_value_amm_adj - 4.0 * coll_value_amm_adj * lev_ratio * amm_debt)) / (2.0 * lev_ratio)
-    amm_value_oracle_adj = amm_x0_adj / 3.0
-
-    # amm value oracle normalized to BTC price (previous plots)
-    amm_value_oracle_adj_btc_ps = amm_value_oracle_adj / cp_price_scale
-    amm_value_oracle_adj_btc_po = amm_value_oracle_adj / cp_price_oracle
-
-    # pure BTC balances (collateral - debt) / price - how much BTC AMM currently owns
-    pure_btc_po = (coll_value_cp_adj - amm_debt) / cp_price_oracle
-    pure_btc_ps = (coll_value_amm_adj - amm_debt) / cp_price_scale
-
-    df_dict['amm_value_oracle_adj_btc_ps'] = amm_value_oracle_adj_btc_ps
-    df_dict['amm_value_oracle_adj_btc_po'] = amm_value_oracle_adj_btc_po
-    df_dict['pure_btc_po'] = pure_btc_po
-    df_dict['pure_btc_ps'] = pure_btc_ps
+        return None
+
+    cache_path = DATA_ROOT / pool_key / CACHE_NAME
+    cache = load_cache(cache_path)
+    cache, n_new = update_states(st_path, cache)
+    cache = update_events(ev_path, cache)
+    cache['version'] = np.int64(CACHE_VERSION)
+    np.savez(cache_path, **cache)
+    print(f'Found {len(cache["deposit_blocks"])}/{len(cache["withdraw_blocks"])} LT deposit/withdraw blocks')
+    print(f'Found {len(cache["blocks"])} state snapshots ({n_new} newly parsed)')
 
+    df_dict = {k: cache[k] for k in SERIES}
+    df_dict['times'] = pd.to_datetime(cache['timestamps'], unit='s', utc=True)
+    df_dict['deposit_blocks'] = cache['deposit_blocks']
+    df_dict['withdraw_blocks'] = cache['withdraw_blocks']
     return df_dict
 
-def compute_growth(target_metric,idx_suppress):
-    # Growth via shift; override ratios to 1.0 for idx_suppress
-    num = target_metric[1:]
-    den = target_metric[:-1]
-    with np.errstate(divide='ignore', invalid='ignore'):
-        ratio = num / den
 
-    ratio[idx_suppress] = 1.0
+def compute_growth(steps, idx_suppress):
+    # Growth from the cached per-row step ratios; override ratios to 1.0 for idx_suppress
+    ratio = np.where(idx_suppress, 1.0, steps[1:])
     growth = np.concatenate(([1.0], np.cumprod(ratio)))
 
     return growth
@@ -124,18 +269,21 @@ if __name__ == "__main__":
 
     for pool_key in POOL_KEYS:
         df_dict = extract_data(pool_key)
+        if df_dict is None:
+            continue
+        start_idx = 0
         if START_DATE:
             start_ts = pd.Timestamp(START_DATE).tz_localize('UTC')
             start_idx = np.where(df_dict['times'] >= start_ts)[0][0]
 
         # must start from 1 because growth is computed on shifted series
-        idx_deposit = np.isin(df_dict['blocks'][1:], list(df_dict['deposit_blocks']))
-        idx_withdraw = np.isin(df_dict['blocks'][1:], list(df_dict['withdraw_blocks']))
-        idx_total_stable_change = np.isin(df_dict['blocks'][1:], df_dict['blocks'][1:][np.diff(df_dict['lt_total_stables']) != 0])
-        # we ignore metric changes at deposits/withdrawals and only keep changes due to trading 
+        idx_deposit = np.isin(df_dict['blocks'][1:], df_dict['deposit_blocks'])
+        idx_withdraw = np.isin(df_dict['blocks'][1:], df_dict['withdraw_blocks'])
+        idx_total_stable_change = np.diff(df_dict['lt_total_stables']) != 0
+        # we ignore metric changes at deposits/withdrawals and only keep changes due to trading
         idx_suppress = idx_deposit | idx_withdraw | idx_total_stable_change
-        growth_po = compute_growth(df_dict['pure_btc_po'][start_idx:], idx_suppress[start_idx:])
-        growth_ps = compute_growth(df_dict['pure_btc_ps'][start_idx:], idx_suppress[start_idx:])
+        growth_po = compute_growth(df_dict['growth_step_po'][start_idx:], idx_suppress[start_idx:])
+        growth_ps = compute_growth(df_dict['growth_step_ps'][start_idx:], idx_suppress[start_idx:])
         ax1.plot(df_dict['times'][start_idx:], growth_po, label=pool_key)
         # ax1.plot(df_dict['times'][start_idx:], growth_ps, label=pool_key)
         ax1.set_title("Pure AMM BTC balance growth (LT event blocks excluded)")
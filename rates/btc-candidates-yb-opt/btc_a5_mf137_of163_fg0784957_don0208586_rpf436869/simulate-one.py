@@ -1,107 +1,186 @@
 #!/usr/bin/env python3
 
+import ctypes
+import ctypes.util
 import json
 import lzma
 import numpy as np
 from math import sqrt
 from datetime import datetime
 
+try:
+    import numba
+except ImportError:  # optional: without it the candle loop runs in Python / NumPy
+    numba = None
+
 
 PEG_TO = 'price_scale'  # price_oracle vs price_scale
 FEE = 0.012
 SECONDS_PER_YEAR = 365 * 86400
 
 
-class AMM:
-    def __init__(self, collateral, leverage, fee, oracle):
-        self.collateral = collateral  # y
-        self.leverage = leverage
-        self.fee = fee
-        self.p_oracle = oracle
-        self.debt = collateral * oracle * (leverage - 1) / leverage
-
-    def set_p_oracle(self, p):
-        self.p_oracle = p
-
-    def get_x0(self):
-        lev_ratio = (self.leverage / (2 * self.leverage - 1))**2
-        D = self.p_oracle**2 * self.collateral**2 - 4 * self.p_oracle * self.collateral * self.debt * lev_ratio
-        return (self.p_oracle * self.collateral + sqrt(D)) / (2 * lev_ratio)
-
-    def get_invariant(self):
-        x0 = self.get_x0()
-        return self.collateral * (x0 - self.debt)
-
-    def get_dy(self, i, j, in_amount):
-        x0 = self.get_x0()
-        y_initial = self.collateral
-        x_initial = x0 - self.debt
-        if i == 0:
-            x = x_initial + in_amount
-            y = x_initial * y_initial / x
-            return (y_initial - y) * (1 - self.fee)
-        else:
-            y = y_initial + in_amount
-            x = x_initial * y_initial / y
-            return (x_initial - x) * (1 - self.fee)
-
-    def exchange(self, i, j, amount):
-        x0 = self.get_x0()
-        y_initial = self.collateral
-        x_initial = x0 - self.debt
-        if i == 0:
-            x = x_initial + amount
-            y = x_initial * y_initial / x
-            dy = (y_initial - y) * (1 - self.fee)
-            self.debt -= amount
-            self.collateral -= dy
-            return dy
-        else:
-            y = y_initial + amount
-            x = x_initial * y_initial / y
-            dx = (x_initial - x) * (1 - self.fee)
-            self.collateral += amount
-            self.debt += dx
-            return dx
-
-    def get_p(self):
-        x0 = self.get_x0()
-        return (x0 - self.debt) / self.collateral
-
-    def trade_to_price(self, p):
-        x0 = self.get_x0()
-        initial_price = (x0 - self.debt) / self.collateral
-
-        if p > initial_price:
-            # Decrease debt + decrease collateral
-            p *= (1 - self.fee)
-            if p <= initial_price:
-                return
-
-        elif p < initial_price:
-            p /= (1 - self.fee)
-            if p >= initial_price:
-                return
-
-        else:
-            return
+# ──────────── LEVAMM engine ────────────
+#
+# State of one AMM is (collateral, debt) at oracle price p_oracle; x0 is a
+# function of the three, so it is computed once per state change instead of
+# in every get_p / trade_to_price call. The candle loop runs over
+# struct-of-arrays state, one element per (fee, leverage, ext_fee) set:
+# compiled per set with numba when it is installed; without numba the same
+# kernel runs as plain Python per set, or in NumPy over all sets at once for
+# batches of at least NUMPY_MIN_SETS. All of them repeat the scalar
+# expressions operation by operation (no fastmath, x**y through the C
+# library's pow like CPython), so losses are bit-identical to the old
+# per-candle AMM class.
+
+NUMPY_MIN_SETS = 96  # below this the per-set Python loop beats the NumPy one
+
+if numba is not None and ctypes.util.find_library('m') is None:
+    numba = None  # no C math library to call from compiled code (e.g. Windows)
+if numba is not None:
+    # not `**`: numba would turn x**2 into x*x, which is not what CPython computes
+    _libm = ctypes.CDLL(ctypes.util.find_library('m'))
+    _libm.pow.argtypes = [ctypes.c_double, ctypes.c_double]
+    _libm.pow.restype = ctypes.c_double
+    _pow = _libm.pow
+else:
+    _pow = pow  # float.__pow__, the same C pow as x**y
+
+
+def _njit(f):
+    # no cache=True: functions calling the ctypes pow cannot be cached
+    return numba.njit(f) if numba is not None else f
+
+
+def lev_ratio_of(leverage):
+    return (leverage / (2 * leverage - 1))**2
+
+
+@_njit
+def _x0(p_oracle, collateral, debt, lev_ratio):
+    D = _pow(p_oracle, 2.0) * _pow(collateral, 2.0) - 4 * p_oracle * collateral * debt * lev_ratio
+    return (p_oracle * collateral + sqrt(D)) / (2 * lev_ratio)
+
+
+def value_of(p_oracle, collateral, debt, lev_ratio):
+    """AMM value 2 * sqrt(I * p_oracle) - x0 (get_value)."""
+    x0 = _x0(p_oracle, collateral, debt, lev_ratio)
+    Ip = ((x0 - debt) * collateral * p_oracle) ** 0.5
+    return 2 * Ip - x0
+
+
+@_njit
+def _trade_to_price(p, x0, collateral, debt, fee):
+    """(collateral, debt, traded) after arbitrage to price p."""
+    initial_price = (x0 - debt) / collateral
+
+    if p > initial_price:
+        # Decrease debt + decrease collateral
+        p *= (1 - fee)
+        if p <= initial_price:
+            return collateral, debt, False
+
+    elif p < initial_price:
+        p /= (1 - fee)
+        if p >= initial_price:
+            return collateral, debt, False
+
+    else:
+        return collateral, debt, False
+
+    inv = (x0 - debt) * collateral
+    x_after = sqrt(inv * p)
+    y_after = x_after / p
+
+    if p > initial_price:
+        x_after += (x_after - (x0 - debt)) * fee  # Buy collateral -> more USD in
+    else:
+        y_after += (y_after - collateral) * fee  # Dump more collateral -> more collateral in
+
+    return y_after, x0 - x_after, True
+
+
+@_njit
+def _levamm_kernel(p_oracle, high0, low0, growth, fee, lev_ratio, ext_fee, collateral, debt, trace):
+    """
+    Run every parameter set k over all candles, updating collateral[k] and
+    debt[k] in place; trace (sets, candles, 2) gets the state after each
+    candle when it is not empty.
+    """
+    for k in range(len(fee)):
+        c = collateral[k]
+        d = debt[k]
+        for i in range(len(p_oracle)):
+            po = p_oracle[i]
+            x0 = _x0(po, c, d, lev_ratio[k])
+            high = high0[i] * (1 - ext_fee[k])
+            low = low0[i] * (1 + ext_fee[k])
+
+            if high > (x0 - d) / c:
+                c, d, traded = _trade_to_price(high, x0, c, d, fee[k])
+                if traded:
+                    x0 = _x0(po, c, d, lev_ratio[k])
+
+            if low < (x0 - d) / c:
+                c, d, traded = _trade_to_price(low, x0, c, d, fee[k])
+
+            d *= growth[i]
+            if trace.shape[1]:
+                trace[k, i, 0] = c
+                trace[k, i, 1] = d
+        collateral[k] = c
+        debt[k] = d
+
+
+def _x0_np(p_oracle, collateral, debt, lev_ratio):
+    D = np.float_power(p_oracle, 2.0) * np.float_power(collateral, 2.0) - 4 * p_oracle * collateral * debt * lev_ratio
+    return (p_oracle * collateral + np.sqrt(D)) / (2 * lev_ratio)
+
+
+def _trade_to_price_np(p, x0, collateral, debt, fee, active):
+    """_trade_to_price for the sets in `active`, the others unchanged."""
+    initial_price = (x0 - debt) / collateral
+    up = p > initial_price
+    down = p < initial_price
+    p = np.where(up, p * (1 - fee), np.where(down, p / (1 - fee), p))
+    traded = active & ((up & (p > initial_price)) | (down & (p < initial_price)))
 
-        inv = (x0 - self.debt) * self.collateral
-        x_after = sqrt(inv * p)
+    with np.errstate(all='ignore'):
+        inv = (x0 - debt) * collateral
+        x_after = np.sqrt(inv * p)
         y_after = x_after / p
+    x_after = np.where(up, x_after + (x_after - (x0 - debt)) * fee, x_after)
+    y_after = np.where(up, y_after, y_after + (y_after - collateral) * fee)
+    return np.where(traded, y_after, collateral), np.where(traded, x0 - x_after, debt), traded
 
-        if p > initial_price:
-            x_after += (x_after - (x0 - self.debt)) * self.fee  # Buy collateral -> more USD in
-        else:
-            y_after += (y_after - self.collateral) * self.fee  # Dupm more collateral -> more collateral in
 
-        self.collateral = y_after
-        self.debt = x0 - x_after
+def _levamm_numpy(p_oracle, high0, low0, growth, fee, lev_ratio, ext_fee, collateral, debt, trace):
+    """_levamm_kernel with the candle loop in Python and all parameter sets per NumPy op."""
+    c, d = collateral.copy(), debt.copy()
+    for i in range(p_oracle.shape[0]):
+        po = p_oracle[i]
+        x0 = _x0_np(po, c, d, lev_ratio)
+        high = high0[i] * (1 - ext_fee)
+        low = low0[i] * (1 + ext_fee)
+
+        c, d, traded = _trade_to_price_np(high, x0, c, d, fee, high > (x0 - d) / c)
+        x0 = np.where(traded, _x0_np(po, c, d, lev_ratio), x0)
+        c, d, _ = _trade_to_price_np(low, x0, c, d, fee, low < (x0 - d) / c)
+
+        d = d * growth[i]
+        if trace.shape[1]:
+            trace[:, i, 0] = c
+            trace[:, i, 1] = d
+    collateral[:] = c
+    debt[:] = d
+
 
-    def get_value(self):
-        x0 = self.get_x0()
-        Ip = ((x0 - self.debt) * self.collateral * self.p_oracle) ** 0.5
-        return 2 * Ip - x0
+def initial_state(leverage):
+    """(collateral, debt, lev_ratio, initial value) of a fresh AMM at oracle 1.0."""
+    initial_price = 1.0
+    collateral = 1.0 * leverage
+    debt = collateral * initial_price * (leverage - 1) / leverage
+    lev_ratio = lev_ratio_of(leverage)
+    return collateral, debt, lev_ratio, value_of(initial_price, collateral, debt, lev_ratio) / initial_price**leverage
 
 
 class Simulator:
@@ -122,69 +201,104 @@ class Simulator:
     def load_prices(self):
         with lzma.open(self.filename, 'r') as f:
             self.simulation_data = json.load(f)
+        self.candles = self.prepare_candles()
 
-    def single_run(self, fee, leverage):
-        # Data for prices
-        initial_price = 1.0
-        amm = AMM(collateral=(1.0 * leverage), leverage=leverage, fee=fee, oracle=initial_price)
-        initial_value = amm.get_value() / initial_price**leverage
-
-        losses = []
-
-        t_start = self.simulation_data[0]['t']
-        t_end = self.simulation_data[-1]['t']
-
-        ema0 = self.simulation_data[0][PEG_TO]
-        V0 = self.simulation_data[0]['token0'] + self.simulation_data[0]['token1'] * self.simulation_data[0]['low']
-
-        t_prev = t_start
+    def prepare_candles(self):
+        """Per-candle inputs of the AMM loop which do not depend on (fee, leverage, ext_fee)."""
+        data = self.simulation_data
+        ema0 = data[0][PEG_TO]
+        V0 = data[0]['token0'] + data[0]['token1'] * data[0]['low']
+        t_prev = data[0]['t']
 
-        for d in self.simulation_data:
+        candles = {k: [] for k in ('t', 'open', 'ema', 'p_oracle', 'high', 'low', 'growth')}
+        for d in data:
             # amm.fee = max(fee, 1 * abs(d['price_oracle'] - d['price_scale']) / d['price_scale'])
 
             t = d['t']
-            o = d['open']
-            high = d['high']
-            low = d['low']
             pool_profit = 1 + d['profit']
             ema = (d[PEG_TO] / ema0)**0.5
-            amm.set_p_oracle(ema * pool_profit)
 
-            r = (high / low)**0.5
-            low = (d['token0'] + d['token1'] * low) / V0
-            high = low * r
-            high = high * (1 - self.ext_fee)
-            low = low * (1 + self.ext_fee)
-
-            if high > amm.get_p():
-                amm.trade_to_price(high)
-
-            if low < amm.get_p():
-                amm.trade_to_price(low)
+            r = (d['high'] / d['low'])**0.5
+            low = (d['token0'] + d['token1'] * d['low']) / V0
 
             boost_rate = d.get('boost_rate')
             if boost_rate is None:
                 boost_rate = d.get('donation_apy', 0) / SECONDS_PER_YEAR
-            amm.debt *= (1 + 2 * boost_rate * (t - t_prev))
+
+            candles['t'].append(t)
+            candles['open'].append(d['open'])
+            candles['ema'].append(ema)
+            candles['p_oracle'].append(ema * pool_profit)
+            candles['high'].append(low * r)  # before ext_fee
+            candles['low'].append(low)
+            candles['growth'].append(1 + 2 * boost_rate * (t - t_prev))
             t_prev = t
 
-            if self.log or self.verbose:
-                # current_value = amm.get_value() / ((d['close'] / self.simulation_data[0]['open'])**0.5)**leverage
-                current_value = amm.get_value() / ema**leverage
-                d = datetime.fromtimestamp(t).strftime("%Y/%m/%d %H:%M")
-                loss = current_value / initial_value * 100
-                if self.log:
-                    print(f'{d}\t{o:.2f}\t{ema:.2f}\t{amm.get_p():.2f}\t\t{loss:.2f}%')
-                if self.verbose:
-                    losses.append([t, loss / 100])
+        return {k: np.array(v, dtype=np.float64) for k, v in candles.items()}
+
+    def run_many(self, fees, leverages, ext_fees=None, trace=False):
+        """
+        Annualized losses, as single_run, for broadcast arrays of fee, leverage
+        and ext_fee (default: self.ext_fee). With trace=True also returns the
+        (collateral, debt) after every candle, shape (sets, candles, 2).
+        """
+        fee, leverage, ext_fee = np.broadcast_arrays(
+            np.asarray(fees, dtype=np.float64), np.asarray(leverages, dtype=np.float64),
+            np.asarray(self.ext_fee if ext_fees is None else ext_fees, dtype=np.float64))
+        shape = fee.shape
+        fee, leverage, ext_fee = (np.ascontiguousarray(a.ravel()) for a in (fee, leverage, ext_fee))
+
+        states = [initial_state(lev) for lev in leverage.tolist()]
+        collateral = np.array([st[0] for st in states])
+        debt = np.array([st[1] for st in states])
+        lev_ratio = np.array([st[2] for st in states])
+
+        c = self.candles
+        states_trace = np.empty((fee.size, c['t'].size if trace else 0, 2))
+        inputs = (c['p_oracle'], c['high'], c['low'], c['growth'], fee, lev_ratio, ext_fee)
+        if numba is not None:
+            _levamm_kernel(*inputs, collateral, debt, states_trace)
+        elif fee.size >= NUMPY_MIN_SETS:
+            _levamm_numpy(*inputs, collateral, debt, states_trace)
+        else:
+            # plain Python floats: NumPy scalars would be several times slower here
+            _levamm_kernel(*(a.tolist() for a in inputs), collateral, debt, states_trace)
+
+        t_start = self.simulation_data[0]['t']
+        t_end = self.simulation_data[-1]['t']
+        ema = float(c['ema'][-1])
+        p_oracle = float(c['p_oracle'][-1])
+        losses = []
+        for (_, _, lr, initial_value), lev, coll, dbt in zip(states, leverage.tolist(), collateral.tolist(), debt.tolist()):
+            # current_value = amm.get_value() / ((self.simulation_data[-1]['close'] / self.simulation_data[0]['open'])**0.5)**leverage
+            current_value = value_of(p_oracle, coll, dbt, lr) / ema**lev
+            losses.append((current_value / initial_value) ** ((365 * 86400) / (t_end - t_start)) - 1)
+        losses = np.array(losses).reshape(shape)
+        return (losses, states_trace) if trace else losses
+
+    def single_run(self, fee, leverage):
+        if not (self.log or self.verbose):
+            return float(self.run_many([fee], [leverage])[0])
+
+        loss, states_trace = self.run_many([fee], [leverage], trace=True)
+        _, _, lev_ratio, initial_value = initial_state(leverage)
+        c = self.candles
+        losses = []
+        for t, o, ema, p_oracle, (coll, dbt) in zip(c['t'].tolist(), c['open'].tolist(), c['ema'].tolist(),
+                                                   c['p_oracle'].tolist(), states_trace[0].tolist()):
+            # current_value = amm.get_value() / ((d['close'] / self.simulation_data[0]['open'])**0.5)**leverage
+            current_value = value_of(p_oracle, coll, dbt, lev_ratio) / ema**leverage
+            d = datetime.fromtimestamp(t).strftime("%Y/%m/%d %H:%M")
+            loss_t = current_value / initial_value * 100
+            if self.log:
+                p = (_x0(p_oracle, coll, dbt, lev_ratio) - dbt) / coll
+                print(f'{d}\t{o:.2f}\t{ema:.2f}\t{p:.2f}\t\t{loss_t:.2f}%')
+            if self.verbose:
+                losses.append([t, loss_t / 100])
 
         if losses:
             self.losses = losses
-
-        # current_value = amm.get_value() / ((self.simulation_data[-1]['close'] / self.simulation_data[0]['open'])**0.5)**leverage
-        current_value = amm.get_value() / ema**leverage
-        loss = (current_value / initial_value) ** ((365 * 86400) / (t_end - t_start)) - 1
-        return loss
+        return float(loss[0])
 
 
 if __name__ == '__main__':
@@ -44,6 +44,7 @@ import lzma
 from pathlib import Path
 
 import numpy as np
+from scipy.signal import lfilter
 
 from net_pressure import load_npz_xz, PRICE_KEY
 
@@ -98,11 +99,8 @@ def ema(series, dt_year, tau_year):
         return series.copy()
     a = dt_year / tau_year
     a = min(a, 1.0)
-    out = np.empty_like(series)
-    acc = series[0]
-    for k in range(series.size):
-        acc += (series[k] - acc) * a
-        out[k] = acc
+    # acc_k = acc_{k-1} + a*(x_k - acc_{k-1}), acc seeded with x_0: one C-level IIR pass
+    out, _ = lfilter([a], [1.0, a - 1.0], series, zi=[(1.0 - a) * series[0]])
     return out
 
 
@@ -2,19 +2,42 @@
 
 import json
 import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'scripts'))
+import pnl_log  # noqa: E402
 
 
 pool_names = ['WBTC', 'cbBTC', 'tBTC']
 
-with open('pnl-log.json', 'r') as f:
-    pnl_data = json.load(f)
+
+def last_values(name):
+    """
+    Last value of a pnl-log column per market (0.0 for a market without rows):
+    from pnl-log.npz (see scripts/pnl_log.py) when present, else from its
+    pnl-log.json export.
+    """
+    if not os.path.exists(pnl_log.PNL_LOG_FILE):
+        with open('pnl-log.json', 'r') as f:
+            return [vals[-1] if vals else 0.0 for vals in json.load(f)[name]]
+    with pnl_log.open_log() as data:
+        out = []
+        for idx in range(int(data['n'])):
+            values = pnl_log.column(data, idx, name)
+            out.append(float(values[-1]) if values.size else 0.0)
+        return out
+
+
+charged_fees = last_values('admin_fees')
+fair_fees = last_values('fair_admin_fees')
 
 with open('user-pnl.json', 'r') as f:
     user_data = json.load(f)
 
 for idx, name in enumerate(pool_names):
-    charged = pnl_data['admin_fees'][idx][-1]
-    fair = pnl_data['fair_admin_fees'][idx][-1]
+    charged = charged_fees[idx]
+    fair = fair_fees[idx]
     overcharge = charged - fair
     loss = sum(-v for v in user_data[idx].values() if v < 0)
 
@@ -0,0 +1,203 @@
+# Backtest of LP price estimators against the redemption value of the LP token
+#
+# Every estimator is a function of one market's pool state over many grid rows
+# (dict of 1-D float arrays, raw on-chain units as stored by sampler.grid_states:
+# b0, b1, price_oracle, price_scale, vp, supply, A, plus the int `decimals` of
+# coin 1) returning the LP price in coin 0 per LP token. The reference is the
+# redemption value (b0 + price_oracle * b1) / supply (actual_portfolio_value in
+# yb_precise_oracle.py); an oracle meant as a lower estimate must not exceed it.
+#
+# Per market and estimator the report gives, over all grid rows where the market
+# exists, with dev = estimate / redemption - 1:
+#     bias      mean dev
+#     viol      number of rows with estimate > redemption (lower bound broken)
+#     worst     max |dev|, and the largest overshoot (max dev)
+# followed by a ranking of the estimators over all markets.
+#
+# Work is split into (estimator, market, CHUNK rows) tasks on a fork
+# multiprocessing pool (the wad solver is pure Python per row).
+#
+# The grid stores every view as float64, so balances and supply (~1e24, above
+# 2**53) arrive rounded to ~16 significant digits. lp_price_exact therefore
+# runs exact integer arithmetic on those rounded inputs: it removes the float
+# solver's own error, not the input rounding.
+import os
+import sys
+import multiprocessing
+
+import numpy as np
+from brownie import Contract, config
+
+from scripts.sampler import GRID_STEP, grid_states
+from scripts.yb_precise_oracle import FXSwapLPOracleSim
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'oracle-derivation'))
+from portfolio_value_solver import WAD, newton_D, portfolio_value  # noqa: E402
+from portfolio_value_interp import portfolio_values_fast  # noqa: E402
+
+config['autofetch_sources'] = True
+
+WORKERS = os.cpu_count()
+CHUNK = 256
+INPUTS = ['b0', 'b1', 'price_oracle', 'price_scale', 'vp', 'supply', 'A']
+
+
+def _scaled(s):
+    """Floats in token units: b0, b1, price_oracle, price_scale, vp, supply, A."""
+    return (s['b0'] / 1e18, s['b1'] / 10**s['decimals'], s['price_oracle'] / 1e18,
+            s['price_scale'] / 1e18, s['vp'] / 1e18, s['supply'] / 1e18, s['A'] / 10000)
+
+
+def redemption_value(s):
+    b0, b1, po, ps, vp, supply, A = _scaled(s)
+    return FXSwapLPOracleSim.actual_portfolio_value([b0, b1], po, supply)
+
+
+def lp_price_float(s):
+    """FXSwapLPOracleSim.lp_price: float StableSwap portfolio value at price_oracle."""
+    b0, b1, po, ps, vp, supply, A = _scaled(s)
+    return FXSwapLPOracleSim(A=A).lp_price(po, ps, [b0, b1], supply)
+
+
+def lp_price_exact(s):
+    """
+    The same value from the wad-integer portfolio_value_solver (_amp = 2 * pool.A()),
+    on the float64 grid values converted to int (exact arithmetic, rounded inputs).
+    """
+    out = np.empty(len(s['b0']))
+    precision = 10**(18 - int(s['decimals']))
+    for i in range(len(out)):
+        b0, b1, po, ps, supply, amp = (int(s[k][i]) for k in ('b0', 'b1', 'price_oracle', 'price_scale', 'supply', 'A'))
+        D = newton_D(2 * amp, [b0, b1 * precision * ps // WAD])
+        V, _ = portfolio_value(D, po * WAD // ps, 2 * amp)
+        out[i] = V / supply
+    return out
+
+
+def lp_price_table(s):
+    """
+    lp_price_exact with V from the tabulated kernel (portfolio_value_interp,
+    one table per _amp) instead of the integer solver: only newton_D stays
+    per row, within table.error_bound of lp_price_exact.
+    """
+    precision = 10**(18 - int(s['decimals']))
+    D = np.empty(len(s['b0']))
+    p = np.empty(len(s['b0']))
+    for i in range(len(D)):
+        b0, b1, po, ps, amp = (int(s[k][i]) for k in ('b0', 'b1', 'price_oracle', 'price_scale', 'A'))
+        D[i] = newton_D(2 * amp, [b0, b1 * precision * ps // WAD])
+        p[i] = po * WAD // ps
+    out = np.empty(len(D))
+    for amp in np.unique(s['A']):
+        rows = s['A'] == amp
+        out[rows] = portfolio_values_fast(D[rows], p[rows], 2 * int(amp)) / s['supply'][rows]
+    return out
+
+
+def lp_price_onchain(s):
+    """The pool's own lp_price(): 2 * virtual_price * sqrt(price_oracle)."""
+    b0, b1, po, ps, vp, supply, A = _scaled(s)
+    return 2 * vp * np.sqrt(po)
+
+
+def lp_price_min(s):
+    """yb_min_oracle.py: D / supply * min(1, price_oracle / price_scale)."""
+    b0, b1, po, ps, vp, supply, A = _scaled(s)
+    D = FXSwapLPOracleSim(A=A)._get_D(b0, ps * b1)
+    return D / supply * np.minimum(1.0, po / ps)
+
+
+ESTIMATORS = {
+    'lp_price_float': lp_price_float,
+    'lp_price_exact': lp_price_exact,
+    'lp_price_table': lp_price_table,
+    'lp_price_onchain': lp_price_onchain,
+    'lp_price_min': lp_price_min,
+}
+
+_work = {}  # set before the pool forks: estimators and per-market inputs
+
+
+def _run(task):
+    name, m, lo, hi = task
+    s = {k: v[lo:hi] for k, v in _work['inputs'][m].items() if k != 'decimals'}
+    s['decimals'] = _work['inputs'][m]['decimals']
+    return task, _work['estimators'][name](s)
+
+
+def market_inputs(states, m):
+    """Estimator inputs of market m: grid rows where every input is set and nonzero."""
+    cols = {k: states[k][:, m] for k in INPUTS}
+    ok = np.logical_and.reduce([np.isfinite(v) for v in cols.values()])
+    ok &= (cols['supply'] > 0) & (cols['b0'] > 0) & (cols['b1'] > 0)
+    s = {k: v[ok] for k, v in cols.items()}
+    s['decimals'] = int(states['decimals'][m])
+    s['blocks'] = states['blocks'][ok]
+    return s
+
+
+def backtest(states, estimators=ESTIMATORS, workers=WORKERS, chunk=CHUNK):
+    """
+    {(name, market): stats} for every estimator over every market of `states`
+    (a grid_states dict); stats: n, bias, viol, worst, over, worst_block.
+    """
+    n_markets = len(states['lts'])
+    inputs = [market_inputs(states, m) for m in range(n_markets)]
+    _work.update(estimators=estimators, inputs=inputs)
+    tasks = [(name, m, lo, min(lo + chunk, len(inputs[m]['b0'])))
+             for name in estimators for m in range(n_markets)
+             for lo in range(0, len(inputs[m]['b0']), chunk)]
+
+    estimates = {(name, m): np.empty(len(inputs[m]['b0'])) for name in estimators for m in range(n_markets)}
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        for i, ((name, m, lo, hi), values) in enumerate(pool.imap_unordered(_run, tasks)):
+            estimates[(name, m)][lo:hi] = values
+            if (i + 1) % max(len(tasks) // 20, 1) == 0 or i + 1 == len(tasks):
+                print(f'estimates: {i + 1}/{len(tasks)} chunks')
+
+    out = {}
+    for m in range(n_markets):
+        ref = redemption_value(inputs[m])
+        for name in estimators:
+            dev = estimates[(name, m)] / ref - 1
+            if not dev.size:
+                continue
+            k = int(np.argmax(np.abs(dev)))
+            out[(name, m)] = {
+                'n': dev.size,
+                'bias': float(dev.mean()),
+                'viol': int((dev > 0).sum()),
+                'worst': float(abs(dev[k])),
+                'over': float(dev.max()),
+                'worst_block': int(inputs[m]['blocks'][k]),
+            }
+    return out
+
+
+def report(states, results, symbols=None):
+    names = list(dict.fromkeys(name for name, _ in results))
+    for m in range(len(states['lts'])):
+        label = symbols[m] if symbols else states['lts'][m]
+        rows = [(name, results[(name, m)]) for name in names if (name, m) in results]
+        if not rows:
+            continue
+        print(f"\nMarket {m} {label}: {rows[0][1]['n']} rows (every {GRID_STEP} blocks)")
+        print(f"    {'estimator':<18s} {'bias':>10s} {'viol':>6s} {'worst':>10s} {'over':>10s} {'worst at':>10s}")
+        for name, r in rows:
+            print(f"    {name:<18s} {r['bias']:10.2e} {r['viol']:6d} {r['worst']:10.2e} {r['over']:10.2e} {r['worst_block']:10d}")
+
+    # lower-bound violations first, then the worst deviation anywhere
+    ranking = sorted(names, key=lambda name: (
+        sum(r['viol'] for (n, _), r in results.items() if n == name),
+        max(r['worst'] for (n, _), r in results.items() if n == name)))
+    print("\nRanking (violations, worst deviation over all markets):")
+    for i, name in enumerate(ranking):
+        viol = sum(r['viol'] for (n, _), r in results.items() if n == name)
+        worst = max(r['worst'] for (n, _), r in results.items() if n == name)
+        print(f"    {i + 1}. {name:<18s} {viol:6d} {worst:10.2e}")
+
+
+def main():
+    states = grid_states()
+    results = backtest(states)
+    report(states, results, [Contract(lt).symbol() for lt in states['lts']])
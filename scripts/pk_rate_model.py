@@ -0,0 +1,104 @@
+"""
+Monetary-policy borrow rate with an EMA on the PegKeeper debt ratio, simulated
+offline from a cached history (pk-rate-series.npz).
+
+plot_pk_rate_model.py samples, every STEP blocks from START_BLOCK, the inputs
+of the rate formula
+
+    rate = rate0 * exp((1 - p_o) / sigma - debt_ratio / target_debt_fraction)
+    debt_ratio = sum(pk.debt()) / sum(controller.total_debt())
+
+and appends them to SERIES_FILE (columns in COLUMNS, raw on-chain units).
+`simulate` then evaluates the formula over the whole series in array passes,
+once with the spot debt ratio and once with its EMA (time constant ema_time,
+seconds, on the sample timestamps). Other policy parameters (EMA window,
+target_debt_fraction, sigma, rate0) are keyword overrides, so variants are
+compared without touching the node:
+
+    python scripts/pk_rate_model.py --ema-days 7 21 42
+    python scripts/pk_rate_model.py --ema-days 21 --target 0.15
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'chainlink'))
+from filters import ema_tau  # noqa: E402
+
+
+SERIES_FILE = "pk-rate-series.npz"
+START_BLOCK = 21_500_000
+DEBT_RATIO_EMA = 3 * 7 * 86400
+N_PER_EMA = 70
+STEP = max(DEBT_RATIO_EMA // 13 // N_PER_EMA, 1)
+YEAR = 365 * 86400
+COLUMNS = ['blocks', 'ts', 'sigma', 'target_debt_fraction', 'rate0', 'p_o', 'pk_debt', 'total_debt']
+
+
+def load_series(path=SERIES_FILE, start=START_BLOCK, step=STEP):
+    """Cached series for (start, step), or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        series = {k: f[k] for k in f.files}
+    if (int(series['start']), int(series['step'])) != (start, step):
+        print(f'{path}: sampled for another start/step, ignoring it')
+        return None
+    return series
+
+
+def save_series(series, path=SERIES_FILE):
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **series)
+    os.replace(tmp, path)
+
+
+def simulate(series, ema_time=DEBT_RATIO_EMA, target_debt_fraction=None, sigma=None, rate0=None):
+    """
+    (rate without EMA, rate with EMA) per sample, as fractions per year.
+    target_debt_fraction and rate0 are floats (1.0 == 100%), sigma in wad;
+    None uses the on-chain value at each sample.
+    """
+    debt_ratio = series['pk_debt'] / series['total_debt']
+    debt_ratio_ma = ema_tau(debt_ratio, ema_time, t=series['ts'])
+    tdf = series['target_debt_fraction'] / 1e18 if target_debt_fraction is None else target_debt_fraction
+    sigma = series['sigma'] if sigma is None else sigma
+    rate0 = series['rate0'] / 1e18 if rate0 is None else rate0
+
+    power = (1e18 - series['p_o']) / sigma
+    rate_before = rate0 * YEAR * np.exp(power - debt_ratio / tdf)
+    rate_after = rate0 * YEAR * np.exp(power - debt_ratio_ma / tdf)
+    return rate_before, rate_after
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+    from datetime import datetime
+
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--series", default=SERIES_FILE)
+    ap.add_argument("--ema-days", type=float, nargs="+", default=[DEBT_RATIO_EMA / 86400])
+    ap.add_argument("--target", type=float, default=None, help="target_debt_fraction (default: on-chain)")
+    ap.add_argument("--sigma", type=float, default=None, help="sigma in wad (default: on-chain)")
+    ap.add_argument("--rate0", type=float, default=None, help="rate0 per second (default: on-chain)")
+    args = ap.parse_args()
+
+    series = load_series(args.series)
+    if series is None:
+        sys.exit(f"{args.series}: no series, run `brownie run scripts/plot_pk_rate_model.py` first")
+    times = [datetime.fromtimestamp(t) for t in series['ts']]
+
+    for i, days in enumerate(args.ema_days):
+        before, after = simulate(series, days * 86400, args.target, args.sigma, args.rate0)
+        if i == 0:
+            plt.plot(times, 100 * before, c="gray", label="No EMA")
+        plt.plot(times, 100 * after, label=f"EMA {days:g} days")
+    plt.legend()
+    plt.title("Borrow rate")
+    plt.tick_params("x", rotation=45)
+    plt.ylabel("[%]")
+    plt.tight_layout()
+    plt.show()
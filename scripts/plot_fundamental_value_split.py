@@ -6,15 +6,20 @@
 # cbBTC - 21.1% APY
 # tBTC - 13.0% APY
 
+# Data collection: one topic-filtered log scan plans every boundary block, whose
+# views (and value_oracle_for with the args read there) are then fetched with
+# Multicall3 on a thread pool, see sampler.py.
+
 import matplotlib.pyplot as plt
 from matplotlib.ticker import ScalarFormatter
 
-from brownie import multicall
 from datetime import datetime
 from brownie import Contract, config
 from brownie import web3
+from brownie.network.event import decode_logs
 
-import json
+from scripts import pnl_log
+from scripts.sampler import plan_intervals, sample, timestamp_call
 
 config['autofetch_sources'] = True
 
@@ -23,6 +28,28 @@ START_BLOCK = 23433457
 BATCH_SIZE = 500
 ADJUST = True
 
+# keys of state_views(), in order
+STATE_VIEWS = ['value', 'oracle', 'scale', 'xcp', 'vp', 'debt', 'collateral',
+               'liquidity', 'staked', 'supply', 'min_admin_fee', 'staker_supply']
+
+
+def state_views(lt, amm, pool, staker):
+    """Views read at every boundary block, per market: (key, contract, method, args)."""
+    return [
+        ('value', amm, 'value_oracle', ()),
+        ('oracle', pool, 'price_oracle', ()),
+        ('scale', pool, 'price_scale', ()),
+        ('xcp', pool, 'xcp_profit', ()),
+        ('vp', pool, 'get_virtual_price', ()),
+        ('debt', amm, 'get_debt', ()),
+        ('collateral', amm, 'collateral_amount', ()),
+        ('liquidity', lt, 'liquidity', ()),  # (admin, total, ideal_staked, staked)
+        ('staked', lt, 'balanceOf', (staker.address,)),
+        ('supply', lt, 'totalSupply', ()),
+        ('min_admin_fee', lt, 'min_admin_fee', ()),
+        ('staker_supply', staker, 'totalSupply', ()),
+    ]
+
 
 def merge_feeds(times, values):
     time_to_value = []
@@ -44,8 +71,6 @@ def merge_feeds(times, values):
 
 
 def main():
-    mc = Contract("0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696")
-
     factory = Contract(FACTORY)
     n = 3
     markets = [factory.markets(i) for i in range(n)]
@@ -75,176 +100,197 @@ def main():
     staked_pps_values = [[1.0] for i in range(n)]
     unstaked_pps_values = [[1.0] for i in range(n)]
 
+    # pnl-log.npz columns, written once at the end (see pnl_log.py)
+    log_columns = {
+        'blocks': tblocks,
+        'times': times,
+        'earned_profits': earned_profits,
+        'admin_fees': admin_fees,
+        'fair_admin_fees': fair_admin_fees,
+        'staked_pnl': staked_pnl,
+        'unstaked_pnl': unstaked_pnl,
+        'fair_unstaked_pnl': fair_unstaked_pnl,
+        'staked_pps': staked_pps_values,
+        'unstaked_pps': unstaked_pps_values,
+    }
+
+    # ---- collection: plan every boundary block first, then read them in bulk ----
+
+    # one log scan for Deposit/Withdraw of LT and staker (they cut the batches
+    # into intervals) and LT WithdrawAdminFees
+    batch_intervals, events = plan_intervals(
+        [[(lts[idx], ('Deposit', 'Withdraw', 'WithdrawAdminFees')), (stakers[idx], ('Deposit', 'Withdraw'))]
+         for idx in range(n)],
+        START_BLOCK, max_block, BATCH_SIZE, keep=('WithdrawAdminFees',))
+    min_deposit_blocks = [min((log['blockNumber'] for name, log in ev if name != 'WithdrawAdminFees'), default=10**10)
+                          for ev in events]
+    admin_fee_logs = [[(log['blockNumber'], decode_logs([log])[0]['amount']) for name, log in ev
+                       if name == 'WithdrawAdminFees'] for ev in events]
+
+    # per market and batch: the intervals between events and that batch's admin fee withdrawals
+    plans = [[] for i in range(n)]
+    for idx in range(n):
+        for block, intervals in zip(range(START_BLOCK, max_block, BATCH_SIZE), batch_intervals[idx]):
+            to_block_b = min(block + BATCH_SIZE - 1, max_block)
+            admin_fees_events = {}
+            for b, amount in admin_fee_logs[idx]:
+                if block <= b <= to_block_b:
+                    admin_fees_events[b] = amount
+            plans[idx].append((intervals, admin_fees_events))
+
+    state_calls = [timestamp_call()]
     for idx in range(n):
-        lt = lts[idx]
-        amm = amms[idx]
-        pool = cryptopools[idx]
-        staker = stakers[idx]
+        state_calls += [(getattr(c, name), args) for _, c, name, args in state_views(
+            lts[idx], amms[idx], cryptopools[idx], stakers[idx])]
+    sample_blocks = {b for plan in plans for intervals, _ in plan for interval in intervals for b in interval}
+    print(f'{sum(map(len, events))} events, {len(sample_blocks)} boundary blocks to sample')
+    raw = sample(sample_blocks, state_calls, label='state')
+
+    def state_at(block, idx):
+        """Views of market idx at block, with the defaults used before the first deposit."""
+        values = raw[block]
+        width = len(STATE_VIEWS)
+        st = dict(zip(STATE_VIEWS, values[1 + idx * width:1 + (idx + 1) * width]))
+        st['time'] = values[0]
+        if block < min_deposit_blocks[idx]:
+            st.update(value=[0, 0], xcp=10**18, vp=10**18, debt=0.0, collateral=0.0,
+                      liquidity=[0] * 4, staked=0.0, supply=0.0, min_admin_fee=0.0, staker_supply=0.0)
+        missing = [k for k, v in st.items() if v is None]
+        if missing:
+            raise RuntimeError(f'market {idx} block {block}: {missing} reverted')
+        return st
+
+    def adjusted_collateral(st):
+        return int(st['collateral'] * ((10**18 + st['xcp']) / (2 * st['vp']) if ADJUST else 1))
+
+    # value_oracle_for with the (already known) adjusted collateral and debt of each block
+    value_for_calls = {}
+    for block in sample_blocks:
+        value_for_calls[block] = [
+            (amms[idx].value_oracle_for, (adjusted_collateral(st), st['debt']))
+            for idx in range(n) if block >= min_deposit_blocks[idx]
+            for st in [state_at(block, idx)]]
+    value_for_markets = {block: [idx for idx in range(n) if block >= min_deposit_blocks[idx]]
+                         for block in sample_blocks}
+    raw_value_for = sample(sample_blocks, lambda block: value_for_calls[block], label='value_oracle_for')
+    value_adj = {(block, idx): value[1]
+                 for block, values in raw_value_for.items()
+                 for idx, value in zip(value_for_markets[block], values)}
+
+    # ---- series, interval by interval, exactly as before ----
 
+    for idx in range(n):
         staked_pps = None
         unstaked_pps = 1.0
         plain_staked_pps = None
         plain_unstaked_pps = 1.0
         staked_deposits = None
         admin_fees_withdrawn = 0
-        min_deposit_block = 10**10
-
-        for block in range(START_BLOCK, max_block, BATCH_SIZE):
-            to_block_b = min(block + BATCH_SIZE - 1, max_block)
-            deposits = lt.events.Deposit.get_logs(fromBlock=block, toBlock=to_block_b)
-            withdrawals = lt.events.Withdraw.get_logs(fromBlock=block, toBlock=to_block_b)
-            stakes = staker.events.Deposit.get_logs(fromBlock=block, toBlock=to_block_b)
-            unstakes = staker.events.Withdraw.get_logs(fromBlock=block, toBlock=to_block_b)
-            waf = lt.events.WithdrawAdminFees.get_logs(fromBlock=block, toBlock=to_block_b)
-            blocks = set(
-                    [ev.blockNumber for ev in deposits]
-                    + [ev.blockNumber for ev in withdrawals]
-                    + [ev.blockNumber for ev in stakes]
-                    + [ev.blockNumber for ev in unstakes]
-            )
-            if min_deposit_block == 10**10 and len(blocks) > 0:
-                min_deposit_block = min(blocks)
-
-            admin_fees_events = {w.blockNumber: w.args.amount for w in waf}
-
-            batch_end = min(max_block, block + BATCH_SIZE)
-            blocks.add(block)
-            blocks.add(batch_end)
-            blocks = sorted(blocks)
-            to_value = 0
-            to_oracle = 0
-            to_scale = 0
-
-            for from_block, to_block in zip(blocks[:-1], blocks[1:]):
-                to_block -= 1
-
-                if to_block > from_block:
-                    with multicall(address=mc.address, block_identifier=from_block):
-                        from_value = amm.value_oracle() if from_block >= min_deposit_block else [0, 0]
-                        from_oracle = pool.price_oracle()
-                        from_scale = pool.price_scale()
-                        from_xcp = pool.xcp_profit() if from_block >= min_deposit_block else 10**18
-                        from_vp = pool.get_virtual_price() if from_block >= min_deposit_block else 10**18
-                        from_debt = amm.get_debt() if from_block >= min_deposit_block else 0.0
-                        from_collateral = amm.collateral_amount() if from_block >= min_deposit_block else 0.0
-                        from_value_plain = amm.value_oracle() if from_block >= min_deposit_block else [0, 0]
-
-                    with multicall(address=mc.address, block_identifier=to_block):
-                        to_value = amm.value_oracle() if to_block >= min_deposit_block else [0, 0]
-                        to_oracle = pool.price_oracle()
-                        to_scale = pool.price_scale()
-                        time = mc.getCurrentBlockTimestamp()
-                        to_xcp = pool.xcp_profit() if to_block >= min_deposit_block else 10**18
-                        to_vp = pool.get_virtual_price() if to_block >= min_deposit_block else 10**18
-                        to_debt = amm.get_debt() if to_block >= min_deposit_block else 0.0
-                        to_collateral = amm.collateral_amount() if to_block >= min_deposit_block else 0.0
-                        liquidity = to_liquidity = lt.liquidity() if to_block >= min_deposit_block else [0] * 4  # (admin, total, ideal_staked, staked)
-                        staked = to_staked = lt.balanceOf(staker) if to_block >= min_deposit_block else 0.0
-                        supply = to_supply = lt.totalSupply() if to_block >= min_deposit_block else 0.0
-                        min_admin_fee = lt.min_admin_fee() if to_block >= min_deposit_block else 0.0
-                        staker_supply = staker.totalSupply() if to_block >= min_deposit_block else 0.0
-                        to_value_plain = amm.value_oracle() if to_block >= min_deposit_block else [0, 0]
-
-                    from_collateral = int(from_collateral * ((10**18 + from_xcp) / (2 * from_vp) if ADJUST else 1))
-                    to_collateral = int(to_collateral * ((10**18 + to_xcp) / (2 * to_vp) if ADJUST else 1))
-
-                    from_value_adj = to_value_adj = 0
-                    if from_block >= min_deposit_block:
-                        from_value_adj = amm.value_oracle_for(from_collateral, from_debt, block_identifier=from_block)[1]
-                    if to_block >= min_deposit_block:
-                        to_value_adj = amm.value_oracle_for(to_collateral, to_debt, block_identifier=to_block)[1]
-                    from_value_plain = from_value_plain[1] / from_scale
-                    to_value_plain = to_value_plain[1] / to_scale
-
-                    tblocks[idx].append(to_block)
-                    times[idx].append(datetime.fromtimestamp(time))
-
-                    from_value_oracle = from_value[1] / (from_oracle or 1)
-                    from_value_scale = from_value[1] / (from_scale or 1)
-                    to_value_oracle = to_value[1] / (to_oracle or 1)
-                    to_value_scale = to_value[1] / (to_scale or 1)
-                    if from_block >= min_deposit_block:
-                        growth_oracle_mul = (to_value_oracle / from_value_oracle)
-                        scale_oracle_mul = (to_value_scale / from_value_scale)
-                        growth_oracle[idx] *= growth_oracle_mul
-                        growth_scale[idx] *= scale_oracle_mul
-                    growth_oracle_values[idx].append(growth_oracle[idx])
-                    growth_scale_values[idx].append(growth_scale[idx])
-
-                    if from_block >= min_deposit_block:
-                        from_value_adj /= from_scale
-                    if to_block >= min_deposit_block:
-                        to_value_adj /= to_scale
-                    if from_block >= min_deposit_block:
-                        growth_mul_adj = to_value_adj / from_value_adj
-                    else:
-                        growth_mul_adj = 1
-                    growth_scale_adj[idx] *= growth_mul_adj
-                    growth_scale_values_adj[idx].append(growth_scale_adj[idx])
-                    d_profit = to_value_adj - from_value_adj
-                    earned_profits[idx].append(earned_profits[idx][-1] + d_profit)
-
-                    d_staked_value = 0
+        min_deposit_block = min_deposit_blocks[idx]
+
+        for intervals, admin_fees_events in plans[idx]:
+            for from_block, to_block in intervals:
+                f = state_at(from_block, idx)
+                t = state_at(to_block, idx)
+                from_value = from_value_plain = f['value']
+                from_oracle = f['oracle']
+                from_scale = f['scale']
+
+                to_value = to_value_plain = t['value']
+                to_oracle = t['oracle']
+                to_scale = t['scale']
+                time = t['time']
+                liquidity = to_liquidity = t['liquidity']  # (admin, total, ideal_staked, staked)
+                staked = to_staked = t['staked']
+                supply = to_supply = t['supply']
+                min_admin_fee = t['min_admin_fee']
+                staker_supply = t['staker_supply']
+
+                from_value_adj = to_value_adj = 0
+                if from_block >= min_deposit_block:
+                    from_value_adj = value_adj[(from_block, idx)]
+                if to_block >= min_deposit_block:
+                    to_value_adj = value_adj[(to_block, idx)]
+                from_value_plain = from_value_plain[1] / from_scale
+                to_value_plain = to_value_plain[1] / to_scale
+
+                tblocks[idx].append(to_block)
+                times[idx].append(datetime.fromtimestamp(time))
+
+                from_value_oracle = from_value[1] / (from_oracle or 1)
+                from_value_scale = from_value[1] / (from_scale or 1)
+                to_value_oracle = to_value[1] / (to_oracle or 1)
+                to_value_scale = to_value[1] / (to_scale or 1)
+                if from_block >= min_deposit_block:
+                    growth_oracle_mul = (to_value_oracle / from_value_oracle)
+                    scale_oracle_mul = (to_value_scale / from_value_scale)
+                    growth_oracle[idx] *= growth_oracle_mul
+                    growth_scale[idx] *= scale_oracle_mul
+                growth_oracle_values[idx].append(growth_oracle[idx])
+                growth_scale_values[idx].append(growth_scale[idx])
+
+                if from_block >= min_deposit_block:
+                    from_value_adj /= from_scale
+                if to_block >= min_deposit_block:
+                    to_value_adj /= to_scale
+                if from_block >= min_deposit_block:
+                    growth_mul_adj = to_value_adj / from_value_adj
+                else:
+                    growth_mul_adj = 1
+                growth_scale_adj[idx] *= growth_mul_adj
+                growth_scale_values_adj[idx].append(growth_scale_adj[idx])
+                d_profit = to_value_adj - from_value_adj
+                earned_profits[idx].append(earned_profits[idx][-1] + d_profit)
+
+                d_staked_value = 0
+                d_unstaked_value = 0
+                useful_value = 0
+                plain_useful_value = 0
+                if to_liquidity[1] > 0:
+                    useful_value = to_value_adj * to_liquidity[1] / (to_liquidity[0] + to_liquidity[1])
+                    plain_useful_value = to_value_plain * to_liquidity[1] / (to_liquidity[0] + to_liquidity[1])
+                new_staked_pps = None
+                if staker_supply > 0:
+                    new_staked_pps = useful_value * to_staked / to_supply / (staker_supply / 1e18)
+                    plain_staked_pps = plain_useful_value * to_staked / to_supply / (staker_supply / 1e18)
+                if staked_pps is not None:
+                    d_staked_value = staked_deposits * (new_staked_pps / staked_pps - 1)
+                staked_deposits = useful_value * to_staked / (to_supply or 1)
+                staked_pps = new_staked_pps
+
+                staked_pnl[idx].append(staked_pnl[idx][-1] + d_staked_value)
+
+                new_unstaked_pps = useful_value / ((to_supply or 1e18) / 1e18)
+                plain_unstaked_pps = plain_useful_value / ((to_supply or 1e18) / 1e18)
+                if len(staked_fractions[idx]) > 1:
+                    d_unstaked_value = (new_unstaked_pps - unstaked_pps) * (to_supply - to_staked) / 1e18
+                else:
                     d_unstaked_value = 0
-                    useful_value = 0
-                    plain_useful_value = 0
-                    if to_liquidity[1] > 0:
-                        useful_value = to_value_adj * to_liquidity[1] / (to_liquidity[0] + to_liquidity[1])
-                        plain_useful_value = to_value_plain * to_liquidity[1] / (to_liquidity[0] + to_liquidity[1])
-                    new_staked_pps = None
-                    if staker_supply > 0:
-                        new_staked_pps = useful_value * to_staked / to_supply / (staker_supply / 1e18)
-                        plain_staked_pps = plain_useful_value * to_staked / to_supply / (staker_supply / 1e18)
-                    if staked_pps is not None:
-                        d_staked_value = staked_deposits * (new_staked_pps / staked_pps - 1)
-                    staked_deposits = useful_value * to_staked / (to_supply or 1)
-                    staked_pps = new_staked_pps
-
-                    staked_pnl[idx].append(staked_pnl[idx][-1] + d_staked_value)
-
-                    new_unstaked_pps = useful_value / ((to_supply or 1e18) / 1e18)
-                    plain_unstaked_pps = plain_useful_value / ((to_supply or 1e18) / 1e18)
-                    if len(staked_fractions[idx]) > 1:
-                        d_unstaked_value = (new_unstaked_pps - unstaked_pps) * (to_supply - to_staked) / 1e18
-                    else:
-                        d_unstaked_value = 0
-                    unstaked_pps = new_unstaked_pps
-                    unstaked_pnl[idx].append(unstaked_pnl[idx][-1] + d_unstaked_value)
-
-                    staked_pps_values[idx].append(plain_staked_pps)
-                    unstaked_pps_values[idx].append(plain_unstaked_pps)
-
-                    staked_fractions[idx].append(staked / (supply or 1))
-
-                    f_a = 1.0 - (1.0 - min_admin_fee / 1e18) * (1.0 - staked / (supply or 1))**0.5
-                    admin_fees_addition = admin_fees_withdrawn + sum(v for b, v in admin_fees_events.items() if b <= to_block) * unstaked_pps
-                    admin_fees[idx].append(
-                            (liquidity[0] + admin_fees_addition) / 1e18
-                    )
-                    fair_admin_fees[idx].append(fair_admin_fees[idx][-1] + d_profit * f_a)
-
-
-                    fair_unstaked_pnl[idx].append(earned_profits[idx][-1] - fair_admin_fees[idx][-1])
-
-                    print(times[idx][-1], labels[idx])
+                unstaked_pps = new_unstaked_pps
+                unstaked_pnl[idx].append(unstaked_pnl[idx][-1] + d_unstaked_value)
+
+                staked_pps_values[idx].append(plain_staked_pps)
+                unstaked_pps_values[idx].append(plain_unstaked_pps)
+
+                staked_fractions[idx].append(staked / (supply or 1))
+
+                f_a = 1.0 - (1.0 - min_admin_fee / 1e18) * (1.0 - staked / (supply or 1))**0.5
+                admin_fees_addition = admin_fees_withdrawn + sum(v for b, v in admin_fees_events.items() if b <= to_block) * unstaked_pps
+                admin_fees[idx].append(
+                        (liquidity[0] + admin_fees_addition) / 1e18
+                )
+                fair_admin_fees[idx].append(fair_admin_fees[idx][-1] + d_profit * f_a)
+
+
+                fair_unstaked_pnl[idx].append(earned_profits[idx][-1] - fair_admin_fees[idx][-1])
+
+                print(times[idx][-1], labels[idx])
 
             admin_fees_withdrawn += sum(admin_fees_events.values()) * unstaked_pps
 
-    # Save all data
-    with open('pnl-log.json', 'w') as f:
-        json.dump({
-            'n': n,
-            'blocks': tblocks,
-            'times': [[t.timestamp() for t in tt] for tt in times],
-            'earned_profits': earned_profits,
-            'admin_fees': admin_fees,
-            'fair_admin_fees': fair_admin_fees,
-            'staked_pnl': staked_pnl,
-            'unstaked_pnl': unstaked_pnl,
-            'fair_unstaked_pnl': fair_unstaked_pnl,
-            'staked_pps': staked_pps_values,
-            'unstaked_pps': unstaked_pps_values
-        }, f)
+    log = {name: [list(col[idx]) for idx in range(n)] for name, col in log_columns.items()}
+    log['times'] = [[t.timestamp() for t in ts] for ts in log['times']]
+    pnl_log.write(log)
 
     fig, ((ax_rel, ax_charged_admin, ax_staked_pnl), (ax_abs, ax_fair_admin, ax_unstaked_pnl)) = plt.subplots(2, 3, sharey=False, sharex=True)
 
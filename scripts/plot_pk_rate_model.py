@@ -1,82 +1,73 @@
 import matplotlib.pyplot as plt
 
-from math import exp
-from brownie import multicall
+import numpy as np
 from datetime import datetime
 from brownie import Contract, config
 from brownie import web3
 
 from brownie import ZERO_ADDRESS
 
+from scripts.pk_rate_model import (
+    COLUMNS, DEBT_RATIO_EMA, START_BLOCK, STEP, SERIES_FILE, load_series, save_series, simulate)
+from scripts.sampler import sample, timestamp_call
+
 config['autofetch_sources'] = True
 
 
-MULTICALL = "0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696"
-# START_BLOCK = 23800000
-START_BLOCK = 21_500_000
 MONETARY_POLICY = "0x8c5A7F011f733fBb0A6c969c058716d5CE9bc933"
-DEBT_RATIO_EMA = 3 * 7 * 86400
-N_PER_EMA = 70
+N_PEG_KEEPERS = 5
+N_CONTROLLERS = 15
+
+
+def fetch(blocks, mp, price_oracle):
+    """Rate model inputs (pk_rate_model.COLUMNS) at `blocks`, two batched passes."""
+    # which peg keepers and controllers are registered at each block
+    registry = sample(blocks, [(mp.peg_keepers, (i,)) for i in range(N_PEG_KEEPERS)]
+                      + [(mp.controllers, (i,)) for i in range(N_CONTROLLERS)], label='registry')
+    pks = {b: [a for a in registry[b][:N_PEG_KEEPERS] if a not in (None, ZERO_ADDRESS)] for b in blocks}
+    controllers = {b: [a for a in registry[b][N_PEG_KEEPERS:] if a not in (None, ZERO_ADDRESS)] for b in blocks}
+    contracts = {a: Contract(a) for b in blocks for a in pks[b] + controllers[b]}
+
+    raw = sample(blocks, lambda b: (
+        [timestamp_call(), (mp.sigma, ()), (mp.target_debt_fraction, ()), (mp.rate0, ()),
+         (price_oracle.price, ())]
+        + [(contracts[a].debt, ()) for a in pks[b]]
+        + [(contracts[a].total_debt, ()) for a in controllers[b]]), label='rate inputs')
+
+    rows = []
+    for b in blocks:
+        ts, sigma, tdf, rate0, p_o, *debts = raw[b]
+        n_pks = len(pks[b])
+        rows.append([b, ts, sigma, tdf, rate0, p_o, sum(debts[:n_pks]), sum(debts[n_pks:])])
+    return {c: np.array(v, dtype=np.int64 if c in ('blocks', 'ts') else np.float64)
+            for c, v in zip(COLUMNS, zip(*rows))}
+
+
+def fetch_series(path=SERIES_FILE):
+    """The cached series extended to the head (only new blocks are sampled)."""
+    mp = Contract(MONETARY_POLICY)
+    price_oracle = Contract(mp.PRICE_ORACLE())
+
+    series = load_series(path)
+    last = int(series['blocks'][-1]) if series is not None else START_BLOCK - STEP
+    blocks = list(range(last + STEP, web3.eth.block_number, STEP))
+    if blocks:
+        fresh = fetch(blocks, mp, price_oracle)
+        if series is not None:
+            fresh = {c: np.concatenate([series[c], v]) for c, v in fresh.items()}
+        series = dict(fresh, start=np.int64(START_BLOCK), step=np.int64(STEP))
+        save_series(series, path)
+    return series
 
 
 def main():
-    mc = Contract(MULTICALL)
-    mp = Contract(MONETARY_POLICY)
+    series = fetch_series()
+    rates_before, rates_after = simulate(series, DEBT_RATIO_EMA)
 
-    price_oracle = Contract(mp.PRICE_ORACLE())
+    times = [datetime.fromtimestamp(t) for t in series['ts']]
 
-    end_block = web3.eth.block_number
-    blocks = list(range(START_BLOCK, end_block, max(DEBT_RATIO_EMA // 13 // N_PER_EMA, 1)))
-
-    times = []
-    rates_before = []
-    rates_after = []
-    debt_ratio_ma = mp.target_debt_fraction() / 1e18
-
-    for block in blocks:
-        with multicall(address=MULTICALL, block_identifier=block):
-            pk_addrs = [mp.peg_keepers(pk_id) for pk_id in range(5)]
-            controllers = [mp.controllers(i) for i in range(15)]
-
-        pks = [Contract(addr) for addr in pk_addrs if addr != ZERO_ADDRESS]
-        controllers = [Contract(addr) for addr in controllers if addr != ZERO_ADDRESS]
-
-        with multicall(address=MULTICALL, block_identifier=block):
-            time = mc.getCurrentBlockTimestamp()
-            sigma = mp.sigma()
-            target_debt_fraction = mp.target_debt_fraction()
-            rate0 = mp.rate0()
-            pk_debts = [pk.debt() for pk in pks]
-            controller_debts = [controller.total_debt() for controller in controllers]
-            p_o = price_oracle.price()
-
-        total_debt = sum(controller_debts)
-        pk_debt = sum(pk_debts)
-
-        debt_ratio = pk_debt / total_debt
-        if len(times) > 0:
-            ema_mul = exp(-(time - times[-1]) / DEBT_RATIO_EMA)
-        else:
-            ema_mul = 0
-        debt_ratio_ma = debt_ratio_ma * ema_mul + debt_ratio * (1 - ema_mul)
-        prev_debt_ratio = debt_ratio
-        power = (1e18 - p_o) / sigma
-        power_before = power - debt_ratio / (target_debt_fraction / 1e18)
-        power_after = power - debt_ratio_ma / (target_debt_fraction / 1e18)
-
-        rate_before = rate0 / 1e18 * (365 * 86400) * exp(power_before)
-        rate_after = rate0 / 1e18 * (365 * 86400) * exp(power_after)
-
-        times.append(time)
-        rates_before.append(100 * rate_before)
-        rates_after.append(100 * rate_after)
-
-        print(datetime.fromtimestamp(time), block)
-
-    times = [datetime.fromtimestamp(t) for t in times]
-
-    plt.plot(times, rates_before, c="gray", label="No EMA")
-    plt.plot(times, rates_after, c="black", label="With EMA on (pk_debt/total_debt)")
+    plt.plot(times, 100 * rates_before, c="gray", label="No EMA")
+    plt.plot(times, 100 * rates_after, c="black", label="With EMA on (pk_debt/total_debt)")
     plt.legend()
     plt.title(f"Borrow rate (EMA time = {DEBT_RATIO_EMA // 86400} days)")
     plt.tick_params("x", rotation=45)
@@ -9,11 +9,12 @@
 import matplotlib.pyplot as plt
 from matplotlib.ticker import ScalarFormatter
 
-from brownie import multicall
 from datetime import datetime
 from brownie import Contract, config
 from brownie import web3
 
+from scripts.sampler import plan_intervals, sample, timestamp_call
+
 config['autofetch_sources'] = True
 
 FACTORY = "0x370a449FeBb9411c95bf897021377fe0B7D100c0"
@@ -22,10 +23,19 @@ START_BLOCK = 23555000  # <- 11 Oct
 BATCH_SIZE = 500
 ADJUST = False
 
+# views read at every boundary block, per market: (key, contract, method)
+VIEWS = [
+    ('value', 'amm', 'value_oracle'),
+    ('oracle', 'pool', 'price_oracle'),
+    ('scale', 'pool', 'price_scale'),
+    ('xcp', 'pool', 'xcp_profit'),
+    ('vp', 'pool', 'get_virtual_price'),
+    ('debt', 'amm', 'get_debt'),
+    ('collateral', 'amm', 'collateral_amount'),
+]
 
-def main():
-    mc = Contract("0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696")
 
+def main():
     factory = Contract(FACTORY)
     n = factory.market_count()
     markets = [factory.markets(i) for i in range(n)]
@@ -46,77 +56,73 @@ def main():
     growth_scale_values_adj = [[1.0] for i in range(n)]
     staked_pps = [[1.0] for i in range(n)]
 
+    # one log scan for the LT Deposit/Withdraw of every market, then the
+    # boundary blocks' views in bulk (see sampler.py); whole batches only
+    end = current_block - (current_block - START_BLOCK) % BATCH_SIZE
+    plans, _ = plan_intervals([[(lt, ('Deposit', 'Withdraw'))] for lt in lts], START_BLOCK, end, BATCH_SIZE)
+    intervals = [[interval for batch in plan for interval in batch] for plan in plans]
+
+    width = len(VIEWS)
+    calls = [timestamp_call()]
+    for amm, pool in zip(amms, cryptopools):
+        calls += [(getattr(amm if c == 'amm' else pool, name), ()) for _, c, name in VIEWS]
+    sample_blocks = {b for iv in intervals for interval in iv for b in interval}
+    raw = sample(sample_blocks, calls, label='state')
+
+    def state_at(block, idx):
+        st = dict(zip([k for k, *_ in VIEWS], raw[block][1 + idx * width:1 + (idx + 1) * width]))
+        st['time'] = raw[block][0]
+        # value_oracle_for of the (optionally xcp-adjusted) collateral and the debt
+        st['collateral'] = int(st['collateral'] * ((10**18 + st['xcp']) / (2 * st['vp']) if ADJUST else 1))
+        return st
+
+    states = {(b, idx): state_at(b, idx) for idx in range(n) for b in {b for interval in intervals[idx] for b in interval}}
+    raw_adj = sample(sample_blocks, lambda b: [(amms[idx].value_oracle_for, (states[(b, idx)]['collateral'], states[(b, idx)]['debt']))
+                                               for idx in range(n) if (b, idx) in states], label='value_oracle_for')
+    value_adj = {}
+    for b, values in raw_adj.items():
+        for idx, v in zip([idx for idx in range(n) if (b, idx) in states], values):
+            value_adj[(b, idx)] = v[1]
+
     for idx in range(n):
-        lt = lts[idx]
-        amm = amms[idx]
-        pool = cryptopools[idx]
-
-        for block in range(START_BLOCK, current_block - (BATCH_SIZE - 1), BATCH_SIZE):
-            deposits = lt.events.Deposit.get_logs(fromBlock=block, toBlock=block+BATCH_SIZE-1)
-            withdrawals = lt.events.Withdraw.get_logs(fromBlock=block, toBlock=block+BATCH_SIZE-1)
-            blocks = set([ev['blockNumber'] for ev in deposits] + [ev['blockNumber'] for ev in withdrawals])
-
-            batch_end = min(current_block, block + BATCH_SIZE)
-            blocks.add(block)
-            blocks.add(batch_end)
-            blocks = sorted(blocks)
-            to_value = 0
-            to_oracle = 0
-            to_scale = 0
-
-            for from_block, to_block in zip(blocks[:-1], blocks[1:]):
-                to_block -= 1
-
-                if to_block > from_block:
-                    with multicall(address=mc.address, block_identifier=from_block):
-                        from_value = amm.value_oracle()
-                        from_oracle = pool.price_oracle()
-                        from_scale = pool.price_scale()
-                        from_xcp = pool.xcp_profit()
-                        from_vp = pool.get_virtual_price()
-                        from_debt = amm.get_debt()
-                        from_collateral = amm.collateral_amount()
-
-                    with multicall(address=mc.address, block_identifier=to_block):
-                        to_value = amm.value_oracle()
-                        to_oracle = pool.price_oracle()
-                        to_scale = pool.price_scale()
-                        time = mc.getCurrentBlockTimestamp()
-                        to_xcp = pool.xcp_profit()
-                        to_vp = pool.get_virtual_price()
-                        to_debt = amm.get_debt()
-                        to_collateral = amm.collateral_amount()
-
-                    from_collateral = int(from_collateral * ((10**18 + from_xcp) / (2 * from_vp) if ADJUST else 1))
-                    to_collateral = int(to_collateral * ((10**18 + to_xcp) / (2 * to_vp) if ADJUST else 1))
-
-                    from_value_adj = amm.value_oracle_for(from_collateral, from_debt, block_identifier=from_block)[1]
-                    to_value_adj = amm.value_oracle_for(to_collateral, to_debt, block_identifier=to_block)[1]
-
-                    tblocks[idx].append(to_block)
-                    times[idx].append(datetime.fromtimestamp(time))
-
-                    from_value_oracle = from_value[1] / from_oracle
-                    from_value_scale = from_value[1] / from_scale
-                    to_value_oracle = to_value[1] / to_oracle
-                    to_value_scale = to_value[1] / to_scale
-                    growth_oracle_mul = (to_value_oracle / from_value_oracle)
-                    scale_oracle_mul = (to_value_scale / from_value_scale)
-                    growth_oracle[idx] *= growth_oracle_mul
-                    growth_scale[idx] *= scale_oracle_mul
-                    growth_oracle_values[idx].append(growth_oracle[idx])
-                    growth_scale_values[idx].append(growth_scale[idx])
-
-                    from_value_adj /= from_scale
-                    to_value_adj /= to_scale
-                    growth_mul_adj = to_value_adj / from_value_adj
-                    growth_scale_adj[idx] *= growth_mul_adj
-                    growth_scale_values_adj[idx].append(growth_scale_adj[idx])
-
-                    new_staked_pps = min(staked_pps[idx][-1] * growth_mul_adj, 1.0)
-                    staked_pps[idx].append(new_staked_pps)
-
-                    print(times[idx][-1], labels[idx])
+        for from_block, to_block in intervals[idx]:
+            f = states[(from_block, idx)]
+            t = states[(to_block, idx)]
+            from_value = f['value']
+            from_oracle = f['oracle']
+            from_scale = f['scale']
+            to_value = t['value']
+            to_oracle = t['oracle']
+            to_scale = t['scale']
+            time = t['time']
+
+            from_value_adj = value_adj[(from_block, idx)]
+            to_value_adj = value_adj[(to_block, idx)]
+
+            tblocks[idx].append(to_block)
+            times[idx].append(datetime.fromtimestamp(time))
+
+            from_value_oracle = from_value[1] / from_oracle
+            from_value_scale = from_value[1] / from_scale
+            to_value_oracle = to_value[1] / to_oracle
+            to_value_scale = to_value[1] / to_scale
+            growth_oracle_mul = (to_value_oracle / from_value_oracle)
+            scale_oracle_mul = (to_value_scale / from_value_scale)
+            growth_oracle[idx] *= growth_oracle_mul
+            growth_scale[idx] *= scale_oracle_mul
+            growth_oracle_values[idx].append(growth_oracle[idx])
+            growth_scale_values[idx].append(growth_scale[idx])
+
+            from_value_adj /= from_scale
+            to_value_adj /= to_scale
+            growth_mul_adj = to_value_adj / from_value_adj
+            growth_scale_adj[idx] *= growth_mul_adj
+            growth_scale_values_adj[idx].append(growth_scale_adj[idx])
+
+            new_staked_pps = min(staked_pps[idx][-1] * growth_mul_adj, 1.0)
+            staked_pps[idx].append(new_staked_pps)
+
+            print(times[idx][-1], labels[idx])
 
     colors = ['orange', 'blue', 'gray']
     for idx in range(n):
@@ -1,53 +1,32 @@
 import matplotlib.pyplot as plt
 from matplotlib.ticker import ScalarFormatter
 
-import numpy as np
-from brownie import multicall
-from collections import defaultdict
 from datetime import datetime
 from brownie import Contract, config
-from brownie import web3
+
+from scripts.sampler import grid_states, select
 
 config['autofetch_sources'] = True
 
-FACTORY = "0x370a449FeBb9411c95bf897021377fe0B7D100c0"
 START_BLOCK = 23784145 + 100
 N_POINTS = 500
+MARKET_IDS = [3, 4, 5]
 n = 3
 
 
 def main():
-    mc = Contract("0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696")
-
-    factory = Contract(FACTORY)
-    markets = [factory.markets(i) for i in [3, 4, 5]]
-    lts = [Contract(m[3]) for m in markets]
-    stakers = [Contract(lt.staker()) for lt in lts]
-    labels = [lt.symbol() for lt in lts]
-
-    current_block = web3.eth.block_number
-    blocks = [int(b) for b in np.linspace(START_BLOCK, current_block, N_POINTS)]
-
-    times = []
-    unstaked_pps = defaultdict(list)
-    staked_pps = defaultdict(list)
-
-    for b in blocks:
-        pps_u = {}
-        pps_s = {}
-        with multicall(address=mc.address, block_identifier=b):
-            t = mc.getCurrentBlockTimestamp()
-            for i in range(n):
-                pps_u[i] = lts[i].pricePerShare()
-                pps_s[i] = stakers[i].previewRedeem(10**18)
-
-        t = datetime.fromtimestamp(t)
-        print(t)
-        times.append(t)
-
-        for i in range(n):
-            unstaked_pps[i].append(pps_u[i] / 1e18)
-            staked_pps[i].append(pps_s[i] / 1e18 * pps_u[i] / 1e18)
+    states = grid_states()
+    rows = select(states, START_BLOCK, N_POINTS)
+    labels = [Contract(states['lts'][m]).symbol() for m in MARKET_IDS]
+
+    times = [datetime.fromtimestamp(t) for t in states['ts'][rows]]
+    unstaked_pps = {}
+    staked_pps = {}
+    for i, m in enumerate(MARKET_IDS):
+        pps_u = states['pps'][rows, m]
+        pps_s = states['staked_redeem'][rows, m]
+        unstaked_pps[i] = pps_u / 1e18
+        staked_pps[i] = pps_s / 1e18 * pps_u / 1e18
 
     fig, (ax_unstaked, ax_staked) = plt.subplots(1, 2, sharey=True)
 
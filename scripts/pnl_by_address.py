@@ -5,18 +5,44 @@ from brownie import Contract, config
 from brownie import web3
 from brownie import ZERO_ADDRESS
 
+from scripts import pnl_log
+
 
 config['autofetch_sources'] = True
 
-PNL_LOG_FILE = "pnl-log.json"
+PNL_LOG_COLUMNS = ['blocks', 'staked_pps', 'unstaked_pps', 'unstaked_pnl', 'fair_unstaked_pnl']
 FACTORY = "0x370a449FeBb9411c95bf897021377fe0B7D100c0"
 BATCH_SIZE = 500
 MARKET_IDS = [0, 1, 2]
 
 
+def add_transfer(changes, ev):
+    """Record a Transfer as balance changes of sender and receiver."""
+    for addr, sign in ((ev.args.sender, -1), (ev.args.receiver, 1)):
+        blocks, deltas = changes.setdefault(addr, ([], []))
+        blocks.append(ev.blockNumber)
+        deltas.append(sign * ev.args.value / 1e18)
+
+
+def to_steps(changes):
+    """
+    Balance as a step function: (change blocks, balance from that block on).
+    Changes are summed in event order, the same float additions the dense
+    per-block arrays used to make.
+    """
+    blocks, deltas = changes
+    return np.array(blocks), np.cumsum(deltas)
+
+
+def balance_at(steps, blocks):
+    """Balances at the given blocks (0 before the first change)."""
+    change_blocks, balances = steps
+    i = np.searchsorted(change_blocks, blocks, side='right') - 1
+    return np.where(i >= 0, balances[np.maximum(i, 0)], 0.0)
+
+
 def main():
-    with open(PNL_LOG_FILE, 'r') as f:
-        data = json.load(f)
+    data = pnl_log.load(columns=PNL_LOG_COLUMNS)
 
     factory = Contract(FACTORY)
     markets = [factory.markets(i) for i in MARKET_IDS]
@@ -29,9 +55,9 @@ def main():
     start_time = datetime.fromtimestamp(web3.eth.get_block(start_block).timestamp)
     times = [[start_time] for i in MARKET_IDS]
     
-    # market_id -> address -> np.array([balances])
-    lt_balances = [{} for i in MARKET_IDS]
-    st_balances = [{} for i in MARKET_IDS]
+    # market_id -> address -> ([blocks], [balance changes]), in event order
+    lt_changes = [{} for i in MARKET_IDS]
+    st_changes = [{} for i in MARKET_IDS]
 
     for idx in MARKET_IDS:
         lt = lts[idx]
@@ -43,25 +69,16 @@ def main():
             st_transfers = staker.events.Transfer.get_logs(fromBlock=block, toBlock=to_block)
 
             for ev in lt_transfers:
-                start_idx = ev.blockNumber - start_block
-                if ev.args.sender not in lt_balances[idx]:
-                    lt_balances[idx][ev.args.sender] = np.zeros(max_block + 1 - start_block)
-                if ev.args.receiver not in lt_balances[idx]:
-                    lt_balances[idx][ev.args.receiver] = np.zeros(max_block + 1 - start_block)
-                lt_balances[idx][ev.args.sender][start_idx:] -= ev.args.value / 1e18
-                lt_balances[idx][ev.args.receiver][start_idx:] += ev.args.value / 1e18
-
+                add_transfer(lt_changes[idx], ev)
             for ev in st_transfers:
-                start_idx = ev.blockNumber - start_block
-                if ev.args.sender not in st_balances[idx]:
-                    st_balances[idx][ev.args.sender] = np.zeros(max_block + 1 - start_block)
-                if ev.args.receiver not in st_balances[idx]:
-                    st_balances[idx][ev.args.receiver] = np.zeros(max_block + 1 - start_block)
-                st_balances[idx][ev.args.sender][start_idx:] -= ev.args.value / 1e18
-                st_balances[idx][ev.args.receiver][start_idx:] += ev.args.value / 1e18
+                add_transfer(st_changes[idx], ev)
 
             print(f'Pool {labels[idx]}: {(block - start_block) * 100 / (max_block - start_block):.1f}%, {len(lt_transfers) + len(st_transfers)} transfers')
 
+    # market_id -> address -> (change blocks, balance after each change)
+    lt_balances = [{a: to_steps(c) for a, c in m.items()} for m in lt_changes]
+    st_balances = [{a: to_steps(c) for a, c in m.items()} for m in st_changes]
+
     print()
     print('=====================')
     for idx in MARKET_IDS:
@@ -70,8 +87,8 @@ def main():
         kw = {'block_identifier': max_block}
         expected_supply_lt = (lt.totalSupply(**kw) - lt.balanceOf(st.address, **kw)) / 1e18
         expected_supply_st = st.totalSupply(**kw) / 1e18
-        measured_supply_lt = sum(v[-1] for a, v in lt_balances[idx].items() if a not in [ZERO_ADDRESS, st.address])
-        measured_supply_st = sum(v[-1] for a, v in st_balances[idx].items() if a not in [ZERO_ADDRESS, st.address])
+        measured_supply_lt = sum(v[1][-1] for a, v in lt_balances[idx].items() if a not in [ZERO_ADDRESS, st.address])
+        measured_supply_st = sum(v[1][-1] for a, v in st_balances[idx].items() if a not in [ZERO_ADDRESS, st.address])
         print(f'Pool {labels[idx]}:')
         print(f'    * {len(lt_balances[idx]) + len(st_balances[idx])} addresses')
         print(f'    * Unstaked supply: measured = {measured_supply_lt:.4f}, expected = {expected_supply_lt:.4f}')
@@ -84,32 +101,44 @@ def main():
         addrs = (set(lt_balances[idx].keys()) | set(st_balances[idx].keys())).difference([ZERO_ADDRESS, stakers[idx].address])
         addrs = sorted(addrs)
 
+        # pps increments per sample do not depend on the address
+        blocks = []
+        d_staked = []
+        d_unstaked = []
+        prev_staked_pps = 1.0
+        prev_unstaked_pps = 1.0
+        for b, staked_pps, unstaked_pps, unstaked_pnl, fair_unstaked_pnl in zip(
+                data['blocks'][idx], data['staked_pps'][idx], data['unstaked_pps'][idx], data['unstaked_pnl'][idx], data['fair_unstaked_pnl'][idx]):
+            if staked_pps is None or staked_pps == 0:
+                staked_pps = 1.0
+            if unstaked_pps is None or unstaked_pps == 0:
+                unstaked_pps = 1.0
+
+            unstaked_pps_modified = unstaked_pps
+            if unstaked_pps > 1:
+                unstaked_pps_modified = 1 + (unstaked_pps - 1) * (1 - fair_unstaked_pnl / unstaked_pnl)
+
+            blocks.append(b)
+            d_unstaked.append(unstaked_pps_modified - prev_unstaked_pps)
+            d_staked.append(staked_pps - prev_staked_pps)
+            prev_staked_pps = staked_pps
+            prev_unstaked_pps = unstaked_pps_modified
+        d_unstaked = np.array(d_unstaked)
+        d_staked = np.array(d_staked)
+
+        # balances were indexed from start_block while samples count from this
+        # market's first block: keep that offset so the output is unchanged
+        lookup = np.array(blocks, dtype=np.int64) - data['blocks'][idx][0] + start_block
+
         for addr in addrs:
-            b0 = data['blocks'][idx][0]
-            prev_staked_pps = 1.0
-            prev_unstaked_pps = 1.0
-            user_pnl[idx][addr] = 0.0
             print(f'Processing {labels[idx]}:{addr}...', end='   ')
-
-            for b, staked_pps, unstaked_pps, unstaked_pnl, fair_unstaked_pnl in zip(
-                    data['blocks'][idx], data['staked_pps'][idx], data['unstaked_pps'][idx], data['unstaked_pnl'][idx], data['fair_unstaked_pnl'][idx]):
-                if staked_pps is None or staked_pps == 0:
-                    staked_pps = 1.0
-                if unstaked_pps is None or unstaked_pps == 0:
-                    unstaked_pps = 1.0
-
-                unstaked_pps_modified = unstaked_pps
-                if unstaked_pps > 1:
-                    unstaked_pps_modified = 1 + (unstaked_pps - 1) * (1 - fair_unstaked_pnl / unstaked_pnl)
- 
-                if addr in lt_balances[idx]:
-                    user_pnl[idx][addr] += (unstaked_pps_modified - prev_unstaked_pps) * lt_balances[idx][addr][b - b0]
-                if addr in st_balances[idx]:
-                    user_pnl[idx][addr] += (staked_pps - prev_staked_pps) * st_balances[idx][addr][b - b0]
-
-                prev_staked_pps = staked_pps
-                prev_unstaked_pps = unstaked_pps_modified
-
+            terms = np.zeros((len(blocks) + 1, 2))
+            if addr in lt_balances[idx]:
+                terms[1:, 0] = d_unstaked * balance_at(lt_balances[idx][addr], lookup)
+            if addr in st_balances[idx]:
+                terms[1:, 1] = d_staked * balance_at(st_balances[idx][addr], lookup)
+            # cumsum adds in sample order from 0.0, like the running sum it replaces
+            user_pnl[idx][addr] = float(np.cumsum(terms.ravel())[-1])
             print(f'PNL = {user_pnl[idx][addr]}')
 
     with open('user-pnl.json', 'w') as f:
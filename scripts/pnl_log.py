@@ -0,0 +1,141 @@
+"""
+Columnar PnL log (pnl-log.npz) written by plot_fundamental_value_split.py.
+
+The log used to be one pnl-log.json: parallel Python lists per market, dumped
+at the end of the run and reloaded whole by every reader. Here it is an .npz
+(a zip of .npy members) holding
+
+    schema              int64, SCHEMA
+    n                   int64, number of markets
+    m<idx>/<column>/<seq>   float64 / int64 chunk of one column of market idx
+
+The split script recomputes the whole series on every run (its running state
+is not restartable mid-way), so the log is written once with `write`, one
+chunk per column; the <seq> level is kept so the layout can take extra chunks
+later without a schema bump. np.load only decompresses the members a reader
+asks for: `column` reads one column of one market, `load` returns the old
+JSON layout (dict of per-market lists) for the readers that want all of it.
+
+None values (e.g. staked pps before anyone staked) are stored as NaN and
+exported back to null by `export_json`, which writes the same pnl-log.json
+the split script used to; `import_json` converts an existing JSON log.
+
+    brownie run scripts/pnl_log.py                       # npz -> pnl-log.json
+    python scripts/pnl_log.py --export pnl-log.json
+    python scripts/pnl_log.py --import pnl-log.json      # json -> pnl-log.npz
+"""
+import argparse
+import json
+import os
+import zipfile
+
+import numpy as np
+
+
+SCHEMA = 1
+PNL_LOG_FILE = "pnl-log.npz"
+COLUMNS = {
+    'blocks': np.int64,
+    'times': np.float64,
+    'earned_profits': np.float64,
+    'admin_fees': np.float64,
+    'fair_admin_fees': np.float64,
+    'staked_pnl': np.float64,
+    'unstaked_pnl': np.float64,
+    'fair_unstaked_pnl': np.float64,
+    'staked_pps': np.float64,
+    'unstaked_pps': np.float64,
+}
+
+
+def _write(zf, name, arr):
+    with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asarray(arr), allow_pickle=False)
+
+
+def _as_array(values, dtype):
+    return np.array([np.nan if v is None else v for v in values], dtype=dtype)
+
+
+def write(log, path=PNL_LOG_FILE):
+    """Write a whole log {column: [per-market list]} (all COLUMNS), replacing any old one."""
+    if set(log) - {'n'} != set(COLUMNS):
+        raise ValueError(f"expected columns {sorted(COLUMNS)}, got {sorted(set(log) - {'n'})}")
+    n = len(log['blocks'])
+    tmp = path + '.tmp'
+    with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+        _write(zf, 'schema', np.int64(SCHEMA))
+        _write(zf, 'n', np.int64(n))
+        for idx in range(n):
+            lengths = {len(log[name][idx]) for name in COLUMNS}
+            if len(lengths) != 1:
+                raise ValueError(f"market {idx}: columns of unequal length: {lengths}")
+            if lengths == {0}:
+                continue
+            for name, dtype in COLUMNS.items():
+                _write(zf, f'm{idx}/{name}/{0:06d}', _as_array(log[name][idx], dtype))
+    os.replace(tmp, path)
+
+
+def open_log(path=PNL_LOG_FILE):
+    """np.load of the log, after checking the schema version."""
+    data = np.load(path)
+    schema = int(data['schema'])
+    if schema != SCHEMA:
+        raise ValueError(f"{path}: schema {schema}, expected {SCHEMA}")
+    return data
+
+
+def column(data, idx, name):
+    """One column of market idx as an array (only its chunks are read)."""
+    prefix = f'm{idx}/{name}/'
+    chunks = sorted(f for f in data.files if f.startswith(prefix))
+    if not chunks:
+        return np.empty(0, dtype=COLUMNS[name])
+    return np.concatenate([data[f] for f in chunks])
+
+
+def load(path=PNL_LOG_FILE, columns=None):
+    """
+    The log in the old JSON layout: {'n': n, column: [per-market list]},
+    NaN turned back into None.
+    """
+    data = open_log(path)
+    n = int(data['n'])
+    out = {'n': n}
+    for name in columns or COLUMNS:
+        out[name] = [[None if v != v else v for v in column(data, idx, name).tolist()]
+                     for idx in range(n)]
+    return out
+
+
+def export_json(path=PNL_LOG_FILE, out="pnl-log.json"):
+    with open(out, 'w') as f:
+        json.dump(load(path), f)
+
+
+def import_json(src="pnl-log.json", path=PNL_LOG_FILE):
+    with open(src, 'r') as f:
+        log = json.load(f)
+    write({name: log[name] for name in COLUMNS}, path)
+
+
+def main():
+    export_json()
+    print(f"{PNL_LOG_FILE} -> pnl-log.json")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--log", default=PNL_LOG_FILE)
+    mode = ap.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--export", metavar="JSON", help="write the log as JSON")
+    mode.add_argument("--import", dest="src", metavar="JSON", help="convert a JSON log")
+    args = ap.parse_args()
+    if args.src:
+        import_json(args.src, args.log)
+        print(f"{args.src} -> {args.log}")
+    else:
+        export_json(args.log, args.export)
+        print(f"{args.log} -> {args.export}")
@@ -0,0 +1,370 @@
+"""
+Batched on-chain reads for the scripts/ plots.
+
+The plots used to read state through one `brownie.multicall` context per
+block (a Multicall2 round-trip plus per-call Python overhead, strictly one
+block after the other) and events through one `get_logs` per event type per
+500-block batch. Here:
+
+  aggregate(calls, block)   every (ContractCall, args) in `calls` in ONE
+                            Multicall3.aggregate3 eth_call at `block`
+                            (allowFailure: a reverting view reads None),
+                            decoded with brownie's own ABI decoding, so values
+                            are the same types a direct call returns
+  sample(blocks, calls)     aggregate() over many blocks on a thread pool
+  scan_logs(...)            one eth_getLogs per LOG_CHUNK blocks for all
+                            addresses and topics at once, chunks in parallel,
+                            a chunk the node refuses is split in half
+  plan_intervals(...)       one scan_logs for the events of every market,
+                            cutting fixed block batches into the intervals
+                            between them (the event-split plots)
+
+Grid dataset. The YB pool plots (plot_yb_pools_pps / _debt / _imbalance /
+_mod, plot_yb_price_scale) all sample N_POINTS blocks between their
+START_BLOCK and the head, each with its own serial multicall loop over
+overlapping views. `grid_states` instead samples every YB market on ONE
+shared grid (every GRID_STEP blocks from GRID_START) with the union of those
+views (MARKET_VIEWS, value_oracle_for of the xcp-adjusted collateral, the
+Chainlink BTC/USD answer) and caches it in STATES_FILE. A later call only
+samples the grid blocks past the cached head (everything again if the
+factory gained a market); a plot then picks its ~N_POINTS blocks with
+`select`, oracle_backtest.py uses every grid row.
+
+crvUSD pool panel. The plot_crvusd_pools_* plots read totalSupply,
+get_virtual_price and the gauge's balanceOf of the same PANEL_POOLS per
+block. `pool_panel` samples those (and the pool balances) on the grid from
+PANEL_START into PANEL_FILE with the same incremental cache; the plots sum
+`panel_usd` columns of the rows `select` picks.
+"""
+import os
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+from brownie import Contract, web3
+from hexbytes import HexBytes
+
+
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+WORKERS = 16
+LOG_CHUNK = 20_000
+
+
+@lru_cache(maxsize=None)
+def multicall3():
+    return Contract(MULTICALL3)
+
+
+def timestamp_call():
+    """(ContractCall, args) reading the block timestamp inside aggregate()."""
+    return multicall3().getCurrentBlockTimestamp, ()
+
+
+def aggregate(calls, block):
+    """
+    Values of [(ContractCall, args)] at `block`; None where a call reverted
+    or hit an address without code yet.
+    """
+    payload = [(method._address, True, method.encode_input(*args)) for method, args in calls]
+    results = multicall3().aggregate3.call(payload, block_identifier=block)
+    return [method.decode_output(data) if ok and len(HexBytes(data)) else None
+            for (method, _), (ok, data) in zip(calls, results)]
+
+
+def sample(blocks, calls, workers=WORKERS, label='blocks'):
+    """
+    {block: aggregate(calls(block), block)} for every block. `calls` is a list
+    of (ContractCall, args) or a function of the block returning one.
+    """
+    blocks = sorted(set(blocks))
+    get = calls if callable(calls) else (lambda block: calls)
+    multicall3()  # create the Contract once, outside the workers
+    out = {}
+    step = max(len(blocks) // 20, 1)
+    with ThreadPoolExecutor(workers) as pool:
+        for i, (block, values) in enumerate(zip(blocks, pool.map(lambda b: aggregate(get(b), b), blocks))):
+            out[block] = values
+            if (i + 1) % step == 0 or i + 1 == len(blocks):
+                print(f'{label}: {i + 1}/{len(blocks)} sampled')
+    return out
+
+
+def _get_logs(addresses, topics, from_block, to_block):
+    try:
+        return web3.eth.get_logs({
+            'address': addresses, 'topics': [topics],
+            'fromBlock': from_block, 'toBlock': to_block})
+    except Exception:
+        if to_block <= from_block:
+            raise
+        mid = (from_block + to_block) // 2
+        return (_get_logs(addresses, topics, from_block, mid)
+                + _get_logs(addresses, topics, mid + 1, to_block))
+
+
+def scan_logs(addresses, topics, from_block, to_block, workers=WORKERS):
+    """All logs of `addresses` whose topic0 is in `topics`, in chain order."""
+    ranges = [(b, min(b + LOG_CHUNK - 1, to_block)) for b in range(from_block, to_block + 1, LOG_CHUNK)]
+    with ThreadPoolExecutor(workers) as pool:
+        chunks = pool.map(lambda r: _get_logs(list(addresses), list(topics), *r), ranges)
+        logs = [log for chunk in chunks for log in chunk]
+    return sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex']))
+
+
+def plan_intervals(contracts_events, start, end, batch, keep=()):
+    """
+    Batches of `batch` blocks from `start` (the last one clipped to `end`) cut
+    at the event blocks of each market.
+
+    contracts_events[i] is [(Contract, event names)] of market i, all read in
+    one scan_logs. In the batch starting at b, market i's events in
+    [b, min(b + batch - 1, end)] split [b, min(b + batch, end)] into
+    (from_block, to_block - 1) intervals between consecutive cuts (empty ones
+    dropped). Events named in `keep` are returned without cutting.
+
+    Returns (plans, events): plans[i][k] is the interval list of market i in
+    batch k, events[i] the [(name, log)] of market i in chain order.
+    """
+    n = len(contracts_events)
+    starts = list(range(start, end, batch))
+    if not starts:
+        return [[] for i in range(n)], [[] for i in range(n)]
+
+    kinds = {}
+    for idx, contracts in enumerate(contracts_events):
+        for contract, names in contracts:
+            for name in names:
+                kinds[(contract.address.lower(), HexBytes(contract.topics[name]))] = (idx, name)
+    addresses = {c.address for contracts in contracts_events for c, _ in contracts}
+    topics = {c.topics[name] for contracts in contracts_events for c, names in contracts for name in names}
+    logs = scan_logs(addresses, topics, start, min(starts[-1] + batch - 1, end))
+
+    events = [[] for i in range(n)]
+    for log in logs:
+        kind = kinds.get((log['address'].lower(), HexBytes(log['topics'][0])))
+        if kind is not None:
+            events[kind[0]].append((kind[1], log))
+
+    plans = [[] for i in range(n)]
+    for idx in range(n):
+        cuts = sorted({log['blockNumber'] for name, log in events[idx] if name not in keep})
+        for block in starts:
+            blocks = set(cuts[bisect_left(cuts, block):bisect_right(cuts, min(block + batch - 1, end))])
+            blocks.add(block)
+            blocks.add(min(end, block + batch))
+            blocks = sorted(blocks)
+            plans[idx].append([(from_block, to_block - 1) for from_block, to_block in zip(blocks[:-1], blocks[1:])
+                               if to_block - 1 > from_block])
+    return plans, events
+
+
+# ──────────── shared grid dataset ────────────
+
+FACTORY = "0x370a449FeBb9411c95bf897021377fe0B7D100c0"
+CL_FEED = "0xF4030086522a5bEEa4988F8cA5B36dbC97BeE88c"
+GRID_START = 23434125
+GRID_STEP = 500
+STATES_FILE = "yb-states.npz"
+STATES_SCHEMA = 2
+
+# per market: (column, contract key, method, args); stored as float64
+MARKET_VIEWS = [
+    ('pps', 'lt', 'pricePerShare', ()),
+    ('staked_redeem', 'staker', 'previewRedeem', (10**18,)),
+    ('b0', 'pool', 'balances', (0,)),
+    ('b1', 'pool', 'balances', (1,)),
+    ('price_oracle', 'pool', 'price_oracle', ()),
+    ('price_scale', 'pool', 'price_scale', ()),
+    ('xcp', 'pool', 'xcp_profit', ()),
+    ('vp', 'pool', 'get_virtual_price', ()),
+    ('A', 'pool', 'A', ()),
+    ('debt', 'amm', 'get_debt', ()),
+    ('collateral', 'amm', 'collateral_amount', ()),
+    ('supply', 'lt', 'totalSupply', ()),
+    ('liquidity', 'lt', 'liquidity', ()),  # -> liq_admin, liq_total, liq_ideal_staked, liq_staked
+]
+LIQUIDITY = ['liq_admin', 'liq_total', 'liq_ideal_staked', 'liq_staked']
+MARKET_COLUMNS = [c for c, *_ in MARKET_VIEWS if c != 'liquidity'] + LIQUIDITY + ['value_adj']
+
+
+def yb_markets(factory=FACTORY):
+    """[{'lt', 'amm', 'pool', 'staker'}] Contracts for every factory market."""
+    factory = Contract(factory)
+    out = []
+    for i in range(factory.market_count()):
+        m = factory.markets(i)
+        lt, amm = Contract(m[3]), Contract(m[2])
+        out.append({'lt': lt, 'amm': amm, 'pool': Contract(amm.COLLATERAL()),
+                    'staker': Contract(lt.staker())})
+    return out
+
+
+def _sample_grid(blocks, markets, feed):
+    """Float columns for `blocks`: ts, cl_price and (blocks, markets) per MARKET_COLUMNS."""
+    calls = [timestamp_call(), (feed.latestAnswer, ())]
+    for m in markets:
+        calls += [(getattr(m[key], method), args) for _, key, method, args in MARKET_VIEWS]
+    raw = sample(blocks, calls, label='grid')
+
+    width = len(MARKET_VIEWS)
+    views = {}  # (block, i) -> {column: raw value}
+    for b in blocks:
+        for i in range(len(markets)):
+            views[(b, i)] = dict(zip([c for c, *_ in MARKET_VIEWS], raw[b][2 + i * width:2 + (i + 1) * width]))
+
+    # value_oracle_for(collateral * (1 + xcp) / (2 vp), debt), integer math as in plot_yb_pools_mod
+    value_args = {b: [] for b in blocks}  # block -> [(market, (collateral, debt))]
+    for (b, i), v in views.items():
+        if None not in (v['collateral'], v['xcp'], v['vp'], v['debt']) and v['vp']:
+            value_args[b].append((i, (v['collateral'] * (10**18 + v['xcp']) // (2 * v['vp']), v['debt'])))
+    raw_value = sample(blocks, lambda b: [(markets[i]['amm'].value_oracle_for, args) for i, args in value_args[b]],
+                       label='value_oracle_for')
+
+    nan = float('nan')
+    out = {
+        'blocks': np.array(blocks, dtype=np.int64),
+        'ts': np.array([raw[b][0] for b in blocks], dtype=np.int64),
+        'cl_price': np.array([nan if raw[b][1] is None else raw[b][1] for b in blocks], dtype=np.float64),
+    }
+    for c in MARKET_COLUMNS:
+        out[c] = np.full((len(blocks), len(markets)), nan)
+    for j, b in enumerate(blocks):
+        for i in range(len(markets)):
+            for c, v in views[(b, i)].items():
+                if v is None:
+                    continue
+                if c == 'liquidity':
+                    for name, x in zip(LIQUIDITY, v):
+                        out[name][j, i] = x
+                else:
+                    out[c][j, i] = v
+        for (i, _), v in zip(value_args[b], raw_value[b]):
+            if v is not None:
+                out['value_adj'][j, i] = v[1]
+    return out
+
+
+def _extend(path, schema, ident, start, sample_blocks):
+    """
+    Dataset cached at `path` on the grid every GRID_STEP blocks from `start`,
+    extended to the head: only grid blocks past the cached head go through
+    `sample_blocks(blocks)` (-> {column: array}, rows first). `ident`
+    ({name: array} of contracts and constants) is stored with the columns; if
+    it or the schema changed, everything is sampled again.
+    """
+    head = web3.eth.block_number
+    grid = np.arange(start, head + 1, GRID_STEP)
+
+    cached = None
+    if os.path.exists(path):
+        with np.load(path) as f:
+            cached = {k: f[k] for k in f.files}
+        if int(cached['schema']) != schema or any(
+                k not in cached or list(cached[k]) != list(v) for k, v in ident.items()):
+            print(f'{path}: schema or contract set changed, sampling again')
+            cached = None
+    last = int(cached['blocks'][-1]) if cached is not None and cached['blocks'].size else start - 1
+
+    new_blocks = [int(b) for b in grid[grid > last]]
+    if not new_blocks:
+        return cached
+    print(f'{path}: sampling {len(new_blocks)} grid blocks')
+    fresh = sample_blocks(new_blocks)
+    if cached is not None:
+        fresh = {k: np.concatenate([cached[k], v]) for k, v in fresh.items()}
+    states = dict(fresh, schema=np.int64(schema), **ident)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **states)
+    os.replace(tmp, path)
+    return states
+
+
+def grid_states(path=STATES_FILE, factory=FACTORY):
+    """
+    The cached grid dataset, extended to the current head: dict of 'blocks',
+    'ts', 'cl_price' (1-D), 'lts', 'decimals' (per market) and MARKET_COLUMNS
+    as (blocks, markets) float64 arrays (NaN where a market did not exist).
+    """
+    markets = yb_markets(factory)
+    ident = {
+        'lts': np.array([m['lt'].address for m in markets]),
+        'decimals': np.array([Contract(m['lt'].ASSET_TOKEN()).decimals() for m in markets], dtype=np.int64),
+    }
+    return _extend(path, STATES_SCHEMA, ident, GRID_START,
+                   lambda blocks: _sample_grid(blocks, markets, Contract(CL_FEED)))
+
+
+def select(states, start_block, n_points):
+    """First grid row at or after each of np.linspace(start_block, last grid block, n_points)."""
+    blocks = states['blocks']
+    want = np.linspace(start_block, blocks[-1], n_points)
+    idx = np.clip(np.searchsorted(blocks, want), 0, len(blocks) - 1)
+    return np.unique(idx)
+
+
+# ──────────── crvUSD pool panel ────────────
+
+PANEL_POOLS = {
+    'usdc': "0x4DEcE678ceceb27446b35C672dC7d61F30bAD69E",
+    'usdt': "0x390f3595bCa2Df7d23783dFd126427CCeb997BF4",
+    'frxusd': "0x13e12BB0E6A2f1A3d6901a59a9d585e89A6243e1",
+    'pyusd': "0x625E92624Bc2D88619ACCc1788365A69767f6200"
+}
+PANEL_GAUGES = {
+    'usdc': "0x95f00391cB5EebCd190EB58728B4CE23DbFa6ac1",
+    'usdt': "0x4e6bB6B7447B7B2Aa268C16AB87F4Bb48BF57939",
+    'frxusd': "0x22804B0F6bE741a9Fa1BbaEcDD6c8D4116E96944",
+    'pyusd': "0xf69Fb60B79E463384b40dbFDFB633AB5a863C9A2"
+}
+PANEL_START = 23575554
+PANEL_FILE = "crvusd-pools.npz"
+PANEL_SCHEMA = 1
+# per pool: (column, method, args); the gauge balance is balanceOf(gauge)
+POOL_VIEWS = [
+    ('supply', 'totalSupply', ()),
+    ('vp', 'get_virtual_price', ()),
+    ('b0', 'balances', (0,)),
+    ('b1', 'balances', (1,)),
+]
+POOL_COLUMNS = [c for c, *_ in POOL_VIEWS] + ['gauge_balance']
+
+
+def _sample_panel(blocks, pools, gauges):
+    calls = [timestamp_call()]
+    for name, pool in pools.items():
+        calls += [(getattr(pool, method), args) for _, method, args in POOL_VIEWS]
+        calls.append((pool.balanceOf, (gauges[name],)))
+    raw = sample(blocks, calls, label='panel')
+
+    out = {
+        'blocks': np.array(blocks, dtype=np.int64),
+        'ts': np.array([raw[b][0] for b in blocks], dtype=np.int64),
+    }
+    width = len(POOL_COLUMNS)
+    for k, c in enumerate(POOL_COLUMNS):
+        out[c] = np.array([[np.nan if v is None else v for v in raw[b][1 + k::width]] for b in blocks],
+                          dtype=np.float64)
+    return out
+
+
+def pool_panel(path=PANEL_FILE):
+    """
+    The crvUSD pool panel, extended to the current head: dict of 'blocks',
+    'ts' (1-D), 'names' (PANEL_POOLS keys) and POOL_COLUMNS as (blocks, pools)
+    float64 arrays of raw on-chain values.
+    """
+    pools = {name: Contract(addr) for name, addr in PANEL_POOLS.items()}
+    ident = {
+        'names': np.array(list(PANEL_POOLS)),
+        'pools': np.array(list(PANEL_POOLS.values())),
+        'gauges': np.array([PANEL_GAUGES[name] for name in PANEL_POOLS]),
+    }
+    return _extend(path, PANEL_SCHEMA, ident, PANEL_START,
+                   lambda blocks: _sample_panel(blocks, pools, PANEL_GAUGES))
+
+
+def panel_usd(panel, column, names=None):
+    """column * virtual price in millions USD, (blocks, len(names)) for the named pools."""
+    idx = [list(panel['names']).index(name) for name in (names or panel['names'])]
+    return panel[column][:, idx] / 1e18 * panel['vp'][:, idx] / 1e18 / 1e6
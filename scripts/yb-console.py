@@ -1,12 +1,27 @@
+from collections import OrderedDict
 from datetime import datetime
-from brownie import multicall
+import numpy as np
 from brownie import Contract, config
 from brownie import web3
 
+from scripts.sampler import sample
+
 config['autofetch_sources'] = True
 
 FACTORY = "0x370a449FeBb9411c95bf897021377fe0B7D100c0"
-MULTICALL = "0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696"
+CACHE_SIZE = 1_000_000  # cached (market, block, view) values
+
+# view: (contracts, method, args)
+VIEWS = {
+    'liquidity': ('lt', 'liquidity', ()),
+    'supply': ('lt', 'totalSupply', ()),
+    'collateral': ('amm', 'collateral_amount', ()),
+    'debt': ('amm', 'get_debt', ()),
+    'price_scale': ('pool', 'price_scale', ()),
+    'xcp': ('pool', 'xcp_profit', ()),
+    'vp': ('pool', 'get_virtual_price', ()),
+    'staked_redeem': ('gauge', 'previewRedeem', (10**18,)),
+}
 
 
 def main():
@@ -18,39 +33,87 @@ def main():
     cryptopools = [Contract(amm.COLLATERAL()) for amm in amms]
     gauges = [Contract(m[-1]) for m in markets]
     labels = [lt.symbol() for lt in lts]
+    contracts = {'lt': lts, 'amm': amms, 'pool': cryptopools, 'gauge': gauges}
+
+    # LRU of (market, block, view) -> value; misses are read in one batched sample
+    cache = OrderedDict()
+
+    def cached(keys, call_for):
+        keys = list(dict.fromkeys(keys))
+        missing = {}
+        for key in keys:
+            if key in cache:
+                cache.move_to_end(key)
+            else:
+                missing.setdefault(key[1], []).append(key)
+        if missing:
+            calls = {b: [call_for(key) for key in ks] for b, ks in missing.items()}
+            raw = sample(list(missing), lambda b: calls[b], label='console')
+            for b, ks in missing.items():
+                cache.update(zip(ks, raw[b]))
+        out = {key: cache[key] for key in keys}
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+        return out
+
+    def view_call(key):
+        c, method, args = VIEWS[key[2]]
+        return getattr(contracts[c][key[0]], method), args
+
+    def views(idx, names, blocks):
+        """{view: [value per block]} of market idx, None where a call reverted."""
+        values = cached([(idx, b, name) for b in blocks for name in names], view_call)
+        return {name: [values[(idx, b, name)] for b in blocks] for name in names}
+
+    def as_blocks(block, blocks):
+        if blocks is not None:
+            return [int(b) for b in blocks]
+        return [web3.eth.block_number if block is None else int(block)]
+
+    def result(values, blocks):
+        return values if blocks is not None else float(values[0])
+
+    def column(values, i=None):
+        return np.array([np.nan if v is None else (v if i is None else v[i]) for v in values], dtype=np.float64)
+
+    def liquidity_coefficient(idx, block=None, *, blocks=None):
+        bs = as_blocks(block, blocks)
+        liquidity = views(idx, ['liquidity'], bs)['liquidity']
+        admin, total = column(liquidity, 0), column(liquidity, 1)
+        return result(total / (admin + total), blocks)
+
+    def unstaked_pps(idx, block=None, adjusted=False, *, blocks=None):
+        bs = as_blocks(block, blocks)
+        s = views(idx, ['collateral', 'debt', 'liquidity', 'price_scale', 'supply']
+                  + (['xcp', 'vp'] if adjusted else []), bs)
+
+        args = {}
+        for j, b in enumerate(bs):
+            collateral, debt = s['collateral'][j], s['debt'][j]
+            if collateral is None or debt is None:
+                continue
+            if adjusted:
+                collateral = collateral * (10**18 + s['xcp'][j]) // (2 * s['vp'][j])
+            args[b] = (collateral, debt)
+        keys = [(idx, b, f'value_oracle_for/{adjusted}') for b in bs if b in args]
+        values = cached(keys, lambda key: (amms[idx].value_oracle_for, args[key[1]]))
+        value = column([values.get((idx, b, f'value_oracle_for/{adjusted}')) for b in bs], 1)
+
+        value /= column(s['price_scale'])
+        admin, total = column(s['liquidity'], 0), column(s['liquidity'], 1)
+        value *= np.minimum(total / (admin + total), 1.0)
+
+        return result(value / (column(s['supply']) / 1e18), blocks)
+
+    def staked_pps(idx, block=None, adjusted=False, *, blocks=None):
+        bs = as_blocks(block, blocks)
+        staked_ratio = column(views(idx, ['staked_redeem'], bs)['staked_redeem']) / 1e18
+        return result(unstaked_pps(idx, adjusted=adjusted, blocks=bs) * staked_ratio, blocks)
 
-    def liquidity_coefficient(idx, block):
-        liquidity = lts[idx].liquidity(block_identifier=block)
-        return liquidity[1] / (liquidity[0] + liquidity[1])
-
-    def unstaked_pps(idx, block, adjusted=False):
-        pool = cryptopools[idx]
-        amm = amms[idx]
-        lt = lts[idx]
-
-        if not adjusted:
-            adjustment = 1.0
-        else:
-            with multicall(address=MULTICALL, block_identifier=block):
-                xcp = pool.xcp_profit()
-                vp = pool.get_virtual_price()
-            adjustment = (10**18 + xcp) / (2 * vp)
-        with multicall(address=MULTICALL, block_identifier=block):
-            collateral = amm.collateral_amount()
-            debt = amm.get_debt()
-            liquidity = lt.liquidity()
-            ps = pool.price_scale()
-            lt_supply = lt.totalSupply()
-
-        collateral *= adjustment
-        value = amm.value_oracle_for(collateral, debt, block_identifier=block)[1] / ps
-        value *= min(liquidity[1] / (liquidity[0] + liquidity[1]), 1.0)
-
-        return value / (lt_supply / 1e18)
-
-    def staked_pps(idx, block, adjusted=False):
-        staked_ratio = gauges[idx].previewRedeem(10**18, block_identifier=block) / 1e18
-        return unstaked_pps(idx, block, adjusted) * staked_ratio
+    # pre-warm every view of every market at the head
+    head = web3.eth.block_number
+    cached([(idx, head, name) for idx in range(n) for name in VIEWS], view_call)
+    print(f"{n} markets ({', '.join(labels)}), cached at block {head} ({datetime.fromtimestamp(web3.eth.get_block(head).timestamp)})")
 
     import IPython
     IPython.embed()
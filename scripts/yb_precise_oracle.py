@@ -1,12 +1,12 @@
 # Script which tests an oracle to find a lower estimate for LT in YB pool
 import pylab
 
-import math
 from datetime import datetime
 import numpy as np
 from brownie import Contract, config
 from brownie import web3
-from brownie import multicall
+
+from scripts.sampler import sample, timestamp_call
 
 config['autofetch_sources'] = True
 
@@ -14,6 +14,7 @@ config['autofetch_sources'] = True
 FACTORY = "0x370a449FeBb9411c95bf897021377fe0B7D100c0"
 
 N_POINTS = 500
+BLOCK_STEP = None  # e.g. 1 to backtest every block instead of N_POINTS
 
 START_BLOCK = 23784145 + 100
 POOL_ID = 4
@@ -23,35 +24,46 @@ POOL_ID = 4
 
 
 class FXSwapLPOracleSim:
-    """Float simulation of FXSwapLPOracle math (no fixed-point precisions)."""
+    """
+    Float simulation of FXSwapLPOracle math (no fixed-point precisions).
+
+    Vectorized: state, prices, balances and A may be arrays over blocks (one
+    element per block); bisection and Newton run as fixed array passes with a
+    mask of the elements still iterating, so each element gets the same result
+    as a scalar run.
+    """
 
     BISECTION_ITERS = 128
     PRICE_TOL_REL = 1e-6
 
-    def __init__(self, pool):
+    def __init__(self, pool=None, A=None):
+        """`pool` to read state from chain, or just A (pool.A() / 10000) for the math."""
         self.pool = pool
-        self.A = pool.A() / 10000
-        self.decimals0 = 10 ** Contract(pool.coins(0)).decimals()
-        self.decimals1 = 10 ** Contract(pool.coins(1)).decimals()
+        self.A = A
+        if pool is not None:
+            self.A = pool.A() / 10000
+            self.decimals0 = 10 ** Contract(pool.coins(0)).decimals()
+            self.decimals1 = 10 ** Contract(pool.coins(1)).decimals()
 
         self.ema0_oracle = None
         self.ema0_scale = None
 
-    def read_state(self):
-        # Read this first to get it via multicall
-        self._price_oracle = self.pool.price_oracle()
-        self._price_scale = self.pool.price_scale()
-        self._virtual_price = self.pool.get_virtual_price()
-        self._balances_0 = self.pool.balances(0)
-        self._balances_1 = self.pool.balances(1)
-        self._supply = self.pool.totalSupply()
-
-        self._price_oracle /= 1e18
-        self._price_scale /= 1e18
-        self._virtual_price /= 1e18
-        self._balances_0 /= self.decimals0
-        self._balances_1 /= self.decimals1
-        self._supply /= 1e18
+    def state_calls(self):
+        """(ContractCall, args) read per block, in the order load_state takes them."""
+        return [(self.pool.A, ()), (self.pool.price_oracle, ()), (self.pool.price_scale, ()),
+                (self.pool.get_virtual_price, ()), (self.pool.balances, (0,)),
+                (self.pool.balances, (1,)), (self.pool.totalSupply, ())]
+
+    def load_state(self, rows):
+        """Pool state from rows of state_calls() values, one row per block."""
+        A, po, ps, vp, b0, b1, supply = np.array(rows, dtype=np.float64).T
+        self.A = A / 10000
+        self._price_oracle = po / 1e18
+        self._price_scale = ps / 1e18
+        self._virtual_price = vp / 1e18
+        self._balances_0 = b0 / self.decimals0
+        self._balances_1 = b1 / self.decimals1
+        self._supply = supply / 1e18
 
     def get_price(self, method: str):
         match method:
@@ -61,100 +73,104 @@ class FXSwapLPOracleSim:
                 return self.lp_price(self._price_oracle, self._price_scale, [self._balances_0, self._balances_1], self._supply)
 
     @classmethod
-    def actual_portfolio_value(cls, tokens: list, price_oracle: float, total_supply: float):
+    def actual_portfolio_value(cls, tokens: list, price_oracle, total_supply):
         return (tokens[0] + price_oracle * tokens[1]) / total_supply
 
-    def lp_price(self, price_oracle: float, price_scale: float, tokens: list, total_supply: float) -> float:
-        p_scaled = price_oracle / price_scale
+    def lp_price(self, price_oracle, price_scale, tokens: list, total_supply):
+        p_scaled = np.asarray(price_oracle, dtype=np.float64) / price_scale
         balances = self._get_x_y(self.A, p_scaled)
 
-        D = self._get_D(tokens[0], price_scale * tokens[1])
+        D = self._get_D(tokens[0], price_scale * np.asarray(tokens[1], dtype=np.float64))
 
         return (balances[0] + p_scaled * balances[1]) * D / total_supply
 
-    def _get_D(self, x: float, y: float, *, max_iters: int = 255, tol: float = 1e-12) -> float:
+    def _get_D(self, x, y, *, max_iters: int = 255, tol: float = 1e-12):
+        x, y, A = np.broadcast_arrays(np.asarray(x, dtype=np.float64),
+                                      np.asarray(y, dtype=np.float64),
+                                      np.asarray(self.A, dtype=np.float64))
         S = x + y
-        D = S
-        Ann = 4.0 * self.A
+        D = S.copy()
+        Ann = 4.0 * A
+        active = np.ones(D.shape, dtype=bool)
 
         for _ in range(max_iters):
             D_P = D * D / (2.0 * x)
             D_P = D_P * D / (2.0 * y)
             D_next = ((Ann * S + 2.0 * D_P) * D) / ((Ann - 1.0) * D + 3.0 * D_P)
-            if abs(D_next - D) <= tol * max(1.0, D_next):
-                return D_next
-            D = D_next
+            converged = np.abs(D_next - D) <= tol * np.maximum(1.0, D_next)
+            D = np.where(active, D_next, D)
+            active &= ~converged
+            if not active.any():
+                return D[()]
 
-        raise RuntimeError("D didn't converge")
+        raise RuntimeError(f"D didn't converge for {int(active.sum())} points")
 
     @classmethod
-    def _x_from_y(cls, A: float, y: float) -> float:
+    def _x_from_y(cls, A, y):
         b1 = 1.0 + 4.0 * A * (y - 1.0)
         term = 4.0 * A / y
-        rad = math.sqrt(b1 * b1 + term)
-        if rad <= b1:
-            return 0.0
-        return (rad - b1) / (8.0 * A)
+        rad = np.sqrt(b1 * b1 + term)
+        return np.where(rad <= b1, 0.0, (rad - b1) / (8.0 * A))[()]
 
     @classmethod
-    def _p_from_y(cls, A: float, y: float) -> float:
+    def _p_from_y(cls, A, y):
         x = cls._x_from_y(A, y)
-        if x <= 0:
-            return math.inf
 
         term4a = 4.0 * A
-        num = term4a + 1.0 / (4.0 * x * y * y)
-        den = term4a + 1.0 / (4.0 * x * x * y)
-        return num / den
+        with np.errstate(divide='ignore', invalid='ignore'):
+            num = term4a + 1.0 / (4.0 * x * y * y)
+            den = term4a + 1.0 / (4.0 * x * x * y)
+            return np.where(x <= 0, np.inf, num / den)[()]
 
     @classmethod
-    def _y_from_bisection(cls, A: float, p: float) -> float:
-        if p < 1.0:
+    def _y_from_bisection(cls, A, p):
+        A, p = np.broadcast_arrays(np.asarray(A, dtype=np.float64), np.asarray(p, dtype=np.float64))
+        if (p < 1.0).any():
             raise ValueError("p must be >= 1 for bisection branch")
 
-        lo = 1e-12
-        hi = 0.5
+        lo = np.full(p.shape, 1e-12)
+        hi = np.full(p.shape, 0.5)
+        y = np.full(p.shape, np.nan)
+        active = np.ones(p.shape, dtype=bool)
+        tol_abs = np.maximum(p * cls.PRICE_TOL_REL, 1e-15)
 
         for _ in range(cls.BISECTION_ITERS):
             mid = (lo + hi) / 2.0
             pm = cls._p_from_y(A, mid)
-            tol_abs = max(p * cls.PRICE_TOL_REL, 1e-15)
+            above = pm > p
 
-            if pm > p:
-                if pm - p <= tol_abs:
-                    return mid
-                lo = mid
-            else:
-                if p - pm <= tol_abs:
-                    return mid
-                hi = mid
+            hit = active & (np.abs(pm - p) <= tol_abs)
+            y = np.where(hit, mid, y)
+            active &= ~hit
 
-            if hi - lo <= 1e-15:
-                return hi
+            lo = np.where(active & above, mid, lo)
+            hi = np.where(active & ~above, mid, hi)
 
-        raise RuntimeError("Didn't converge")
+            narrow = active & (hi - lo <= 1e-15)
+            y = np.where(narrow, hi, y)
+            active &= ~narrow
+            if not active.any():
+                return y[()]
+
+        raise RuntimeError(f"Didn't converge for {int(active.sum())} points")
 
     @classmethod
-    def _get_x_y(cls, A: float, p: float) -> tuple[float, float]:
-        if p < 1.0:
-            p_inv = 1.0 / p
-            y_inv = cls._y_from_bisection(A, p_inv)
-            x_inv = cls._x_from_y(A, y_inv)
-            return y_inv, x_inv
-
-        y = cls._y_from_bisection(A, p)
+    def _get_x_y(cls, A, p):
+        p = np.asarray(p, dtype=np.float64)
+        inv = p < 1.0
+        p_abs = np.where(inv, 1.0 / p, p)
+
+        y = cls._y_from_bisection(A, p_abs)
         x = cls._x_from_y(A, y)
-        return x, y
+        return np.where(inv, y, x)[()], np.where(inv, x, y)[()]
 
     @classmethod
-    def _portfolio_value(cls, A: float, p: float) -> float:
+    def _portfolio_value(cls, A, p):
         x, y = cls._get_x_y(A, p)
         return x + p * y
 
 
 def main():
-    mc = Contract("0x5BA1e12693Dc8F9c48aAD8770482f4739bEeD696")
-
     factory = Contract(FACTORY)
     market = factory.markets(POOL_ID)
     amm = Contract(market[2])
@@ -163,55 +179,43 @@ def main():
     cryptopool = Contract(amm.COLLATERAL())
 
     current_block = web3.eth.block_number
-    blocks = [int(b) for b in np.linspace(START_BLOCK, current_block, N_POINTS)]
+    if BLOCK_STEP:
+        blocks = list(range(START_BLOCK, current_block + 1, BLOCK_STEP))
+    else:
+        blocks = sorted({int(b) for b in np.linspace(START_BLOCK, current_block, N_POINTS)})
 
     ps_lp_oracle = Contract(amm.PRICE_ORACLE_CONTRACT())
     lp_oracle = FXSwapLPOracleSim(cryptopool)
 
-    times = []
-    portfolio_values = []
-    oracle_values = []
-
-    for b in blocks:
-        with multicall(address=mc.address, block_identifier=b):
-            t = mc.getCurrentBlockTimestamp()
-            lp_oracle.read_state()
-            ps_lp_price = ps_lp_oracle.price()
-            value_oracle = amm.value_oracle()
-            yb_state = amm.get_state()
-            liquidity = lt.liquidity()
-            supply = lt.totalSupply()
-            agg_price = agg.price()
-
-        ps_lp_price /= 1e18
-        value_oracle = value_oracle[1] / 1e18
-        supply /= 1e18
-
-        collateral, debt, x0 = yb_state
-        x0 /= 1e18
-        collateral /= 1e18
-        debt /= 1e18
+    pool_calls = lp_oracle.state_calls()
+    calls = [timestamp_call()] + pool_calls + [
+        (ps_lp_oracle.price, ()), (amm.get_state, ()),
+        (lt.liquidity, ()), (lt.totalSupply, ()), (agg.price, ())]
+    raw = sample(blocks, calls)
+    rows = [raw[b] for b in blocks]
 
-        agg_price /= 1e18
+    n = len(pool_calls)
+    lp_oracle.load_state([r[1:1 + n] for r in rows])
+    ps_lp_price, yb_state, liquidity, supply, agg_price = zip(*[r[1 + n:] for r in rows])
 
-        admin, total, ideal_staked, staked = liquidity
-        f_lp = total / (admin + total)
+    times = [datetime.fromtimestamp(r[0]) for r in rows]
+    ps_lp_price = np.array(ps_lp_price, dtype=np.float64) / 1e18
+    supply = np.array(supply, dtype=np.float64) / 1e18
+    agg_price = np.array(agg_price, dtype=np.float64) / 1e18
 
-        t = datetime.fromtimestamp(t)
-        print(b, t)
-        times.append(t)
+    collateral, debt, x0 = np.array(yb_state, dtype=np.float64).T / 1e18
 
-        lp_price_oracle = lp_oracle.get_price('lp_price')
+    admin, total, ideal_staked, staked = np.array(liquidity, dtype=np.float64).T
+    f_lp = total / (admin + total)
 
-        L = 2
-        yb_oracle_value = x0 * (2 * L / (2*L - 1) * (lp_price_oracle / ps_lp_price)**0.5 - 1)
-        yb_oracle_value *= f_lp / supply / (lp_oracle._price_oracle * agg_price)
+    lp_price_oracle = lp_oracle.get_price('lp_price')
 
-        oracle_values.append(yb_oracle_value)
+    L = 2
+    oracle_values = x0 * (2 * L / (2*L - 1) * (lp_price_oracle / ps_lp_price)**0.5 - 1)
+    oracle_values *= f_lp / supply / (lp_oracle._price_oracle * agg_price)
 
-        redemption_value = lp_oracle.get_price('actual_portfolio_value') * collateral - debt
-        redemption_value *= f_lp / supply / lp_oracle._price_oracle
-        portfolio_values.append(redemption_value)
+    portfolio_values = lp_oracle.get_price('actual_portfolio_value') * collateral - debt
+    portfolio_values *= f_lp / supply / lp_oracle._price_oracle
 
     pylab.plot(times, portfolio_values, c="black", label="Portfolio value")
     pylab.plot(times, oracle_values, c="red", label="LP oralce value")